@@ -0,0 +1,75 @@
+import io
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, Optional, Union
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+ARXIV = '{http://arxiv.org/schemas/atom}'
+
+
+def _text(elem, tag: str, default: str = '') -> str:
+    child = elem.find(tag)
+    return child.text.strip() if child is not None and child.text else default
+
+
+def entry_to_record(entry) -> Dict:
+    """Convert one Atom <entry> element into a paper record."""
+    categories = [c.get('term') for c in entry.findall(f'{ATOM}category') if c.get('term')]
+    primary = entry.find(f'{ARXIV}primary_category')
+    record = {
+        'id': _text(entry, f'{ATOM}id').split('/abs/')[-1],
+        'title': ' '.join(_text(entry, f'{ATOM}title').split()),
+        'authors': [_text(a, f'{ATOM}name') for a in entry.findall(f'{ATOM}author')],
+        'published': _text(entry, f'{ATOM}published'),
+        'updated': _text(entry, f'{ATOM}updated'),
+        'summary': _text(entry, f'{ATOM}summary'),
+        'pdf_link': None,
+        'primary_category': primary.get('term') if primary is not None else (categories[0] if categories else 'cs'),
+        'all_categories': categories,
+        'doi': _text(entry, f'{ARXIV}doi') or None,
+        'comment': _text(entry, f'{ARXIV}comment'),
+        'journal_ref': _text(entry, f'{ARXIV}journal_ref'),
+    }
+    for link in entry.findall(f'{ATOM}link'):
+        if link.get('rel') == 'alternate' and link.get('type') == 'text/html':
+            record['arxiv_url'] = link.get('href')
+        elif link.get('title') == 'pdf':
+            record['pdf_link'] = link.get('href')
+    return record
+
+
+class AtomStream:
+    """
+    Incremental parser for arXiv Atom feeds.
+    Iterating yields one paper record per <entry> as soon as that entry has been read, and
+    clears processed elements, so memory stays flat however many entries a page holds.
+    `source` may be a file-like object (e.g. fetch_arxiv.ResponseStream over a streamed response), bytes or str.
+    `total_results` is set once <opensearch:totalResults> has been seen (before the first entry on arXiv).
+    """
+
+    def __init__(self, source: Union[io.IOBase, bytes, str]):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        self.source = source
+        self.total_results: Optional[int] = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        root = None
+        for event, elem in ET.iterparse(self.source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == f'{OPENSEARCH}totalResults':
+                self.total_results = int(elem.text or 0)
+            elif elem.tag == f'{ATOM}entry':
+                yield entry_to_record(elem)
+                # drop the finished entry (and anything before it) from the tree
+                root.clear()
+
+
+def iter_records(source) -> Iterator[Dict]:
+    """Shorthand for iterating an AtomStream when the total count is not needed."""
+    return iter(AtomStream(source))
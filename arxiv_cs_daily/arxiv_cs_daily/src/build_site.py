@@ -1,10 +1,16 @@
 import os
 import json
+import hashlib
+import tempfile
 import argparse
 from datetime import datetime
 import requests
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from atom_stream import AtomStream
+from template_engine import Markup, Template, escape, join, load_template
+from fetch_arxiv import ARXIV_API_URL, REQUEST_TIMEOUT, ResponseStream, default_limiter, get_session, sync
+from paper_store import DEFAULT_PATH, PaperStore
 
 def create_papers_directory():
     """Create the papers directory if it doesn't exist."""
@@ -12,79 +18,118 @@ def create_papers_directory():
     papers_dir.mkdir(parents=True, exist_ok=True)
     print(f"Created directory: {papers_dir}")
 
-def fetch_daily_papers():
-    """Fetch daily arXiv CS papers."""
+def fetch_daily_papers(start=0, max_results=100, base_url=None):
+    """
+    Open one page of daily arXiv CS papers as a streamed response (body not yet downloaded).
+    Callers hold the politeness limiter until the body has been read.
+    """
     # arXiv API query for computer science papers from the last day
-    base_url = "http://export.arxiv.org/api/query?"
-    query = "search_query=cat:cs*&sortBy=submittedDate&sortOrder=descending&max_results=100"
-    url = base_url + query
+    params = {
+        "search_query": "cat:cs*",
+        "sortBy": "submittedDate",
+        "sortOrder": "descending",
+        "start": start,
+        "max_results": max_results,
+    }
     
     try:
-        response = requests.get(url)
+        response = get_session().get(base_url or ARXIV_API_URL, params=params,
+                                     timeout=REQUEST_TIMEOUT, stream=True)
         response.raise_for_status()
-        return response.text
+        return response
     except requests.RequestException as e:
         print(f"Error fetching papers: {e}")
         return None
 
+def fetch_all_papers(max_results=100, page_size=100, base_url=None, limiter=None):
+    """
+    Page through the feed until max_results papers or an empty page, deduplicated by id.
+    Papers are yielded while each page is still downloading; the limiter is held for
+    each page until its body has been read.
+    """
+    seen = set()
+    for start in range(0, max_results, page_size):
+        count = 0
+        with (limiter or default_limiter):
+            response = fetch_daily_papers(start, min(page_size, max_results - start), base_url)
+            if response is None:
+                break
+            with response:
+                try:
+                    for paper in parse_papers_data(ResponseStream(response)):
+                        count += 1
+                        if paper['id'] not in seen:
+                            seen.add(paper['id'])
+                            yield paper
+                except (requests.RequestException, ET.ParseError) as e:
+                    print(f"Error reading papers: {e}")
+                    break
+        if count == 0:
+            break
+
+def to_site_paper(record):
+    """Convert a parsed arXiv record into the fields used by the site pages."""
+    return {
+        'id': record['id'],
+        'title': record['title'],
+        'authors': record['authors'],
+        'submission_date': record['published'],
+        'abstract': record['summary'],
+        'categories': [c for c in record['all_categories'] if c.startswith('cs.')],
+        'pdf_url': record.get('pdf_link'),
+    }
+
+def load_from_store(store_path, max_results=100):
+    """
+    Sync the local paper store (only the delta since the last run).
+    Returns (its newest papers, the ids of every paper in the store).
+    """
+    with PaperStore(store_path) as store:
+        sync(store)
+        return [to_site_paper(paper) for paper in store.recent(limit=max_results)], store.ids()
+
 def parse_papers_data(raw_data):
-    """Parse raw arXiv data into structured format."""
+    """
+    Parse raw arXiv data (str, bytes or a readable stream) into structured format.
+    Yields one paper per entry as it is parsed instead of building the whole document tree.
+    """
     if not raw_data:
-        return []
-    
-    root = ET.fromstring(raw_data)
-    namespace = {'atom': 'http://www.w3.org/2005/Atom'}
-    
-    papers = []
-    for entry in root.findall('atom:entry', namespace):
-        paper = {}
-        
-        # Extract paper ID
-        id_elem = entry.find('atom:id', namespace)
-        if id_elem is not None:
-            paper['id'] = id_elem.text.split('/')[-1]
-        
-        # Extract title
-        title_elem = entry.find('atom:title', namespace)
-        if title_elem is not None:
-            paper['title'] = title_elem.text.strip()
-        
-        # Extract authors
-        authors = []
-        for author_elem in entry.findall('atom:author', namespace):
-            name_elem = author_elem.find('atom:name', namespace)
-            if name_elem is not None:
-                authors.append(name_elem.text)
-        paper['authors'] = authors
-        
-        # Extract submission date
-        published_elem = entry.find('atom:published', namespace)
-        if published_elem is not None:
-            paper['submission_date'] = published_elem.text
-        
-        # Extract summary/abstract
-        summary_elem = entry.find('atom:summary', namespace)
-        if summary_elem is not None:
-            paper['abstract'] = summary_elem.text.strip()
-        
-        # Extract categories
-        categories = []
-        for category_elem in entry.findall('atom:category', namespace):
-            term = category_elem.get('term')
-            if term and term.startswith('cs.'):
-                categories.append(term)
-        paper['categories'] = categories
-        
-        # Extract PDF link
-        links = entry.findall('atom:link', namespace)
-        for link in links:
-            if link.get('title') == 'pdf':
-                paper['pdf_url'] = link.get('href')
-        
-        if paper.get('id') and paper.get('title'):
-            papers.append(paper)
+        return
     
-    return papers
+    for record in AtomStream(raw_data):
+        if record['id'] and record['title']:
+            yield to_site_paper(record)
+
+# Compiled fragments shared by every build
+NAV_ITEM = Template('    <li><a href="#{{category}}" class="category-link" data-category="{{category}}">{{category}}</a></li>\n')
+PAPER_ITEM = Template(
+    '      <div class="paper-item"{{attrs}}>\n'
+    '        <h3><a href="papers/{{id}}.html">{{title}}</a></h3>\n'
+    '        <div class="paper-meta">\n'
+    '          <span class="submission-time">{{date}}</span>\n'
+    '          <span class="arxiv-tag">[{{tag}}]</span>\n'
+    '        </div>\n'
+    '      </div>\n'
+)
+CATEGORY_SECTION = Template(
+    '  <div id="{{category}}" class="category-section">\n'
+    '    <h2>{{category}}</h2>\n'
+    '    <div class="papers-list">\n'
+    '{{items}}'
+    '    </div>\n'
+    '  </div>\n'
+)
+NO_PAPERS = Markup('      <p class="no-papers">No papers in this category today.</p>\n')
+AUTHOR_ITEM = Template('  <li>{{author}}</li>\n')
+CATEGORY_TAG = Template('  <span class="category-tag">{{category}}</span>\n')
+HTML_CITATION = Template('<div class="citation">\n  {{authors}}. "{{title}}". <i>arXiv preprint</i> {{id}} ({{year}}).\n</div>')
+# Bump when detail page rendering changes so the manifest rewrites existing pages
+DETAIL_RENDER_VERSION = 2
+
+def format_date(submission_date, fmt):
+    if not submission_date:
+        return 'Unknown date'
+    return datetime.fromisoformat(submission_date.replace('Z', '+00:00')).strftime(fmt)
 
 def generate_index_page(papers_by_category):
     """Generate the main index page with categorized navigation."""
@@ -102,102 +147,69 @@ def generate_index_page(papers_by_category):
     cs_categories.sort()
     
     # Generate navigation HTML
-    nav_html = '<nav class="category-nav">\n'
-    nav_html += '  <ul>\n'
-    nav_html += '    <li><a href="#all" class="category-link active" data-category="all">All Papers</a></li>\n'
-    for category in cs_categories:
-        nav_html += f'    <li><a href="#{category}" class="category-link" data-category="{category}">{category}</a></li>\n'
-    nav_html += '  </ul>\n'
-    nav_html += '</nav>\n'
-    
-    # Generate papers HTML
-    papers_html = '<div class="papers-container">\n'
+    nav_html = join([
+        Markup('<nav class="category-nav">\n  <ul>\n'),
+        Markup('    <li><a href="#all" class="category-link active" data-category="all">All Papers</a></li>\n'),
+        *(NAV_ITEM.render(category=category) for category in cs_categories),
+        Markup('  </ul>\n</nav>\n'),
+    ])
     
-    # All papers section
-    papers_html += '  <div id="all" class="category-section active">\n'
-    papers_html += '    <h2>All Papers</h2>\n'
-    papers_html += '    <div class="papers-list">\n'
+    # Escaped title and formatted date are computed once per paper and reused in every section it appears in
+    paper_fields = {}
+    def fields(paper):
+        paper_id = paper.get('id', '')
+        if paper_id not in paper_fields:
+            paper_fields[paper_id] = {
+                'id': escape(paper_id),
+                'title': escape(paper.get('title', 'Untitled')),
+                'date': escape(format_date(paper.get('submission_date', ''), '%Y-%m-%d %H:%M')),
+            }
+        return paper_fields[paper_id]
     
-    all_papers = []
+    all_papers = {}
     for category, papers in papers_by_category.items():
-        all_papers.extend(papers)
+        for paper in papers:
+            all_papers.setdefault(paper.get('id', ''), paper)
     
     # Sort all papers by submission date (newest first)
-    all_papers.sort(key=lambda x: x.get('submission_date', ''), reverse=True)
+    all_papers = sorted(all_papers.values(), key=lambda x: x.get('submission_date', ''), reverse=True)
     
+    # All papers section
+    all_items = []
     for paper in all_papers:
-        paper_id = paper.get('id', '')
-        title = paper.get('title', 'Untitled')
-        submission_date = paper.get('submission_date', '')
         categories = paper.get('categories', [])
-        
-        # Format date
-        if submission_date:
-            date_obj = datetime.fromisoformat(submission_date.replace('Z', '+00:00'))
-            formatted_date = date_obj.strftime('%Y-%m-%d %H:%M')
-        else:
-            formatted_date = 'Unknown date'
-        
-        # Get primary category for display
-        primary_category = categories[0] if categories else 'cs.GEN'
-        
-        papers_html += f'      <div class="paper-item" data-categories="{" ".join(categories)}">\n'
-        papers_html += f'        <h3><a href="papers/{paper_id}.html">{title}</a></h3>\n'
-        papers_html += f'        <div class="paper-meta">\n'
-        papers_html += f'          <span class="submission-time">{formatted_date}</span>\n'
-        papers_html += f'          <span class="arxiv-tag">[{primary_category}]</span>\n'
-        papers_html += f'        </div>\n'
-        papers_html += f'      </div>\n'
-    
-    papers_html += '    </div>\n'
-    papers_html += '  </div>\n'
+        all_items.append(PAPER_ITEM.render(
+            fields(paper),
+            attrs=Markup(f' data-categories="{escape(" ".join(categories))}"'),
+            # Get primary category for display
+            tag=categories[0] if categories else 'cs.GEN',
+        ))
+    sections = [
+        Markup('<div class="papers-container">\n'),
+        Markup('  <div id="all" class="category-section active">\n    <h2>All Papers</h2>\n    <div class="papers-list">\n'),
+        *all_items,
+        Markup('    </div>\n  </div>\n'),
+    ]
     
     # Individual category sections
     for category in cs_categories:
-        papers_html += f'  <div id="{category}" class="category-section">\n'
-        papers_html += f'    <h2>{category}</h2>\n'
-        papers_html += f'    <div class="papers-list">\n'
-        
         category_papers = papers_by_category.get(category, [])
         category_papers.sort(key=lambda x: x.get('submission_date', ''), reverse=True)
-        
-        if not category_papers:
-            papers_html += '      <p class="no-papers">No papers in this category today.</p>\n'
-        else:
-            for paper in category_papers:
-                paper_id = paper.get('id', '')
-                title = paper.get('title', 'Untitled')
-                submission_date = paper.get('submission_date', '')
-                
-                if submission_date:
-                    date_obj = datetime.fromisoformat(submission_date.replace('Z', '+00:00'))
-                    formatted_date = date_obj.strftime('%Y-%m-%d %H:%M')
-                else:
-                    formatted_date = 'Unknown date'
-                
-                papers_html += f'      <div class="paper-item">\n'
-                papers_html += f'        <h3><a href="papers/{paper_id}.html">{title}</a></h3>\n'
-                papers_html += f'        <div class="paper-meta">\n'
-                papers_html += f'          <span class="submission-time">{formatted_date}</span>\n'
-                papers_html += f'          <span class="arxiv-tag">[{category}]</span>\n'
-                papers_html += f'        </div>\n'
-                papers_html += f'      </div>\n'
-        
-        papers_html += '    </div>\n'
-        papers_html += '  </div>\n'
+        items = join(PAPER_ITEM.render(fields(paper), attrs=Markup(''), tag=category)
+                     for paper in category_papers) or NO_PAPERS
+        sections.append(CATEGORY_SECTION.render(category=category, items=items))
     
-    papers_html += '</div>\n'
+    sections.append(Markup('</div>\n'))
+    papers_html = join(sections)
     
-    # Read template and replace placeholders
+    # Read template and fill placeholders
     template_path = Path("project/arxiv_cs_daily/templates/index_template.html")
     if template_path.exists():
-        with open(template_path, 'r') as f:
-            template = f.read()
-        
-        # Replace placeholders
-        html_content = template.replace('{{NAVIGATION}}', nav_html)
-        html_content = html_content.replace('{{PAPERS}}', papers_html)
-        html_content = html_content.replace('{{BUILD_DATE}}', datetime.now().strftime('%Y-%m-%d'))
+        html_content = load_template(template_path).render(
+            NAVIGATION=nav_html,
+            PAPERS=papers_html,
+            BUILD_DATE=datetime.now().strftime('%Y-%m-%d'),
+        )
         
         # Write to output file
         output_path = Path("project/arxiv_cs_daily/index.html")
@@ -210,20 +222,65 @@ def generate_index_page(papers_by_category):
     else:
         print("Error: Index template not found")
 
-def generate_detail_pages(papers):
-    """Generate individual detail pages for each paper."""
+def load_manifest(manifest_path):
+    """Load the detail page manifest ({paper_id: {"hash": ..., "built": ...}})."""
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    """Write the manifest atomically so an interrupted build never leaves it half-written."""
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=manifest_path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp, manifest_path)
+
+def page_hash(paper, template_version):
+    """Hash of everything a detail page is rendered from: the paper fields and the template."""
+    fields = [paper.get(key) for key in ('id', 'title', 'authors', 'submission_date', 'abstract', 'categories', 'pdf_url')]
+    return hashlib.sha256(json.dumps([template_version, fields]).encode('utf-8')).hexdigest()
+
+def generate_detail_pages(papers, rebuild=False, archive_ids=None):
+    """
+    Generate individual detail pages, rewriting only new or changed ones (all of them with `rebuild`).
+    A manifest next to the pages records each page's input hash. Pages of earlier builds are
+    kept, so the site grows into an archive; when `archive_ids` (every id in the paper store)
+    is given, pages whose papers are no longer in it are pruned. The build date shown on a
+    page is the date its content last changed, so unchanged pages keep identical bytes.
+    """
     template_path = Path("project/arxiv_cs_daily/templates/detail_template.html")
     if not template_path.exists():
         print("Error: Detail template not found")
         return
     
-    with open(template_path, 'r') as f:
-        template = f.read()
+    template = load_template(template_path)
     
+    papers_dir = Path("project/arxiv_cs_daily/papers")
+    manifest_path = papers_dir / ".manifest.json"
+    old_manifest = load_manifest(manifest_path)
+    manifest = {}
+    with open(template_path, 'rb') as f:
+        template_version = hashlib.sha256(f.read() + str(DETAIL_RENDER_VERSION).encode()).hexdigest()
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    count = written = 0
     for paper in papers:
         paper_id = paper.get('id')
-        if not paper_id:
+        if not paper_id or paper_id in manifest:
+            continue
+        count += 1
+        
+        output_path = papers_dir / f"{paper_id}.html"
+        digest = page_hash(paper, template_version)
+        previous = old_manifest.get(paper_id)
+        if not rebuild and previous and previous.get('hash') == digest and output_path.exists():
+            manifest[paper_id] = previous
             continue
+        manifest[paper_id] = {'hash': digest, 'built': today}
+        written += 1
         
         # Prepare paper data
         title = paper.get('title', 'Untitled')
@@ -232,66 +289,69 @@ def generate_detail_pages(papers):
         abstract = paper.get('abstract', 'No abstract available.')
         categories = paper.get('categories', [])
         pdf_url = paper.get('pdf_url', '#')
-        
-        # Format date
-        if submission_date:
-            date_obj = datetime.fromisoformat(submission_date.replace('Z', '+00:00'))
-            formatted_date = date_obj.strftime('%Y-%m-%d %H:%M UTC')
-        else:
-            formatted_date = 'Unknown date'
-        
-        # Generate authors HTML
-        authors_html = '<ul class="authors-list">\n'
-        for author in authors:
-            authors_html += f'  <li>{author}</li>\n'
-        authors_html += '</ul>\n'
-        
-        # Generate categories HTML
-        categories_html = '<div class="paper-categories">\n'
-        for category in categories:
-            categories_html += f'  <span class="category-tag">{category}</span>\n'
-        categories_html += '</div>\n'
+        year = submission_date[:4] if submission_date else 'Unknown'
         
         # Generate citation data
         bibtex_citation = f"""@misc{{{paper_id},
   title = {{{title}}},
   author = {{{' and '.join(authors)}}},
-  year = {{{date_obj.year if submission_date else 'Unknown'}}},
+  year = {{{year}}},
   eprint = {{{paper_id}}},
   archivePrefix = {{arXiv}},
   primaryClass = {{{categories[0] if categories else 'cs'}}}
 }}"""
         
-        # Generate HTML citation
-        html_citation = f"""<div class="citation">
-  {', '.join(authors)}. "{title}". <i>arXiv preprint</i> {paper_id} ({date_obj.year if submission_date else 'Unknown'}).
-</div>"""
-        
-        # Replace placeholders in template
-        html_content = template.replace('{{PAPER_TITLE}}', title)
-        html_content = html_content.replace('{{PAPER_ID}}', paper_id)
-        html_content = html_content.replace('{{AUTHORS}}', authors_html)
-        html_content = html_content.replace('{{SUBMISSION_DATE}}', formatted_date)
-        html_content = html_content.replace('{{ABSTRACT}}', abstract)
-        html_content = html_content.replace('{{CATEGORIES}}', categories_html)
-        html_content = html_content.replace('{{PDF_URL}}', pdf_url)
-        html_content = html_content.replace('{{BIBTEX_CITATION}}', bibtex_citation)
-        html_content = html_content.replace('{{HTML_CITATION}}', html_citation)
-        html_content = html_content.replace('{{BUILD_DATE}}', datetime.now().strftime('%Y-%m-%d'))
+        # Render the page in one pass; plain values are escaped, fragments are Markup
+        html_content = template.render(
+            PAPER_TITLE=title,
+            PAPER_ID=paper_id,
+            AUTHORS=join([Markup('<ul class="authors-list">\n'),
+                          *(AUTHOR_ITEM.render(author=author) for author in authors),
+                          Markup('</ul>\n')]),
+            SUBMISSION_DATE=format_date(submission_date, '%Y-%m-%d %H:%M UTC'),
+            ABSTRACT=abstract,
+            CATEGORIES=join([Markup('<div class="paper-categories">\n'),
+                             *(CATEGORY_TAG.render(category=category) for category in categories),
+                             Markup('</div>\n')]),
+            PDF_URL=pdf_url or '#',
+            BIBTEX_CITATION=bibtex_citation,
+            HTML_CITATION=HTML_CITATION.render(authors=', '.join(authors), title=title, id=paper_id, year=year),
+            BUILD_DATE=today,
+        )
         
         # Write detail page
-        output_path = Path(f"project/arxiv_cs_daily/papers/{paper_id}.html")
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
         with open(output_path, 'w') as f:
             f.write(html_content)
     
-    print(f"Generated {len(papers)} detail pages")
+    # Keep pages from earlier builds; prune only those dropped from the archive
+    # (never on an empty build, e.g. a failed fetch)
+    pruned = 0
+    for paper_id, entry in old_manifest.items():
+        if paper_id in manifest:
+            continue
+        if count and archive_ids is not None and paper_id not in archive_ids:
+            try:
+                (papers_dir / f"{paper_id}.html").unlink()
+            except FileNotFoundError:
+                pass
+            pruned += 1
+        else:
+            manifest[paper_id] = entry
+    if written or pruned:
+        save_manifest(manifest_path, manifest)
+    
+    print(f"Generated {count} detail pages ({written} written, {count - written} unchanged, {pruned} pruned)")
 
 def build_site():
     """Main function to build the entire site."""
     parser = argparse.ArgumentParser(description='Build arXiv CS Daily website')
     parser.add_argument('--test', action='store_true', help='Use test data instead of fetching from arXiv')
+    parser.add_argument('--max-results', type=int, default=100, help='Number of papers to fetch from arXiv')
+    parser.add_argument('--rebuild', action='store_true', help='Rewrite every detail page, ignoring the build manifest')
+    parser.add_argument('--store', nargs='?', const=DEFAULT_PATH, default=None,
+                        help=f'SQLite paper store (default {DEFAULT_PATH}); fetch only new or revised papers into it')
     args = parser.parse_args()
     
     print("Building arXiv CS Daily website...")
@@ -323,13 +383,21 @@ def build_site():
                 'pdf_url': 'https://arxiv.org/pdf/2401.67890.pdf'
             }
         ]
+    elif args.store:
+        print(f"Syncing papers into {args.store}...")
+        papers, archive_ids = load_from_store(args.store, args.max_results)
     else:
         print("Fetching papers from arXiv...")
-        raw_data = fetch_daily_papers()
-        if not raw_data:
+        # render detail pages as papers stream in, collecting them for the index
+        papers = []
+        def collect():
+            for paper in fetch_all_papers(args.max_results):
+                papers.append(paper)
+                yield paper
+        generate_detail_pages(collect(), args.rebuild)
+        if not papers:
             print("Failed to fetch papers. Exiting.")
             return
-        papers = parse_papers_data(raw_data)
     
     print(f"Found {len(papers)} papers")
     
@@ -344,7 +412,10 @@ def build_site():
     
     # Generate pages
     generate_index_page(papers_by_category)
-    generate_detail_pages(papers)
+    if args.store:
+        generate_detail_pages(papers, args.rebuild, archive_ids)
+    elif args.test:
+        generate_detail_pages(papers, args.rebuild)
     
     print("Site build completed successfully!")
 
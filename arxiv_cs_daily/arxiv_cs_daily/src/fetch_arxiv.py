@@ -1,9 +1,22 @@
-import feedparser
 import requests
+import io
 import json
+import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Tuple
+from xml.etree.ElementTree import ParseError
+from requests.adapters import HTTPAdapter
+from atom_stream import AtomStream
+
+# arXiv API endpoint; override with ARXIV_API_URL to point at a local stand-in (e.g. in tests)
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+# arXiv asks clients to leave ~3 seconds between requests
+MIN_REQUEST_INTERVAL = float(os.getenv("ARXIV_MIN_INTERVAL", "3.0"))
+REQUEST_TIMEOUT = float(os.getenv("ARXIV_TIMEOUT", "30"))
+PAGE_SIZE = 200
 
 ARXIV_CS_CATEGORIES = [
     "cs.AI", "cs.CL", "cs.CC", "cs.CE", "cs.CG", "cs.GT", "cs.CV",
@@ -14,75 +27,271 @@ ARXIV_CS_CATEGORIES = [
     "cs.SE", "cs.SD", "cs.SC", "cs.SI", "cs.SY"
 ]
 
+class PolitenessLimiter:
+    """
+    Shared limiter for all harvesting threads: at most `max_concurrency` requests in flight
+    and at least `min_interval` seconds between the start of consecutive requests.
+    """
+
+    def __init__(self, min_interval: float = MIN_REQUEST_INTERVAL, max_concurrency: int = 2):
+        self.min_interval = min_interval
+        self._slots = threading.Semaphore(max(1, max_concurrency))
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+
+# Process-wide limiter used whenever a caller does not pass its own
+default_limiter = PolitenessLimiter()
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = 8) -> requests.Session:
+    """One pooled keep-alive session shared by every request in the process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["User-Agent"] = "arxiv-cs-daily/1.0"
+        return _session
+
+
+class ResponseStream(io.RawIOBase):
+    """
+    Readable file over `response.iter_content`, for feeding a streamed body to the parser.
+    Unlike reading `response.raw`, network errors mid-body (read timeouts, dropped connections)
+    surface as `requests.RequestException` subclasses, and content encoding is decoded.
+    """
+
+    def __init__(self, response: requests.Response, chunk_size: int = 64 * 1024):
+        self._chunks = response.iter_content(chunk_size)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def fetch_page(search_query: str, start: int = 0, max_results: int = PAGE_SIZE,
+               base_url: Optional[str] = None, limiter: Optional[PolitenessLimiter] = None,
+               sort_by: str = "submittedDate",
+               validators: Optional[Dict] = None) -> Tuple[Optional[List[Dict]], int, Dict]:
+    """
+    Fetch one page of results, newest first by `sort_by`.
+    With `validators` (etag/last_modified from an earlier response) the request is conditional.
+    Returns (papers, total_results reported by the API, validators of this response);
+    papers is None when the server answered 304 Not Modified.
+    """
+    params = {
+        "search_query": search_query,
+        "sortBy": sort_by,
+        "sortOrder": "descending",
+        "start": start,
+        "max_results": max_results,
+    }
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    # the request stays in flight (and holds its slot) until the streamed body has been read
+    with (limiter or default_limiter):
+        with get_session().get(base_url or ARXIV_API_URL, params=params, headers=headers,
+                               timeout=REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code == 304:
+                return None, 0, dict(validators or {})
+            response.raise_for_status()
+            fresh = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+            # parse entries while the body is still downloading
+            stream = AtomStream(ResponseStream(response))
+            papers = list(stream)
+    return papers, stream.total_results or 0, fresh
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+
+
+def harvest_category(search_query: str, limit: int, since: Optional[datetime] = None,
+                     page_size: int = PAGE_SIZE, base_url: Optional[str] = None,
+                     limiter: Optional[PolitenessLimiter] = None) -> List[Dict]:
+    """
+    Page through one query until `limit` papers, the end of the results, or (when `since` is
+    given) the first page that reaches papers submitted before `since`.
+    """
+    papers: List[Dict] = []
+    start = 0
+    while start < limit:
+        batch, total, _ = fetch_page(search_query, start, min(page_size, limit - start), base_url, limiter)
+        if since is not None:
+            fresh = [p for p in batch if _parse_time(p['published']) >= since]
+            papers.extend(fresh)
+            if len(fresh) < len(batch):
+                break
+        else:
+            papers.extend(batch)
+        start += len(batch)
+        if not batch or start >= total:
+            break
+    return papers
+
+
+def harvest(categories: Optional[Iterable[str]] = None, limit_per_category: int = 2000,
+            since: Optional[datetime] = None, max_workers: int = 4, page_size: int = PAGE_SIZE,
+            base_url: Optional[str] = None, limiter: Optional[PolitenessLimiter] = None) -> List[Dict]:
+    """
+    Harvest several categories concurrently (under one shared politeness limiter) and
+    merge the results, deduplicated by arXiv id. Papers keep the order in which they
+    were first seen; cross-listed papers appear once.
+    """
+    categories = list(categories or ARXIV_CS_CATEGORIES)
+    limiter = limiter or default_limiter
+
+    def work(category: str) -> List[Dict]:
+        try:
+            return harvest_category(f"cat:{category}", limit_per_category, since, page_size, base_url, limiter)
+        except (requests.RequestException, ParseError, ValueError) as e:
+            print(f"Error harvesting {category}: {e}")
+            return []
+
+    merged: Dict[str, Dict] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for batch in pool.map(work, categories):
+            for paper in batch:
+                merged.setdefault(paper['id'], paper)
+    return list(merged.values())
+
+
+def sync_category(search_query: str, state: Dict, limit: int, page_size: int = PAGE_SIZE,
+                  base_url: Optional[str] = None,
+                  limiter: Optional[PolitenessLimiter] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Fetch only what changed for one query since the last sync.
+    Pages are ordered by last update; the first page is requested conditionally, and paging
+    stops at the first entry not newer than the stored high water mark.
+    If `limit` is hit before reaching the mark, the fetched papers are still returned but the
+    old state is kept, so the next sync does not skip the entries beyond the cut-off.
+    Returns (new or revised papers, updated feed state).
+    """
+    high_water = state.get('high_water') or ""
+    papers: List[Dict] = []
+    new_state = dict(state)
+    complete = False
+    start = 0
+    while start < limit:
+        batch, total, validators = fetch_page(search_query, start, min(page_size, limit - start), base_url,
+                                              limiter, sort_by="lastUpdatedDate",
+                                              validators=state if start == 0 else None)
+        if batch is None:
+            return [], state
+        if start == 0:
+            new_state.update(validators)
+        fresh = [p for p in batch if p['updated'] > high_water]
+        papers.extend(fresh)
+        start += len(batch)
+        if len(fresh) < len(batch) or not batch or start >= total:
+            complete = True
+            break
+    if not complete:
+        print(f"Warning: more than {limit} changes for {search_query}; keeping the previous sync point")
+        return papers, state
+    if papers:
+        new_state['high_water'] = max(high_water, max(p['updated'] for p in papers))
+    return papers, new_state
+
+
+def sync(store, categories: Optional[Iterable[str]] = None, limit_per_category: int = 2000,
+         max_workers: int = 4, page_size: int = PAGE_SIZE, base_url: Optional[str] = None,
+         limiter: Optional[PolitenessLimiter] = None) -> Tuple[int, int]:
+    """
+    Incrementally harvest categories into a PaperStore: only the delta since the previous
+    sync is transferred and parsed, and only new or revised papers are written.
+    Returns (new, revised) counts.
+    """
+    categories = list(categories or ARXIV_CS_CATEGORIES)
+    limiter = limiter or default_limiter
+    queries = {category: f"cat:{category}" for category in categories}
+    states = {category: store.feed_state(query) for category, query in queries.items()}
+
+    def work(category: str):
+        try:
+            return sync_category(queries[category], states[category], limit_per_category, page_size,
+                                 base_url, limiter)
+        except (requests.RequestException, ParseError, ValueError) as e:
+            print(f"Error syncing {category}: {e}")
+            return None
+
+    new = revised = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for category, result in zip(categories, pool.map(work, categories)):
+            if result is None:
+                continue
+            papers, state = result
+            added, changed = store.upsert(papers)
+            new += added
+            revised += changed
+            store.set_feed_state(queries[category], state.get('etag'), state.get('last_modified'),
+                                 state.get('high_water'))
+    print(f"Synced {len(categories)} categories: {new} new, {revised} revised")
+    return new, revised
+
+
 def fetch_daily_papers(category: Optional[str] = None, max_results: int = 50) -> List[Dict]:
     """
     Fetch daily arXiv CS papers, optionally filtered by category.
     Returns a list of paper dictionaries.
     """
-    papers = []
-    base_url = "http://export.arxiv.org/api/query?"
-    query = f"search_query=cat:cs.*"
+    query = "cat:cs.*"
     if category and category in ARXIV_CS_CATEGORIES:
-        query = f"search_query=cat:{category}"
-    query += f"&sortBy=submittedDate&sortOrder=descending"
-    query += f"&max_results={max_results}"
-    query += f"&start=0"
-    
+        query = f"cat:{category}"
     try:
-        feed = feedparser.parse(base_url + query)
-        for entry in feed.entries:
-            paper = {
-                'id': entry.id.split('/abs/')[-1],
-                'title': entry.title.replace('\n', ' ').strip(),
-                'authors': [author.name for author in entry.authors],
-                'published': entry.published,
-                'updated': entry.updated,
-                'summary': entry.summary,
-                'pdf_link': entry.link if 'link' in entry else None,
-                'primary_category': entry.tags[0]['term'] if entry.tags else 'cs',
-                'all_categories': [tag['term'] for tag in entry.tags],
-                'doi': entry.doi if 'doi' in entry else None
-            }
-            for link in entry.links:
-                if link.rel == 'alternate' and link.type == 'text/html':
-                    paper['arxiv_url'] = link.href
-                elif link.title == 'pdf':
-                    paper['pdf_link'] = link.href
-            papers.append(paper)
+        return harvest_category(query, max_results)
     except Exception as e:
         print(f"Error fetching papers: {e}")
-    return papers
+        return []
 
 def fetch_paper_details(paper_id: str) -> Optional[Dict]:
     """
     Fetch detailed metadata for a specific arXiv paper by its ID.
     """
-    query_url = f"http://export.arxiv.org/api/query?id_list={paper_id}"
     try:
-        feed = feedparser.parse(query_url)
-        if len(feed.entries) == 0:
+        response = get_session().get(ARXIV_API_URL, params={"id_list": paper_id}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        paper = next(iter(AtomStream(response.content)), None)
+        if paper is None:
             return None
-        entry = feed.entries[0]
-        paper = {
+        paper.update({
             'id': paper_id,
-            'title': entry.title.replace('\n', ' ').strip(),
-            'authors': [author.name for author in entry.authors],
-            'published': entry.published,
-            'updated': entry.updated,
-            'summary': entry.summary,
-            'pdf_link': entry.link if 'link' in entry else None,
-            'primary_category': entry.tags[0]['term'] if entry.tags else 'cs',
-            'all_categories': [tag['term'] for tag in entry.tags],
-            'doi': entry.doi if 'doi' in entry else None,
-            'comment': entry.get('arxiv_comment', ''),
-            'journal_ref': entry.get('arxiv_journal_ref', ''),
             'affiliations': []
-        }
-        for link in entry.links:
-            if link.rel == 'alternate' and link.type == 'text/html':
-                paper['arxiv_url'] = link.href
-            elif link.title == 'pdf':
-                paper['pdf_link'] = link.href
+        })
         return paper
     except Exception as e:
         print(f"Error fetching paper details: {e}")
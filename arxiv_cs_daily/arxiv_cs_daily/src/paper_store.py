@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Default database location: next to the scripts, independent of the working directory
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "papers.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    updated TEXT NOT NULL,
+    published TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_published ON papers (published);
+CREATE TABLE IF NOT EXISTS feeds (
+    query TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    high_water TEXT,
+    fetched_at REAL
+);
+"""
+
+
+class PaperStore:
+    """
+    Local SQLite store of harvested papers, keyed by arXiv id.
+    Each paper keeps its `updated` timestamp so only new or revised entries are written;
+    each feed query keeps its ETag/Last-Modified and the newest `updated` seen (high water),
+    so the next harvest can send a conditional request and stop at already-known entries.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    def upsert(self, papers: Iterable[Dict]) -> Tuple[int, int]:
+        """
+        Insert new papers and replace those whose `updated` is newer than the stored copy.
+        Returns (new, revised) counts; unchanged papers are not rewritten.
+        """
+        new = revised = 0
+        with self.conn:
+            for paper in papers:
+                row = self.conn.execute("SELECT updated FROM papers WHERE id = ?", (paper['id'],)).fetchone()
+                if row is not None and row[0] >= paper['updated']:
+                    continue
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO papers (id, updated, published, data) VALUES (?, ?, ?, ?)",
+                    (paper['id'], paper['updated'], paper['published'], json.dumps(paper)),
+                )
+                if row is None:
+                    new += 1
+                else:
+                    revised += 1
+        return new, revised
+
+    def get(self, paper_id: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT data FROM papers WHERE id = ?", (paper_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent(self, limit: Optional[int] = None, since: Optional[str] = None) -> List[Dict]:
+        """Papers newest first, optionally only those published at or after `since` (ISO timestamp)."""
+        sql = "SELECT data FROM papers"
+        args: list = []
+        if since:
+            sql += " WHERE published >= ?"
+            args.append(since)
+        sql += " ORDER BY published DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [json.loads(row[0]) for row in self.conn.execute(sql, args)]
+
+    def ids(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT id FROM papers")}
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def feed_state(self, query: str) -> Dict[str, Optional[str]]:
+        """Validators and high water mark recorded for a feed query (empty values when never fetched)."""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, high_water FROM feeds WHERE query = ?", (query,)
+        ).fetchone()
+        etag, last_modified, high_water = row or (None, None, None)
+        return {'etag': etag, 'last_modified': last_modified, 'high_water': high_water}
+
+    def set_feed_state(self, query: str, etag: Optional[str], last_modified: Optional[str],
+                       high_water: Optional[str]):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO feeds (query, etag, last_modified, high_water, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (query, etag, last_modified, high_water, time.time()),
+            )
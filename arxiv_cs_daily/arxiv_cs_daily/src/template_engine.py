@@ -0,0 +1,62 @@
+import html
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# captures the slot as written and its name
+_SLOT = re.compile(r'(\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\})')
+
+
+class Markup(str):
+    """A string that is already safe HTML and is inserted without escaping."""
+
+
+def escape(value) -> Markup:
+    """HTML-escape a value unless it is already Markup."""
+    if isinstance(value, Markup):
+        return value
+    return Markup(html.escape(str(value), quote=True))
+
+
+def join(fragments: Iterable) -> Markup:
+    """Concatenate fragments into one Markup string, escaping any that are not Markup."""
+    return Markup(''.join(escape(f) for f in fragments))
+
+
+class Template:
+    """
+    A template compiled once into literal segments and {{NAME}} slots.
+    render() fills the slots and builds the page with a single join; values are
+    HTML-escaped unless they are Markup. Slots without a value are left as written.
+    """
+
+    def __init__(self, text: str):
+        parts = _SLOT.split(text)
+        self.literals: List[str] = parts[0::3]
+        self.raw_slots: List[str] = parts[1::3]
+        self.slots: List[str] = parts[2::3]
+
+    def render(self, context: Optional[Dict] = None, **values) -> Markup:
+        if context:
+            values = {**context, **values}
+        out = [''] * (len(self.literals) + len(self.slots))
+        out[0::2] = self.literals
+        for i, name in enumerate(self.slots):
+            out[2 * i + 1] = escape(values[name]) if name in values else self.raw_slots[i]
+        return Markup(''.join(out))
+
+
+_cache: Dict[str, Tuple[int, Template]] = {}
+
+
+def load_template(path) -> Template:
+    """Compile a template file, reusing the compiled form until the file changes."""
+    path = Path(path)
+    mtime = path.stat().st_mtime_ns
+    cached = _cache.get(str(path))
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        template = Template(f.read())
+    _cache[str(path)] = (mtime, template)
+    return template
@@ -0,0 +1,99 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import build_site  # noqa: E402
+
+TEMPLATE = '<h1>{{PAPER_TITLE}}</h1>\n<p>{{ABSTRACT}}</p>\n{{AUTHORS}}<footer>{{BUILD_DATE}}</footer>\n'
+# an mtime well in the past, so a rewrite is visible whatever the filesystem's timestamp resolution
+OLD_MTIME = 1_000_000_000
+
+
+def make_paper(paper_id, title='A Paper'):
+    return {'id': paper_id, 'title': title, 'authors': ['A. Author'], 'submission_date': '2024-01-01T00:00:00Z',
+            'abstract': 'Abstract', 'categories': ['cs.AI'], 'pdf_url': f'http://arxiv.org/pdf/{paper_id}'}
+
+
+class DetailPagesTest(unittest.TestCase):
+    """generate_detail_pages runs against a temporary working directory laid out like the project."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        template = Path('project/arxiv_cs_daily/templates/detail_template.html')
+        template.parent.mkdir(parents=True)
+        template.write_text(TEMPLATE)
+        self.papers_dir = Path('project/arxiv_cs_daily/papers')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def build(self, papers, rebuild=False, archive_ids=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_site.generate_detail_pages(papers, rebuild, archive_ids)
+
+    def page(self, paper_id):
+        return self.papers_dir / f'{paper_id}.html'
+
+    def age(self, *paper_ids):
+        for paper_id in paper_ids:
+            os.utime(self.page(paper_id), ns=(OLD_MTIME * 10**9, OLD_MTIME * 10**9))
+
+    def manifest(self):
+        return json.loads((self.papers_dir / '.manifest.json').read_text())
+
+    def test_unchanged_page_is_not_rewritten(self):
+        self.build([make_paper('2401.00001')])
+        before = self.page('2401.00001').read_bytes()
+        self.age('2401.00001')
+        self.build([make_paper('2401.00001')])
+        self.assertEqual(self.page('2401.00001').stat().st_mtime_ns, OLD_MTIME * 10**9)
+        self.assertEqual(self.page('2401.00001').read_bytes(), before)
+
+    def test_changed_title_rewrites_page(self):
+        self.build([make_paper('2401.00001'), make_paper('2401.00002')])
+        self.age('2401.00001', '2401.00002')
+        self.build([make_paper('2401.00001', title='A Revised Paper'), make_paper('2401.00002')])
+        self.assertNotEqual(self.page('2401.00001').stat().st_mtime_ns, OLD_MTIME * 10**9)
+        self.assertIn('A Revised Paper', self.page('2401.00001').read_text())
+        self.assertEqual(self.page('2401.00002').stat().st_mtime_ns, OLD_MTIME * 10**9)
+
+    def test_rebuild_rewrites_every_page(self):
+        papers = [make_paper('2401.00001'), make_paper('2401.00002')]
+        self.build(papers)
+        self.age('2401.00001', '2401.00002')
+        self.build(papers, rebuild=True)
+        for paper_id in ('2401.00001', '2401.00002'):
+            self.assertNotEqual(self.page(paper_id).stat().st_mtime_ns, OLD_MTIME * 10**9)
+
+    def test_pages_of_earlier_builds_are_kept_without_archive_ids(self):
+        self.build([make_paper('2401.00001'), make_paper('2401.00002')])
+        self.build([make_paper('2401.00001')])
+        self.assertTrue(self.page('2401.00002').exists())
+        self.assertIn('2401.00002', self.manifest())
+
+    def test_prunes_only_ids_missing_from_archive(self):
+        self.build([make_paper('2401.00001'), make_paper('2401.00002'), make_paper('2401.00003')])
+        self.build([make_paper('2401.00001')], archive_ids={'2401.00001', '2401.00002'})
+        self.assertTrue(self.page('2401.00002').exists())
+        self.assertFalse(self.page('2401.00003').exists())
+        self.assertEqual(set(self.manifest()), {'2401.00001', '2401.00002'})
+
+    def test_empty_build_never_prunes(self):
+        self.build([make_paper('2401.00001')])
+        self.build([], archive_ids=set())
+        self.assertTrue(self.page('2401.00001').exists())
+        self.assertIn('2401.00001', self.manifest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import build_site  # noqa: E402
+import fetch_arxiv  # noqa: E402
+from paper_store import PaperStore  # noqa: E402
+
+FEED_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" '
+    'xmlns:arxiv="http://arxiv.org/schemas/atom">\n'
+    '<opensearch:totalResults>{total}</opensearch:totalResults>\n'
+)
+
+
+def make_entry(paper_id, category, updated='2024-01-02T00:00:00Z'):
+    return {'id': paper_id, 'category': category, 'updated': updated, 'published': '2024-01-01T00:00:00Z'}
+
+
+def render_entry(entry):
+    return (
+        '<entry>'
+        f'<id>http://arxiv.org/abs/{escape(entry["id"])}</id>'
+        f'<updated>{entry["updated"]}</updated><published>{entry["published"]}</published>'
+        f'<title>Paper {escape(entry["id"])}</title><summary>Abstract</summary>'
+        '<author><name>A. Author</name></author>'
+        f'<link title="pdf" href="http://arxiv.org/pdf/{escape(entry["id"])}" rel="related"/>'
+        f'<arxiv:primary_category term="{entry["category"]}"/><category term="{entry["category"]}"/>'
+        '</entry>\n'
+    )
+
+
+class StandIn:
+    """
+    Local stand-in for the arXiv query API: serves `feeds[query]` with start/max_results paging.
+    Queries listed in `etags` send that ETag and answer 304 to a matching If-None-Match.
+    """
+
+    def __init__(self, feeds, truncate=(), etags=None):
+        self.feeds = feeds
+        self.truncate = set(truncate)
+        self.etags = dict(etags or {})
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                stand_in.requests.append(params)
+                etag = stand_in.etags.get(params.get('search_query'))
+                if etag and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                entries = stand_in.feeds.get(params.get('search_query'), [])
+                start, count = int(params.get('start', 0)), int(params.get('max_results', 10))
+                body = FEED_HEAD.format(total=len(entries))
+                body += ''.join(render_entry(e) for e in entries[start:start + count]) + '</feed>\n'
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/atom+xml')
+                self.send_header('Content-Length', str(len(data)))
+                if etag:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                if params.get('search_query') in stand_in.truncate:
+                    # drop the connection half way through the body
+                    data = data[:len(data) // 2]
+                    self.close_connection = True
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/query'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HarvestTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandIn({
+            'cat:cs.AI': [make_entry(f'2401.0000{i}', 'cs.AI') for i in range(5)],
+            'cat:cs.LG': [make_entry('2401.00003', 'cs.LG'), make_entry('2401.00004', 'cs.LG'),
+                          make_entry('2401.00009', 'cs.LG')],
+        })
+        self.limiter = fetch_arxiv.PolitenessLimiter(min_interval=0, max_concurrency=2)
+
+    def tearDown(self):
+        self.stand_in.close()
+
+    def test_pages_through_results(self):
+        papers = fetch_arxiv.harvest_category('cat:cs.AI', limit=100, page_size=2,
+                                              base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual([p['id'] for p in papers], [f'2401.0000{i}' for i in range(5)])
+        self.assertEqual([int(r['start']) for r in self.stand_in.requests], [0, 2, 4])
+
+    def test_stops_at_limit(self):
+        papers = fetch_arxiv.harvest_category('cat:cs.AI', limit=3, page_size=2,
+                                              base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual(len(papers), 3)
+        self.assertEqual([int(r['max_results']) for r in self.stand_in.requests], [2, 1])
+
+    def test_dedupes_across_categories(self):
+        papers = fetch_arxiv.harvest(['cs.AI', 'cs.LG'], page_size=2, base_url=self.stand_in.url,
+                                     limiter=self.limiter)
+        ids = [p['id'] for p in papers]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {f'2401.0000{i}' for i in range(5)} | {'2401.00009'})
+
+    def test_dropped_connection_fails_only_that_category(self):
+        self.stand_in.truncate.add('cat:cs.LG')
+        papers = fetch_arxiv.harvest(['cs.AI', 'cs.LG'], page_size=10, base_url=self.stand_in.url,
+                                     limiter=self.limiter)
+        self.assertEqual({p['id'] for p in papers}, {f'2401.0000{i}' for i in range(5)})
+
+
+class RecordingLimiter(fetch_arxiv.PolitenessLimiter):
+    """Limiter that records whether response bodies were read while a slot was held."""
+
+    def __init__(self):
+        super().__init__(min_interval=0, max_concurrency=1)
+        self.held = False
+        self.reads_outside = 0
+
+    def __enter__(self):
+        super().__enter__()
+        self.held = True
+        return self
+
+    def __exit__(self, *exc):
+        self.held = False
+        return super().__exit__(*exc)
+
+    def watch(self):
+        limiter, readinto = self, fetch_arxiv.ResponseStream.readinto
+
+        def watched(stream, b):
+            if not limiter.held:
+                limiter.reads_outside += 1
+            return readinto(stream, b)
+        return mock.patch.object(fetch_arxiv.ResponseStream, 'readinto', watched)
+
+
+class LimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandIn({
+            'cat:cs.AI': [make_entry(f'2401.0000{i}', 'cs.AI') for i in range(5)],
+            'cat:cs*': [make_entry(f'2401.0000{i}', 'cs.AI') for i in range(5)],
+        })
+        self.limiter = RecordingLimiter()
+
+    def tearDown(self):
+        self.stand_in.close()
+
+    def test_fetch_page_reads_body_inside_limiter(self):
+        with self.limiter.watch():
+            papers = fetch_arxiv.harvest_category('cat:cs.AI', limit=100, page_size=2,
+                                                  base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual(len(papers), 5)
+        self.assertEqual(self.limiter.reads_outside, 0)
+
+    def test_build_site_reads_body_inside_limiter(self):
+        with self.limiter.watch():
+            papers = list(build_site.fetch_all_papers(max_results=4, page_size=2, base_url=self.stand_in.url,
+                                                      limiter=self.limiter))
+        self.assertEqual(len(papers), 4)
+        self.assertEqual(self.limiter.reads_outside, 0)
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        # newest update first, as arXiv returns them for sortBy=lastUpdatedDate
+        self.stand_in = StandIn({
+            'cat:cs.AI': [make_entry(f'2401.0000{i}', 'cs.AI', f'2024-01-0{9 - i}T00:00:00Z') for i in range(5)],
+        })
+        self.limiter = fetch_arxiv.PolitenessLimiter(min_interval=0)
+
+    def tearDown(self):
+        self.stand_in.close()
+
+    def test_keeps_sync_point_when_truncated(self):
+        state = {'etag': None, 'last_modified': None, 'high_water': '2024-01-04T00:00:00Z'}
+        papers, new_state = fetch_arxiv.sync_category('cat:cs.AI', state, limit=2, page_size=2,
+                                                      base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual(len(papers), 2)
+        self.assertEqual(new_state, state)
+
+    def test_advances_sync_point_after_reaching_it(self):
+        state = {'etag': None, 'last_modified': None, 'high_water': '2024-01-06T00:00:00Z'}
+        papers, new_state = fetch_arxiv.sync_category('cat:cs.AI', state, limit=100, page_size=2,
+                                                      base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual([p['id'] for p in papers], ['2401.00000', '2401.00001', '2401.00002'])
+        self.assertEqual(new_state['high_water'], '2024-01-09T00:00:00Z')
+
+    def test_not_modified_keeps_state(self):
+        self.stand_in.etags['cat:cs.AI'] = '"v1"'
+        state = {'etag': '"v1"', 'last_modified': None, 'high_water': '2024-01-09T00:00:00Z'}
+        papers, new_state = fetch_arxiv.sync_category('cat:cs.AI', state, limit=100, page_size=2,
+                                                      base_url=self.stand_in.url, limiter=self.limiter)
+        self.assertEqual((papers, new_state), ([], state))
+        self.assertEqual(len(self.stand_in.requests), 1)
+
+    def test_sync_persists_validators_and_high_water(self):
+        self.stand_in.etags['cat:cs.AI'] = '"v1"'
+        with PaperStore(':memory:') as store:
+            self.assertEqual(fetch_arxiv.sync(store, ['cs.AI'], page_size=2, base_url=self.stand_in.url,
+                                              limiter=self.limiter), (5, 0))
+            self.assertEqual(store.feed_state('cat:cs.AI'),
+                             {'etag': '"v1"', 'last_modified': None, 'high_water': '2024-01-09T00:00:00Z'})
+            self.assertEqual(store.count(), 5)
+            # the next sync sends the stored ETag and transfers nothing
+            requests_before = len(self.stand_in.requests)
+            self.assertEqual(fetch_arxiv.sync(store, ['cs.AI'], page_size=2, base_url=self.stand_in.url,
+                                              limiter=self.limiter), (0, 0))
+            self.assertEqual(len(self.stand_in.requests), requests_before + 1)
+            self.assertEqual(store.feed_state('cat:cs.AI')['high_water'], '2024-01-09T00:00:00Z')
+
+
+class PaperStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = PaperStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_upsert_counts_new_and_revised(self):
+        first = [make_entry('2401.00001', 'cs.AI'), make_entry('2401.00002', 'cs.AI')]
+        self.assertEqual(self.store.upsert(first), (2, 0))
+        revised = dict(make_entry('2401.00002', 'cs.AI', '2024-01-05T00:00:00Z'), title='Revised')
+        self.assertEqual(self.store.upsert([make_entry('2401.00001', 'cs.AI'), revised]), (0, 1))
+        self.assertEqual(self.store.get('2401.00002')['title'], 'Revised')
+
+    def test_upsert_skips_unchanged_and_older(self):
+        self.store.upsert([dict(make_entry('2401.00001', 'cs.AI', '2024-01-05T00:00:00Z'), title='Current')])
+        stale = dict(make_entry('2401.00001', 'cs.AI', '2024-01-03T00:00:00Z'), title='Stale')
+        same = dict(make_entry('2401.00001', 'cs.AI', '2024-01-05T00:00:00Z'), title='Same')
+        self.assertEqual(self.store.upsert([stale, same]), (0, 0))
+        self.assertEqual(self.store.get('2401.00001')['title'], 'Current')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from template_engine import Markup, Template, escape, join, load_template  # noqa: E402
+
+
+class TemplateTest(unittest.TestCase):
+    def test_slots_allow_surrounding_whitespace(self):
+        template = Template('<h1>{{ TITLE }}</h1><p>{{BODY}}</p><i>{{  TITLE\t}}</i>')
+        self.assertEqual(template.slots, ['TITLE', 'BODY', 'TITLE'])
+        self.assertEqual(template.render(TITLE='T', BODY='B'), '<h1>T</h1><p>B</p><i>T</i>')
+
+    def test_unknown_slot_is_left_as_written(self):
+        template = Template('{{ KNOWN }} {{ UNKNOWN }} {{OTHER}}')
+        self.assertEqual(template.render(KNOWN='x'), 'x {{ UNKNOWN }} {{OTHER}}')
+
+    def test_context_and_keywords_are_merged(self):
+        template = Template('{{A}}{{B}}')
+        self.assertEqual(template.render({'A': 1, 'B': 2}, B=3), '13')
+
+    def test_values_are_escaped_unless_markup(self):
+        template = Template('{{TEXT}}|{{HTML}}')
+        rendered = template.render(TEXT='<b>&amp;</b>', HTML=Markup('<b>ok</b>'))
+        self.assertEqual(rendered, '&lt;b&gt;&amp;amp;&lt;/b&gt;|<b>ok</b>')
+        self.assertIsInstance(rendered, Markup)
+
+
+class EscapeTest(unittest.TestCase):
+    def test_escape_is_not_applied_twice(self):
+        once = escape('<a href="x">&</a>')
+        self.assertEqual(once, '&lt;a href=&quot;x&quot;&gt;&amp;&lt;/a&gt;')
+        self.assertIsInstance(once, Markup)
+        self.assertEqual(escape(once), once)
+        self.assertEqual(Template('{{V}}').render(V=once), once)
+
+    def test_join_escapes_only_plain_fragments(self):
+        self.assertEqual(join(['<', Markup('<br>'), 1]), '&lt;<br>1')
+        self.assertIsInstance(join(['a']), Markup)
+
+    def test_empty_join_is_falsy(self):
+        # generate_index_page relies on `join(...) or NO_PAPERS` for empty categories
+        fallback = Markup('<p>none</p>')
+        self.assertFalse(join([]))
+        self.assertIs(join([]) or fallback, fallback)
+
+
+class LoadTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'page.html'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, text, mtime):
+        self.path.write_text(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_reuses_compiled_template_until_mtime_changes(self):
+        self.write('v1 {{X}}', 1_000_000_000)
+        first = load_template(self.path)
+        self.assertIs(load_template(self.path), first)
+        self.write('v2 {{X}}', 1_000_000_100)
+        second = load_template(self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.render(X='x'), 'v2 x')
+
+
+if __name__ == '__main__':
+    unittest.main()
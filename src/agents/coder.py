@@ -2,9 +2,13 @@ from __future__ import annotations
 import re
 from typing import List, Dict, Any
 from .protocols import CoderOutput, CodeChange, CommandSpec
-from ..core.llm import client
+from . import editor
+from ..core import llm
+from ..utils.code_utils import FenceStripper, parse_multi_file
+from ..utils.prompt_utils import fit_budget
 from ..core.logger import info, warn
-from ..core.config import runtime
+from ..core.metrics import tagged
+from ..core import config
 from ..tools import fs, shell
 
 SYSTEM = (
@@ -12,6 +16,11 @@ SYSTEM = (
     "Output ONLY the raw code for the file. Do not include any explanation, comments, or markdown fences (e.g., ```html)."
 )
 
+SYSTEM_EDIT = (
+    "You are a Code Generation Agent. You update an existing file based on a task description "
+    "by returning precise edits instead of the whole file."
+)
+
 PROMPT_TMPL = (
     "Project Goal:\n{goal}\n\n"
     "Your task is to generate the full content for the file: `{file_path}`.\n\n"
@@ -21,6 +30,40 @@ PROMPT_TMPL = (
     "Now, generate the complete and updated code for the file `{file_path}`."
 )
 
+EDIT_PROMPT_TMPL = (
+    "Project Goal:\n{goal}\n\n"
+    "Your task is to update the existing file: `{file_path}`.\n\n"
+    "Task Description:\n{task_desc}\n\n"
+    "{mode_instruction}\n\n"
+    "Current file content:\n---\n{current_content}\n---\n\n"
+    "Now, return the edit blocks that turn the current file into the complete implementation of `{file_path}`."
+)
+
+SYSTEM_MULTI = (
+    "You are a Code Generation Agent. You generate pure code for several files of one task in a single answer. "
+    "For every requested file output a block that starts with a line `=== FILE: <path> ===`, followed by the raw code, "
+    "followed by a line `=== END FILE ===`. Output nothing outside these blocks and no markdown fences."
+)
+
+# 并发模式下各文件请求共享同一前缀（system + 目标 + 任务描述），便于服务端前缀缓存命中
+SHARED_PREFIX_TMPL = (
+    "Project Goal:\n{goal}\n\n"
+    "Task Description:\n{task_desc}\n\n"
+    "{mode_instruction}\n\n"
+)
+
+FILE_SUFFIX_TMPL = (
+    "Your task is to generate the full content for the file: `{file_path}`.\n\n"
+    "Current file content (if any):\n---\n{current_content}\n---\n\n"
+    "Now, generate the complete and updated code for the file `{file_path}`."
+)
+
+MULTI_SUFFIX_TMPL = (
+    "Generate the full content for each of these files: {file_list}.\n\n"
+    "{current_files}"
+    "Now, output one `=== FILE: <path> ===` ... `=== END FILE ===` block per file, using the paths exactly as listed."
+)
+
 _RE_FILE_PATH = re.compile(r"`?([\w\./\-_]+(?:\.py|\.html|\.css|\.js|\.json))`?", re.IGNORECASE)
 
 def _extract_path_from_desc(desc: str) -> str | None:
@@ -33,6 +76,17 @@ def _extract_path_from_desc(desc: str) -> str | None:
         return match.group(1)
     return None
 
+def _mode_instruction(mode: str) -> str:
+    if mode == "skeleton":
+        return "IMPORTANT: Generate a minimal, runnable skeleton version of the file, NOT the full content. For Python, just import statements and empty functions/classes. For HTML, just the basic structure with placeholders."
+    if mode == "full":
+        return "IMPORTANT: Generate the complete and final implementation based on the task description and the existing skeleton."
+    return ""
+
+def _full_path(file_path: str) -> str:
+    prefix = f"{config.get_runtime().output_dir}/"
+    return file_path if file_path.startswith(prefix) else prefix + file_path
+
 def apply_coder_output(out: CoderOutput) -> None:
     for ch in out.changes:
         if ch.content is None:
@@ -40,7 +94,7 @@ def apply_coder_output(out: CoderOutput) -> None:
             continue
         
         path_norm = ch.path.replace("\\", "/").lstrip("/")
-        prefix = f"{runtime.output_dir}/"
+        prefix = f"{config.get_runtime().output_dir}/"
         if not path_norm.startswith(prefix):
             path_norm = prefix + path_norm
         
@@ -49,35 +103,73 @@ def apply_coder_output(out: CoderOutput) -> None:
     for cmd in out.commands:
         shell.run(cmd.cmd, cwd=cmd.cwd)
 
-def implement(goal: str, task_desc: str, mode: str = "full", file_path: str | None = None) -> CoderOutput:
+def _stream_to_file(full_path: str, msg: str) -> str:
+    """流式接收完成内容：边去围栏边写入临时文件，结束后原子替换目标文件。"""
+    stripper = FenceStripper()
+    parts: List[str] = []
+    with fs.atomic_writer(full_path) as f:
+        for chunk in llm.get_client().stream_text(msg, system=SYSTEM):
+            piece = stripper.feed(chunk)
+            if piece:
+                f.write(piece)
+                f.flush()
+                parts.append(piece)
+        piece = stripper.finish()
+        f.write(piece)
+        parts.append(piece)
+    return "".join(parts)
+
+def implement(goal: str, task_desc: str, mode: str = "full", file_path: str | None = None,
+              stream: bool | None = None) -> CoderOutput:
+    with tagged(agent="coder", mode=mode):
+        return _implement(goal, task_desc, mode, file_path, stream)
+
+def _implement(goal: str, task_desc: str, mode: str, file_path: str | None, stream: bool | None) -> CoderOutput:
     if file_path is None:
         file_path = _extract_path_from_desc(task_desc)
     if not file_path:
         warn(f"Could not extract file path from task description: {task_desc}")
         return CoderOutput()
 
-    prefix = f"{runtime.output_dir}/"
-    full_path = file_path
-    if not full_path.startswith(prefix):
-        full_path = prefix + full_path
+    full_path = _full_path(file_path)
 
     current_content = fs.read_file(full_path) or ""
 
-    mode_instruction = ""
-    if mode == "skeleton":
-        mode_instruction = "IMPORTANT: Generate a minimal, runnable skeleton version of the file, NOT the full content. For Python, just import statements and empty functions/classes. For HTML, just the basic structure with placeholders."
-    elif mode == "full":
-        mode_instruction = "IMPORTANT: Generate the complete and final implementation based on the task description and the existing skeleton."
+    goal_text = fit_budget(goal, config.get_llm_config().prompt_budget // 4)
+    mode_instruction = _mode_instruction(mode)
 
     msg = PROMPT_TMPL.format(
-        goal=goal, 
+        goal=goal_text, 
         task_desc=task_desc, 
         file_path=file_path,
         current_content=current_content,
         mode_instruction=mode_instruction
     )
     
-    generated_code = client.simple_text(msg, system=SYSTEM)
+    if mode == "full" and config.get_runtime().edit_mode == "patch" and current_content.strip():
+        edit_msg = EDIT_PROMPT_TMPL.format(
+            goal=goal_text,
+            task_desc=task_desc,
+            file_path=file_path,
+            current_content=current_content,
+            mode_instruction=mode_instruction
+        )
+        edited = editor.request_edit(full_path, current_content, edit_msg, SYSTEM_EDIT)
+        if edited is not None:
+            out = CoderOutput(changes=[CodeChange(path=file_path, content=edited, overwrite=True)], commands=[])
+            apply_coder_output(out)
+            info(f"Coder applied edits to: {file_path}")
+            return out
+        warn(f"Edit mode failed for {file_path}, regenerating the whole file.")
+
+    use_stream = config.get_llm_config().stream if stream is None else stream
+    if use_stream:
+        generated_code = _stream_to_file(full_path, msg)
+        out = CoderOutput(changes=[CodeChange(path=file_path, content=generated_code, overwrite=True)], commands=[])
+        info(f"Coder streamed changes to: {file_path}")
+        return out
+
+    generated_code = llm.get_client().simple_text(msg, system=SYSTEM)
     
     # The LLM is now supposed to return pure code, so we don't parse JSON.
     # We manually construct the CoderOutput.
@@ -87,3 +179,52 @@ def implement(goal: str, task_desc: str, mode: str = "full", file_path: str | No
     apply_coder_output(out)
     info(f"Coder applied changes to: {file_path}")
     return out
+
+def implement_many(goal: str, task_desc: str, file_paths: List[str], mode: str = "full",
+                   batch_mode: str | None = None) -> CoderOutput:
+    """
+    一个任务涉及多个目标文件时批量生成：
+    - single: 一次请求返回所有文件（分隔格式），本地解析；缺失的文件逐个补生成
+    - concurrent: 每个文件一个请求，共享相同前缀并发发送
+    - off: 与逐文件调用 implement 相同
+    批量路径不使用编辑块与流式写入。
+    """
+    batch_mode = (batch_mode or config.get_runtime().batch_mode).lower()
+    if batch_mode not in ("single", "concurrent") or len(file_paths) < 2:
+        out = CoderOutput()
+        for fp in file_paths:
+            out.changes.extend(implement(goal, f"Update `{fp}`.\n\n{task_desc}", mode=mode, file_path=fp).changes)
+        return out
+
+    with tagged(agent="coder", mode=mode, batch=batch_mode):
+        prefix = SHARED_PREFIX_TMPL.format(
+            goal=fit_budget(goal, config.get_llm_config().prompt_budget // 4),
+            task_desc=task_desc,
+            mode_instruction=_mode_instruction(mode),
+        )
+        contents = {fp: fs.read_file(_full_path(fp)) or "" for fp in file_paths}
+        if batch_mode == "concurrent":
+            prompts = [prefix + FILE_SUFFIX_TMPL.format(file_path=fp, current_content=contents[fp]) for fp in file_paths]
+            generated = dict(zip(file_paths, llm.get_client().simple_text_many(prompts, system=SYSTEM)))
+        else:
+            current_files = "".join(
+                f"Current content of `{fp}` (if any):\n---\n{contents[fp]}\n---\n\n" for fp in file_paths
+            )
+            msg = prefix + MULTI_SUFFIX_TMPL.format(
+                file_list=", ".join(f"`{fp}`" for fp in file_paths), current_files=current_files
+            )
+            parsed = parse_multi_file(llm.get_client().simple_text(msg, system=SYSTEM_MULTI))
+            generated = {fp: parsed[fp] for fp in file_paths if fp in parsed}
+
+    out = CoderOutput(changes=[
+        CodeChange(path=fp, content=generated[fp], overwrite=True)
+        for fp in file_paths if generated.get(fp, "").strip()
+    ])
+    apply_coder_output(out)
+    info(f"Coder applied batched changes to: {[ch.path for ch in out.changes]}")
+
+    missing = [fp for fp in file_paths if not generated.get(fp, "").strip()]
+    for fp in missing:
+        warn(f"Batched generation returned nothing for {fp}, generating it separately.")
+        out.changes.extend(implement(goal, f"Update `{fp}`.\n\n{task_desc}", mode=mode, file_path=fp).changes)
+    return out
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from ..core import llm
+from ..core.logger import info, warn
+from ..utils.code_utils import parse_edit_blocks, apply_edit_blocks, validate_source, strip_fences
+
+EDIT_FORMAT = (
+    "Return ONLY search/replace edit blocks, no explanation and no markdown fences. Each block has the form:\n"
+    "<<<<<<< SEARCH\n"
+    "<exact lines copied from the current file>\n"
+    "=======\n"
+    "<replacement lines>\n"
+    ">>>>>>> REPLACE\n"
+    "The SEARCH part must match the current file exactly (including indentation) and be unique in the file. "
+    "Keep each SEARCH as small as possible while still unique. Use several blocks for several separate changes."
+)
+
+
+def request_edit(path: str, current_content: str, prompt: str, system: str,
+                 temperature: float | None = None, use_cache: bool = True) -> str | None:
+    """
+    以 search/replace 编辑块模式请求修改，并在本地应用与校验。
+    成功返回修改后的完整内容；模型未给出可用编辑块、编辑块无法应用或结果未通过语法校验时返回 None，
+    由调用方回退到整文件重写。修复请求应传 use_cache=False。
+    """
+    response = llm.get_client().simple_text(prompt, system=f"{system}\n\n{EDIT_FORMAT}", temperature=temperature,
+                                            use_cache=use_cache)
+    try:
+        blocks = parse_edit_blocks(strip_fences(response))
+    except ValueError as e:
+        warn(f"编辑块解析失败（{path}）：{e}")
+        return None
+    if not blocks:
+        warn(f"模型未返回编辑块（{path}），回退整文件生成。")
+        return None
+    try:
+        new_content = apply_edit_blocks(current_content, blocks)
+    except ValueError as e:
+        warn(f"编辑块应用失败（{path}）：{e}")
+        return None
+    err = validate_source(path, new_content)
+    if err:
+        warn(f"编辑后校验失败（{path}）：{err}")
+        return None
+    info(f"已应用 {len(blocks)} 个编辑块：{path}")
+    return new_content
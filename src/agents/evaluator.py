@@ -3,7 +3,7 @@ from typing import List
 from pathlib import Path
 from .protocols import EvalIssue, EvalResult
 from ..core.logger import info, warn
-from ..core.config import runtime
+from ..core import config
 
 
 class BaseAcceptance:
@@ -12,7 +12,10 @@ class BaseAcceptance:
 
 
 class ArxivDailyAcceptance(BaseAcceptance):
-    base = Path(runtime.workspace_root) / runtime.output_dir / "arxiv_cs_daily"
+    @property
+    def base(self) -> Path:
+        runtime = config.get_runtime()
+        return Path(runtime.workspace_root) / runtime.output_dir / "arxiv_cs_daily"
 
     def evaluate(self, goal: str) -> EvalResult:
         issues: List[EvalIssue] = []
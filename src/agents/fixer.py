@@ -1,11 +1,13 @@
 from __future__ import annotations
-from pathlib import Path
 from typing import Optional
 
 from .protocols import CodeChange, CoderOutput
-from ..core.llm import client
+from . import editor
+from ..core import llm
 from ..core.logger import info, warn
-from ..core.config import runtime
+from ..core.metrics import tagged
+from ..core import config
+from ..utils.prompt_utils import compact_fix_inputs
 from ..tools import fs
 
 SYSTEM = (
@@ -25,6 +27,22 @@ PROMPT_TMPL = (
     "Now, generate the complete and corrected code for the file `{path}`."
 )
 
+SYSTEM_EDIT = (
+    "You are a Code Fixer Agent. You will be given a file path, its current content, and the exact error logs. "
+    "Analyze the error and fix it with the smallest possible edits. "
+    "For an ImportError, check if the function/class name is misspelled and correct it. "
+    "If the error is 'Assertion failed' or indicates the script ran without doing anything, you MUST add a main execution block (e.g., `if __name__ == '__main__': main()`) to call the core functions."
+)
+
+EDIT_PROMPT_TMPL = (
+    "Project Goal:\n{goal}\n\n"
+    "Your task is to fix the file `{path}` to be valid and runnable.\n\n"
+    "Current content of `{path}` (`# ... [lines a-b omitted] ...` markers stand for unchanged lines that are not shown; "
+    "never put them in a SEARCH block):\n---\n{content}\n---\n\n"
+    "Error logs to fix:\n{error}\n\n"
+    "Now, return the edit blocks that fix `{path}`."
+)
+
 def apply_fixer_output(out: CoderOutput) -> None:
     # Simplified apply logic, as Fixer now only produces one change.
     if not out.changes:
@@ -37,18 +55,48 @@ def apply_fixer_output(out: CoderOutput) -> None:
         return
 
     path_norm = ch.path.replace("\\", "/").lstrip("/")
-    prefix = f"{runtime.output_dir}/"
+    prefix = f"{config.get_runtime().output_dir}/"
     if not path_norm.startswith(prefix):
         path_norm = prefix + path_norm
     
     fs.write_file(path_norm, ch.content, overwrite=True)
 
 def fix_file(goal: str, path: str, error_message: str, minimal_fix: bool = False) -> bool:
-    p = Path(runtime.workspace_root) / path
-    try:
-        current_content = p.read_text(encoding="utf-8") if p.exists() else ""
-    except Exception:
-        current_content = ""
+    with tagged(agent="fixer", mode="fix"):
+        fixed_code = propose_fix(goal, path, error_message, minimal_fix)
+    if fixed_code is None:
+        return False
+
+    # Manually construct the CoderOutput, ensuring no JSON parsing is needed.
+    change = CodeChange(path=path, content=fixed_code, overwrite=True)
+    out = CoderOutput(changes=[change], commands=[])
+
+    apply_fixer_output(out)
+    info(f"Fixer applied changes to: {path}")
+    return True
+
+def propose_fix(goal: str, path: str, error_message: str, minimal_fix: bool = False,
+                temperature: float | None = None) -> Optional[str]:
+    """
+    生成修复后的完整文件内容但不写入，失败时返回 None。
+    供 fix_file 使用，也供推测式修复并发生成多个候选。
+    """
+    current_content = fs.read_file(path) or ""
+
+    use_edit = config.get_runtime().edit_mode == "patch" and not minimal_fix and bool(current_content.strip())
+    # 编辑块模式可以只发送相关片段；整文件重写必须看到完整内容
+    goal_text, content_view, error_log = compact_fix_inputs(
+        goal, path, current_content, error_message, config.get_llm_config().prompt_budget,
+        max_log_lines=config.get_llm_config().error_log_max_lines, allow_excerpt=use_edit,
+    )
+
+    if use_edit:
+        edit_prompt = EDIT_PROMPT_TMPL.format(goal=goal_text, path=path, content=content_view, error=error_log)
+        edited = editor.request_edit(path, current_content, edit_prompt, SYSTEM_EDIT, temperature=temperature,
+                                     use_cache=False)
+        if edited is not None:
+            return edited
+        warn(f"Edit mode failed for {path}, falling back to full regeneration.")
 
     fix_instruction = (
         "IMPORTANT: The file is too long and causes issues. Return a minimal, runnable skeleton version of the file, NOT the full content. "
@@ -58,23 +106,17 @@ def fix_file(goal: str, path: str, error_message: str, minimal_fix: bool = False
     )
 
     prompt = PROMPT_TMPL.format(
-        goal=goal, 
+        goal=goal_text, 
         path=path, 
         content=current_content, 
-        error=error_message, 
+        error=error_log, 
         fix_instruction=fix_instruction
     )
     
-    fixed_code = client.simple_text(prompt, system=SYSTEM)
+    # 修复请求不读缓存：同样的文件与错误输出若命中缓存，会在每一轮、每次运行中重放同一个失败的修复
+    fixed_code = llm.get_client().simple_text(prompt, system=SYSTEM, temperature=temperature, use_cache=False)
 
     if not fixed_code or fixed_code.isspace():
         warn(f"Fixer returned empty content for {path}. Skipping.")
-        return False
-
-    # Manually construct the CoderOutput, ensuring no JSON parsing is needed.
-    change = CodeChange(path=path, content=fixed_code, overwrite=True)
-    out = CoderOutput(changes=[change], commands=[])
-    
-    apply_fixer_output(out)
-    info(f"Fixer applied changes to: {path}")
-    return True
+        return None
+    return fixed_code
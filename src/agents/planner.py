@@ -1,10 +1,15 @@
 from __future__ import annotations
+import atexit
+import threading
+import contextvars
 from typing import List, Dict, Any
 from .protocols import Plan, TaskItem
-from ..core.llm import client
-from ..core.config import runtime
+from ..core import llm
+from ..core import config
 from ..utils.json_utils import extract_json
 from ..core.logger import info, warn
+from ..core.metrics import tagged
+from ..core.plan_store import PlanStore
 
 SYSTEM = (
   "你是Project Planning Agent。你接收一个软件开发高层目标，输出严格JSON，键为 tasks: TaskItem[]。"
@@ -32,19 +37,129 @@ PROMPT_TMPL = (
 )
 
 
-def create_plan(goal: str) -> Plan:
-    prefix = f"{runtime.output_dir}/"
+RETRY_TMPL = (
+    "{prompt}\n\n"
+    "上一次的输出无法使用：{problem}\n"
+    "请修正后重新输出，仅返回JSON。"
+)
+
+
+def validate_plan(tasks: List[TaskItem], prefix: str) -> List[str]:
+    """检查计划是否可执行：非空、id 唯一、依赖可解析、target_files 均位于 prefix 下。返回问题列表。"""
+    if not tasks:
+        return ["计划为空"]
+    problems: List[str] = []
+    ids = [t.id for t in tasks]
+    dup = sorted({i for i in ids if ids.count(i) > 1})
+    if dup:
+        problems.append(f"任务 id 重复: {dup}")
+    known = set(ids)
+    for t in tasks:
+        missing = [d for d in t.deps if d not in known or d == t.id]
+        if missing:
+            problems.append(f"任务 {t.id} 的依赖无法解析: {missing}")
+        for fp in t.target_files:
+            norm = fp.replace("\\", "/")
+            while norm.startswith("./"):
+                norm = norm[2:]
+            if not norm.startswith(prefix) or ".." in norm.split("/"):
+                problems.append(f"任务 {t.id} 的目标文件不在 {prefix} 下: {fp}")
+    return problems
+
+
+def _parse_plan(data: str, prefix: str) -> Plan:
+    obj = extract_json(data)
+    tasks = [TaskItem(**t) for t in obj.get("tasks", [])]
+    problems = validate_plan(tasks, prefix)
+    if problems:
+        raise ValueError("；".join(problems))
+    return Plan(tasks=tasks)
+
+
+def _request_plan(goal: str, prefix: str, fresh: bool = False) -> Plan | None:
+    """调用 LLM 规划；输出无法解析或未通过校验时带着问题说明重试，全部失败返回 None。"""
     msg = PROMPT_TMPL.format(goal=goal, prefix=prefix)
-    data = client.simple_text(msg, system=SYSTEM)
+    prompt = msg
+    for attempt in range(1 + max(0, config.get_runtime().plan_retries)):
+        with tagged(agent="planner", mode="plan"):
+            data = llm.get_client().simple_text(prompt, system=SYSTEM, use_cache=not fresh and attempt == 0)
+        try:
+            return _parse_plan(data, prefix)
+        except Exception as e:
+            warn(f"规划结果不可用（第 {attempt + 1} 次）：{e}")
+            prompt = RETRY_TMPL.format(prompt=msg, problem=str(e)[:500])
+    return None
+
+
+def _load_cached(tasks: List[Dict[str, Any]] | None, prefix: str) -> Plan | None:
+    if not tasks:
+        return None
     try:
-        obj = extract_json(data)
-        tasks = [TaskItem(**t) for t in obj.get("tasks", [])]
-        info(f"规划生成 {len(tasks)} 个任务")
-        return Plan(tasks=tasks)
-    except Exception as e:
-        warn(f"规划解析失败，回退默认计划: {e}")
-        fallback = Plan(tasks=[
-            TaskItem(id="init", desc="创建项目目录 project/ 与 README 占位", deps=[]),
-        ])
-        return fallback
+        plan = Plan(tasks=[TaskItem(**t) for t in tasks])
+    except Exception:
+        return None
+    return plan if not validate_plan(plan.tasks, prefix) else None
+
+
+_revalidations: List[threading.Thread] = []
+
+
+def _join_revalidations() -> None:
+    # 守护线程会在进程退出时被直接终止：退出前最多等待 PLAN_REVALIDATE_WAIT 秒让其完成
+    pending = [t for t in _revalidations if t.is_alive()]
+    if not pending or config.get_runtime().plan_revalidate_wait <= 0:
+        return
+    info("等待后台重新规划完成...")
+    for t in pending:
+        t.join(timeout=config.get_runtime().plan_revalidate_wait)
+        if t.is_alive():
+            warn("后台重新规划未在时限内完成，本次不更新计划缓存")
+
+
+def _revalidate(store: PlanStore, key: str, goal: str, prefix: str) -> None:
+    def work() -> None:
+        plan = _request_plan(goal, prefix, fresh=True)
+        if plan is not None:
+            store.put(key, goal, config.get_runtime().output_dir, [t.model_dump() for t in plan.tasks])
+            info("后台重新规划完成，已更新计划缓存（下次运行生效）")
+
+    if not _revalidations:
+        atexit.register(_join_revalidations)
+    t = threading.Thread(target=contextvars.copy_context().run, args=(work,), name="plan-revalidate", daemon=True)
+    _revalidations.append(t)
+    t.start()
+
+
+def create_plan(goal: str) -> Plan:
+    runtime = config.get_runtime()
+    prefix = f"{runtime.output_dir}/"
+    store = PlanStore() if runtime.plan_cache else None
+    key = PlanStore.key(goal, runtime.output_dir)
+
+    if store is not None:
+        cached = _load_cached(store.get(key), prefix)
+        if cached is not None:
+            info(f"复用已缓存的计划（{len(cached.tasks)} 个任务）")
+            if runtime.plan_revalidate:
+                _revalidate(store, key, goal, prefix)
+            return cached
+
+    plan = _request_plan(goal, prefix)
+    if plan is not None:
+        info(f"规划生成 {len(plan.tasks)} 个任务")
+        if store is not None:
+            store.put(key, goal, runtime.output_dir, [t.model_dump() for t in plan.tasks])
+        return plan
 
+    # 规划失败：同一目标的计划已在上面尝试过；其它目标的计划只在显式开启 PLAN_REUSE_LATEST 时复用
+    reused = None
+    if store is not None and runtime.plan_reuse_latest:
+        reused = _load_cached(store.latest(runtime.output_dir), prefix)
+    if reused is not None:
+        warn(f"规划失败，按 PLAN_REUSE_LATEST 复用同一输出目录下最近一次的计划（{len(reused.tasks)} 个任务，可能属于其它目标）")
+        return reused
+    warn("规划失败，回退默认计划")
+    fallback = Plan(tasks=[
+        TaskItem(id="init", desc="创建项目目录 project/ 与 README 占位", deps=[]),
+    ])
+    return fallback
@@ -44,6 +44,13 @@ class EvalResult(BaseModel):
     suggestions: str = ""
 
 
+class TestResult(BaseModel):
+    command: str
+    success: bool
+    output: str = ""
+    duration_s: float = 0.0
+
+
 class OrchestratorState(BaseModel):
     goal: str
     plan: Optional[Plan] = None
@@ -1,61 +1,163 @@
 from __future__ import annotations
-from typing import Tuple
-import py_compile
+import time
+import uuid
+import shutil
+import threading
+import multiprocessing as mp
+from abc import ABC, abstractmethod
+from concurrent.futures import (
+    BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout,
+)
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
+from pydantic import BaseModel, ConfigDict
 
-from ..tools import shell
-from ..core.config import runtime
+from .protocols import TestResult
+from ..tools import fs, shell
+from ..core import config
+from ..core.metrics import recorder
 
 
-def run_test(test_command: str) -> Tuple[bool, str]:
-    """
-    Runs a test command and returns a tuple of (success, output).
-    Supports special command prefixes like 'py_compile:', 'run_and_assert:', 'run_and_assert_file:', and 'assert_contains:'.
-    """
-    if not test_command:
+class Check(BaseModel, ABC):
+    """解析后的测试命令。frozen 使其可哈希，便于作为结果缓存的键；子类必须实现 run。"""
+    model_config = ConfigDict(frozen=True)
+
+    @property
+    def target(self) -> Optional[str]:
+        """该检查针对的文件（工作区相对路径）；与具体文件无关时为 None。"""
+        return None
+
+    def signature(self) -> Optional[Tuple]:
+        """决定结果的文件状态；返回 None 表示结果不可缓存（如需执行命令）。"""
+        return None
+
+    def retarget(self, path: str) -> Optional["Check"]:
+        """返回改为检查 path 的同类检查；结果依赖于文件所在位置（如执行脚本）时返回 None。"""
+        return None
+
+    @abstractmethod
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        """执行检查，返回 (是否通过, 输出)。"""
+
+
+def _resolve(path_str: str) -> Path:
+    return Path(config.get_runtime().workspace_root) / path_str
+
+
+class NoopCheck(Check):
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
         return True, "No test command provided."
 
-    # Syntax check via py_compile
-    if test_command.startswith("py_compile:"):
-        file_path_str = test_command.replace("py_compile:", "").strip()
-        file_path = Path(runtime.workspace_root) / file_path_str
-        if not file_path.exists():
+
+class InvalidCheck(Check):
+    message: str
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        return False, self.message
+
+
+class PyCompileCheck(Check):
+    path: str
+
+    @property
+    def target(self) -> Optional[str]:
+        return self.path
+
+    def retarget(self, path: str) -> Optional[Check]:
+        return self.model_copy(update={"path": path})
+
+    def signature(self) -> Optional[Tuple]:
+        return fs.signature(self.path)
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        file_path = _resolve(self.path)
+        if not fs.exists(self.path):
             return False, f"Compilation failed: File not found at {file_path}"
+        # 在内存中编译，不写 .pyc
         try:
-            py_compile.compile(str(file_path), doraise=True)
+            source = fs.read_file(self.path) or ""
+            compile(source, str(file_path), "exec", dont_inherit=True)
             return True, f"Compilation successful for {file_path}"
-        except py_compile.PyCompileError as e:
+        except SyntaxError as e:
             error_details = f"Syntax Error: {e.msg}"
-            if hasattr(e, 'lineno') and e.lineno:
+            if e.lineno:
                 error_details += f" on line {e.lineno}"
-            if hasattr(e, 'text') and e.text:
+            if e.text:
                 error_details += f"\n> {e.text.strip()}"
             return False, error_details
         except Exception as e:
             return False, f"Unknown compilation error: {e}"
 
-    # Run command and assert that stdout contains a specific string
-    if test_command.startswith("run_and_assert:"):
-        parts = test_command.replace("run_and_assert:", "").split(":", 1)
-        if len(parts) != 2:
-            return False, "Invalid format for run_and_assert."
-        command, expected_string = parts
-        return_code, stdout, stderr = shell.run(command)
+
+class AssertContainsCheck(Check):
+    path: str
+    expected: str
+
+    @property
+    def target(self) -> Optional[str]:
+        return self.path
+
+    def retarget(self, path: str) -> Optional[Check]:
+        return self.model_copy(update={"path": path})
+
+    def signature(self) -> Optional[Tuple]:
+        return fs.signature(self.path)
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        file_path = _resolve(self.path)
+        if not fs.exists(self.path):
+            return False, f"Assertion failed: File not found at {file_path}"
+        try:
+            content = fs.read_file(self.path) or ""
+            if self.expected not in content:
+                return False, f"Assertion failed: Expected string '{self.expected}' not found in {file_path}."
+            return True, f"Assertion passed! Found '{self.expected}' in {file_path}."
+        except Exception as e:
+            return False, f"Failed to read file {file_path}: {e}"
+
+
+class AssertExistsCheck(Check):
+    path: str
+
+    @property
+    def target(self) -> Optional[str]:
+        return self.path
+
+    def retarget(self, path: str) -> Optional[Check]:
+        return self.model_copy(update={"path": path})
+
+    def signature(self) -> Optional[Tuple]:
+        return (str(_resolve(self.path)), fs.exists(self.path))
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        p = _resolve(self.path)
+        if fs.exists(self.path):
+            return True, f"Assertion passed! Path exists: {p}"
+        return False, f"Assertion failed: Expected path not found: {p}"
+
+
+class RunAndAssertCheck(Check):
+    command: str
+    expected: str
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        return_code, stdout, stderr = shell.run(self.command, timeout=timeout)
         output = f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
         if return_code != 0:
             return False, f"Command failed with exit code {return_code}.\n{output}"
-        if expected_string not in stdout:
-            return False, f"Assertion failed: Expected string '{expected_string}' not found in stdout.\n{output}"
-        return True, f"Assertion passed! Found '{expected_string}' in stdout."
+        if self.expected not in stdout:
+            return False, f"Assertion failed: Expected string '{self.expected}' not found in stdout.\n{output}"
+        return True, f"Assertion passed! Found '{self.expected}' in stdout."
 
-    # Run command and assert that a file or directory is created
-    if test_command.startswith("run_and_assert_file:"):
-        parts = test_command.replace("run_and_assert_file:", "").split(":", 1)
-        if len(parts) != 2:
-            return False, "Invalid format for run_and_assert_file."
-        command, expected_path_str = parts
-        expected_path = Path(runtime.workspace_root) / expected_path_str
-        return_code, stdout, stderr = shell.run(command)
+
+class RunAndAssertFileCheck(Check):
+    command: str
+    expected_path: str
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        expected_path = _resolve(self.expected_path)
+        return_code, stdout, stderr = shell.run(self.command, timeout=timeout)
         output = f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
         if return_code != 0:
             return False, f"Command failed with exit code {return_code}.\n{output}"
@@ -63,34 +165,201 @@ def run_test(test_command: str) -> Tuple[bool, str]:
             return False, f"Assertion failed: Expected file or directory '{expected_path}' was not created.\n{output}"
         return True, f"Assertion passed! Found created file/directory at '{expected_path}'."
 
-    # Assert that a file contains a specific string
+
+class ShellCheck(Check):
+    command: str
+
+    def run(self, timeout: int = 180) -> Tuple[bool, str]:
+        return_code, stdout, stderr = shell.run(self.command, timeout=timeout)
+        output = f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
+        return return_code == 0, output
+
+
+@lru_cache(maxsize=512)
+def parse_test_command(test_command: str) -> Check:
+    """
+    将测试命令字符串解析为检查对象（同一字符串只解析一次）。
+    支持 'py_compile:', 'run_and_assert:', 'run_and_assert_file:', 'assert_contains:', 'assert_exists:'，
+    其它命令直接交给 shell 执行。
+    """
+    if not test_command:
+        return NoopCheck()
+
+    if test_command.startswith("py_compile:"):
+        return PyCompileCheck(path=test_command.replace("py_compile:", "").strip())
+
+    if test_command.startswith("run_and_assert:"):
+        parts = test_command.replace("run_and_assert:", "").split(":", 1)
+        if len(parts) != 2:
+            return InvalidCheck(message="Invalid format for run_and_assert.")
+        return RunAndAssertCheck(command=parts[0], expected=parts[1])
+
+    if test_command.startswith("run_and_assert_file:"):
+        parts = test_command.replace("run_and_assert_file:", "").split(":", 1)
+        if len(parts) != 2:
+            return InvalidCheck(message="Invalid format for run_and_assert_file.")
+        return RunAndAssertFileCheck(command=parts[0], expected_path=parts[1])
+
     if test_command.startswith("assert_contains:"):
         parts = test_command.replace("assert_contains:", "").split(":", 1)
         if len(parts) != 2:
-            return False, "Invalid format for assert_contains."
-        file_path_str, expected_string = parts
-        file_path = Path(runtime.workspace_root) / file_path_str
-        if not file_path.exists():
-            return False, f"Assertion failed: File not found at {file_path}"
-        try:
-            content = file_path.read_text(encoding="utf-8")
-            if expected_string not in content:
-                return False, f"Assertion failed: Expected string '{expected_string}' not found in {file_path}."
-            return True, f"Assertion passed! Found '{expected_string}' in {file_path}."
-        except Exception as e:
-            return False, f"Failed to read file {file_path}: {e}"
-    
-    # Assert that a file or directory exists
+            return InvalidCheck(message="Invalid format for assert_contains.")
+        return AssertContainsCheck(path=parts[0], expected=parts[1])
+
     if test_command.startswith("assert_exists:"):
-        path_str = test_command.replace("assert_exists:", "").strip()
-        p = Path(runtime.workspace_root) / path_str
-    if p.exists():
-        return True, f"Assertion passed! Path exists: {p}"
-    return False, f"Assertion failed: Expected path not found: {p}"
-
-
-    # For all other commands, just run them via the shell
-    return_code, stdout, stderr = shell.run(test_command)
-    success = return_code == 0
-    output = f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
-    return success, output
+        return AssertExistsCheck(path=test_command.replace("assert_exists:", "").strip())
+
+    return ShellCheck(command=test_command)
+
+
+_results: Dict[Check, Tuple[Tuple, Tuple[bool, str]]] = {}
+_results_lock = threading.Lock()
+
+
+def _cached(check: Check, sig: Optional[Tuple]) -> Optional[Tuple[bool, str]]:
+    if sig is None:
+        return None
+    with _results_lock:
+        hit = _results.get(check)
+    return hit[1] if hit is not None and hit[0] == sig else None
+
+
+def _remember(check: Check, sig: Optional[Tuple], result: Tuple[bool, str]) -> None:
+    if sig is not None:
+        with _results_lock:
+            _results[check] = (sig, result)
+
+
+def run_check(check: Check, timeout: int = 180) -> Tuple[bool, str]:
+    """执行检查；仅依赖文件状态的检查按文件 mtime/大小缓存结果，文件未变化时直接返回上次结果。"""
+    sig = check.signature()
+    result = _cached(check, sig)
+    if result is None:
+        started = time.perf_counter()
+        result = check.run(timeout=timeout)
+        recorder.record("test", check=type(check).__name__, target=check.target, success=result[0],
+                        duration_s=round(time.perf_counter() - started, 4))
+        _remember(check, sig, result)
+    return result
+
+
+def clear_cache() -> None:
+    with _results_lock:
+        _results.clear()
+
+
+def run_test(test_command: str) -> Tuple[bool, str]:
+    """
+    Runs a test command and returns a tuple of (success, output).
+    Supports special command prefixes like 'py_compile:', 'run_and_assert:', 'run_and_assert_file:', and 'assert_contains:'.
+    """
+    return run_check(parse_test_command(test_command))
+
+
+def _norm(path: str) -> str:
+    return path.replace("\\", "/").lstrip("/")
+
+
+def run_candidate(test_command: str, target: str, content: str, timeout: int = 180) -> Optional[Tuple[bool, str]]:
+    """
+    在草稿副本中检验 target 的候选内容，不改动原文件。
+    仅对只依赖该文件内容的检查（py_compile / assert_contains / assert_exists）可行；
+    其它检查返回 None，由调用方就地检验。
+    """
+    check = parse_test_command(test_command)
+    if check.target is None or _norm(check.target) != _norm(target):
+        return None
+    scratch = f"{config.get_runtime().state_dir}/scratch/{uuid.uuid4().hex}/{Path(target).name}"
+    moved = check.retarget(scratch)
+    if moved is None:
+        return None
+    scratch_path = _resolve(scratch)
+    scratch_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        scratch_path.write_text(content, encoding="utf-8")
+        ok, output = moved.run(timeout=timeout)
+    finally:
+        shutil.rmtree(scratch_path.parent, ignore_errors=True)
+        fs.evict(str(scratch_path.parent))
+    # 输出中的草稿路径还原为原路径，便于后续修复参考
+    return ok, output.replace(str(scratch_path), str(_resolve(target)))
+
+
+def _run_timed(test_command: str, timeout: int) -> Tuple[bool, str, float]:
+    # 进程池入口：必须是模块级函数以便序列化
+    started = time.perf_counter()
+    ok, output = parse_test_command(test_command).run(timeout=timeout)
+    return ok, output, time.perf_counter() - started
+
+
+def _mp_context():
+    """
+    进程池的启动方式：本进程总有存活线程（日志写线程、LLM 线程池、DAG 工作线程），
+    fork 可能让子进程继承被占用的锁而挂起，因此用 forkserver（不可用时用 spawn）。
+    """
+    return mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+
+
+def _dispatch(pool: Executor, pending: Dict[str, Tuple[Check, Optional[Tuple]]],
+              timeout: int, rounds: int) -> Dict[str, TestResult]:
+    results: Dict[str, TestResult] = {}
+    with pool:
+        futures = {cmd: pool.submit(_run_timed, cmd, timeout) for cmd in pending}
+        deadline = time.monotonic() + timeout * rounds + 5
+        for cmd, fut in futures.items():
+            check, sig = pending[cmd]
+            try:
+                ok, output, duration = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                fut.cancel()
+                results[cmd] = TestResult(command=cmd, success=False, output=f"Check timed out after {timeout}s.",
+                                          duration_s=float(timeout))
+                continue
+            except BrokenExecutor:
+                raise
+            except Exception as e:
+                results[cmd] = TestResult(command=cmd, success=False, output=f"Check crashed: {e}")
+                continue
+            _remember(check, sig, (ok, output))
+            results[cmd] = TestResult(command=cmd, success=ok, output=output, duration_s=duration)
+    return results
+
+
+def run_tests(commands: Iterable[str], max_workers: int | None = None, timeout: int = 180) -> List[TestResult]:
+    """
+    并行执行一组相互独立的测试命令，按输入顺序返回结构化结果（重复命令只执行一次）。
+    - 命令在进程池中执行；进程池不可用或启用了预热工作进程（PY_WORKERS）时使用线程池
+    - timeout 为单条检查的超时：传给 shell 命令，并作为等待结果的上限
+    - 文件未变化的检查直接命中结果缓存，不再派发
+    """
+    unique = list(dict.fromkeys(commands))
+    results: Dict[str, TestResult] = {}
+    pending: Dict[str, Tuple[Check, Optional[Tuple]]] = {}
+    for cmd in unique:
+        check = parse_test_command(cmd)
+        sig = check.signature()
+        hit = _cached(check, sig)
+        if hit is not None:
+            results[cmd] = TestResult(command=cmd, success=hit[0], output=hit[1])
+        else:
+            pending[cmd] = (check, sig)
+
+    if pending:
+        # 检查在其它进程中执行，只能看到磁盘
+        fs.flush()
+        workers = max(1, min(len(pending), max_workers or config.get_runtime().test_workers))
+        # 排队中的检查也要留出时间：按轮次估算整体等待上限
+        rounds = -(-len(pending) // workers)
+        # 启用预热工作进程池时脚本已在独立进程中执行，这里用线程派发即可
+        if config.get_runtime().py_workers > 0:
+            outcomes = _dispatch(ThreadPoolExecutor(max_workers=workers), pending, timeout, rounds)
+        else:
+            try:
+                outcomes = _dispatch(ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context()), pending, timeout, rounds)
+            except (OSError, NotImplementedError, BrokenExecutor):
+                outcomes = _dispatch(ThreadPoolExecutor(max_workers=workers), pending, timeout, rounds)
+        results.update(outcomes)
+        for res in outcomes.values():
+            recorder.record("test", command=res.command, success=res.success, duration_s=round(res.duration_s, 4))
+
+    return [results[cmd] for cmd in unique]
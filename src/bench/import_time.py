@@ -0,0 +1,108 @@
+"""
+冷启动基准：多次以全新解释器执行 `python -m src.main --help`，统计墙钟时间与导入耗时。
+
+    python -m src.bench.import_time                 # 默认 7 次，预算 500ms
+    python -m src.bench.import_time --runs 15 --budget-ms 300 --top 10
+
+- 中位数超过 --budget-ms，或 --help 路径导入了重量级依赖（rich/pydantic/requests/dotenv），以非零退出码结束
+- 依据 `-X importtime` 输出列出累计耗时最多的模块
+- 另以全新解释器导入 LAZY_MODULES，导入过程中构造了 LLM 客户端或配置对象（含加载 .env）同样视为失败
+"""
+from __future__ import annotations
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+HEAVY_MODULES = ("rich", "pydantic", "requests", "dotenv")
+# 仅导入即应保持惰性的模块：测试运行器与编排器
+LAZY_MODULES = ("src.agents.tester", "src.orchestrator")
+_LAZY_PROBE = (
+    "import importlib, sys\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "from src.core import config, llm\n"
+    "built = sorted(config._instances) + (['client'] if llm._client is not None else [])\n"
+    "built += ['dotenv'] if config._env_loaded else []\n"
+    "print(','.join(built))\n"
+)
+_RE_IMPORT = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _run_once(args: List[str], cwd: str) -> Tuple[float, str]:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "src.main", *args],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"src.main exited with {proc.returncode}:\n{proc.stderr[-2000:]}")
+    return elapsed, proc.stderr
+
+
+def check_lazy(module: str, cwd: str) -> List[str]:
+    """在全新解释器中导入 module，返回导入期间被构造的单例（llm_config/runtime/client/dotenv）。"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run([sys.executable, "-c", _LAZY_PROBE, module], cwd=cwd, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return [name for name in proc.stdout.strip().split(",") if name]
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """返回 {模块名: 累计导入耗时(us)}，包括被嵌套导入的模块。"""
+    out: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        m = _RE_IMPORT.match(line)
+        if m:
+            out[m.group(3)] = int(m.group(2))
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量 `python -m src.main --help` 的冷启动耗时")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="中位数墙钟时间上限（毫秒）")
+    parser.add_argument("--top", type=int, default=8, help="列出累计导入耗时最多的模块数")
+    parser.add_argument("--cwd", default=os.getcwd(), help="仓库根目录（包含 src/）")
+    args = parser.parse_args()
+
+    _run_once(["--help"], args.cwd)  # 预热文件系统缓存
+    timings: List[float] = []
+    modules: Dict[str, int] = {}
+    for _ in range(max(1, args.runs)):
+        elapsed, stderr = _run_once(["--help"], args.cwd)
+        timings.append(elapsed)
+        modules = parse_importtime(stderr)
+
+    median_ms = statistics.median(timings) * 1000
+    print(f"src.main --help: median {median_ms:.1f}ms, min {min(timings) * 1000:.1f}ms, "
+          f"max {max(timings) * 1000:.1f}ms over {len(timings)} runs")
+    print("top imports (cumulative):")
+    for name, us in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+
+    failed = False
+    for module in LAZY_MODULES:
+        built = check_lazy(module, args.cwd)
+        if built:
+            print(f"FAIL: importing {module} built {', '.join(built)}")
+            failed = True
+        else:
+            print(f"import {module}: no client or config built")
+    heavy = sorted({name.split(".")[0] for name in modules} & set(HEAVY_MODULES))
+    if heavy:
+        print(f"FAIL: --help imported heavy modules: {', '.join(heavy)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: median {median_ms:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
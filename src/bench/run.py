@@ -0,0 +1,190 @@
+"""
+离线基准：用本地 LLM 桩服务驱动 `python -m src.main` 的分步与规划两种流程，逐场景报告
+墙钟时间、LLM 调用次数、token 数、修复轮次与测试耗时。
+
+    python -m src.bench.run                                 # 全部场景
+    python -m src.bench.run --scenario phased --repeat 3
+    python -m src.bench.run --save bench.json               # 保存结果作为基线
+    python -m src.bench.run --baseline bench.json --max-regression 0.2
+
+- 每个场景在独立的临时工作区中运行（WORKSPACE_ROOT），关闭 LLM 结果缓存与 .env 加载
+- rerun 场景在同一工作区先预跑一次，第二次运行若仍有任务被执行则视为失败
+- 与基线相比墙钟时间、调用次数或 token 数超出 --max-regression 比例时以非零状态退出
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .stub_server import StubOptions, start_in_thread
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+GOAL_FILE = REPO_ROOT / "prompts" / "arxiv_cs_daily_testcase_en.txt"
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "phased": {"args": ["--phased", "--auto-fix"], "stub": {}},
+    # 同一工作区连续运行两次，只测第二次：未改动的任务必须全部跳过
+    "phased-incremental": {"args": ["--phased", "--auto-fix", "--incremental"], "stub": {}, "rerun": True},
+    "planned": {"args": ["--auto-fix"], "stub": {}},
+    "phased-faults": {
+        "args": ["--phased", "--auto-fix"],
+        "stub": {"rate_429": 0.1, "timeout_rate": 0.05, "hang_s": 0.5, "broken_rate": 0.3},
+    },
+    "planned-faults": {
+        "args": ["--auto-fix"],
+        "stub": {"rate_429": 0.1, "timeout_rate": 0.05, "hang_s": 0.5, "broken_rate": 0.3},
+    },
+}
+
+# 参与回归比较的指标
+COMPARED = ("wall_s", "llm_calls", "tokens")
+
+
+def summarize_trace(path: Path) -> Dict[str, Any]:
+    calls = tests = fix_rounds = 0
+    tasks_run = tasks_skipped = 0
+    tokens = retries = 0
+    cache_hits = cached_tokens = 0
+    llm_s = test_s = 0.0
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            rec = json.loads(line)
+            if rec["kind"] == "llm" and rec.get("cache") == "hit":
+                cache_hits += 1
+                cached_tokens += rec.get("cached_tokens", 0)
+            elif rec["kind"] == "llm":
+                calls += 1
+                tokens += rec["prompt_tokens"] + rec["completion_tokens"]
+                retries += rec["retries"]
+                llm_s += rec["wall_s"]
+            elif rec["kind"] == "test":
+                tests += 1
+                test_s += rec.get("duration_s", 0.0)
+            elif rec["kind"] == "fix_round":
+                fix_rounds += 1
+            elif rec["kind"] == "task":
+                if rec.get("skipped"):
+                    tasks_skipped += 1
+                else:
+                    tasks_run += 1
+    return {"llm_calls": calls, "tokens": tokens, "retries": retries, "llm_s": round(llm_s, 3),
+            "fix_rounds": fix_rounds, "tests": tests, "test_s": round(test_s, 3),
+            "tasks_run": tasks_run, "tasks_skipped": tasks_skipped,
+            "cache_hits": cache_hits, "cached_tokens": cached_tokens}
+
+
+def run_scenario(name: str, stub_overrides: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+    spec = SCENARIOS[name]
+    options = StubOptions(**{**spec["stub"], **stub_overrides})
+    server = start_in_thread(options)
+    port = server.server_address[1]
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+            trace = Path(workdir) / "trace.jsonl"
+            env = {
+                **os.environ,
+                "NO_DOTENV": "1",
+                "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+                "WORKSPACE_ROOT": workdir,
+                "LLM_API_KEY": "bench",
+                "LLM_BASE_URL": f"http://127.0.0.1:{port}",
+                "LLM_CACHE": "false",
+                "MOCK_MODE": "false",
+            }
+            cmd = [sys.executable, "-m", "src.main", "--goal-file", str(GOAL_FILE), *spec["args"], "--trace", str(trace)]
+            if spec.get("rerun"):
+                subprocess.run(cmd[:-2], cwd=workdir, env=env, capture_output=True, text=True, timeout=timeout)
+            started = time.perf_counter()
+            proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, timeout=timeout)
+            wall_s = time.perf_counter() - started
+            result = {"scenario": name, "exit_code": proc.returncode, "wall_s": round(wall_s, 3),
+                      **summarize_trace(trace)}
+            if proc.returncode != 0:
+                result["stderr_tail"] = proc.stderr[-2000:]
+            if spec.get("rerun") and result["tasks_run"]:
+                result["check_failed"] = f"{result['tasks_run']} unchanged task(s) re-ran on the second run"
+    finally:
+        stub_stats = dict(server.RequestHandlerClass.stub.stats)
+        server.shutdown()
+        server.server_close()
+    result["stub"] = stub_stats
+    return result
+
+
+def aggregate(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """多次重复取中位数（数值字段），其余字段取第一次的值。"""
+    out = dict(runs[0])
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[key] = statistics.median(r[key] for r in runs)
+    out["repeat"] = len(runs)
+    return out
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions: List[str] = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in COMPARED:
+            before, after = base.get(metric), cur.get(metric)
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="离线基准：本地 LLM 桩服务 + 分步/规划流程")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="可多次指定，默认全部")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=None, help="覆盖桩服务的首字节延迟")
+    parser.add_argument("--tokens-per-s", type=float, default=None, help="覆盖桩服务的生成速度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=int, default=900, help="单个场景的超时秒数")
+    parser.add_argument("--save", default=None, help="将结果写入 JSON 文件（可作为基线）")
+    parser.add_argument("--baseline", default=None, help="与之比较的基线 JSON 文件")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的相对退化比例")
+    args = parser.parse_args()
+
+    overrides: Dict[str, Any] = {"seed": args.seed}
+    if args.latency_ms is not None:
+        overrides["latency_ms"] = args.latency_ms
+    if args.tokens_per_s is not None:
+        overrides["tokens_per_s"] = args.tokens_per_s
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in args.scenario or list(SCENARIOS):
+        runs = [run_scenario(name, overrides, args.timeout) for _ in range(max(1, args.repeat))]
+        r = results[name] = aggregate(runs)
+        print(f"{name:16s} exit={r['exit_code']} wall={r['wall_s']:.2f}s llm={r['llm_calls']} calls/"
+              f"{r['tokens']} tokens ({r['llm_s']:.2f}s, {r['retries']} retries) "
+              f"fix_rounds={r['fix_rounds']} tests={r['tests']} ({r['test_s']:.2f}s) "
+              f"tasks={r['tasks_run']} run/{r['tasks_skipped']} skipped")
+        if "stderr_tail" in r:
+            print(r["stderr_tail"])
+        if "check_failed" in r:
+            print(f"FAIL: {r['check_failed']}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"results saved to {args.save}")
+
+    failed = any(r["exit_code"] != 0 or "check_failed" in r for r in results.values())
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
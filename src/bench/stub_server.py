@@ -0,0 +1,318 @@
+"""
+离线基准用的 OpenAI 兼容桩服务：POST /v1/chat/completions（支持 SSE 流式），GET /stats 返回计数。
+
+    python -m src.bench.stub_server --port 8765 --latency-ms 200 --tokens-per-s 400 \
+        --recordings .agent/llm_cache --rate-429 0.1 --timeout-rate 0.05 --broken-rate 0.2
+
+- 回放：--recordings 可以是 LLM 缓存目录（按请求体 sha256 命中，与客户端缓存键一致），
+  也可以是 JSON-lines 规则文件（{"contains": "...", "content": "..."}，按 prompt 子串匹配）
+- 未命中时按请求类型合成确定性的结果（计划 JSON、各类文件内容、多文件分隔格式）
+- 故障注入按请求内容与重复次数取确定性随机数：429（带 Retry-After）、超时（挂起后断开连接）、损坏代码
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+
+from ..core.cache import cache_key
+from ..core.metrics import estimate_tokens
+
+
+class StubOptions(BaseModel):
+    latency_ms: float = 50.0          # 首字节前的固定延迟
+    tokens_per_s: float = 0.0         # 生成速度（0 表示瞬时）
+    rate_429: float = 0.0             # 返回 429 的概率
+    retry_after_s: float = 0.0        # 429 响应中的 Retry-After
+    timeout_rate: float = 0.0         # 挂起后断开连接的概率
+    hang_s: float = 2.0               # 超时注入时挂起的秒数
+    broken_rate: float = 0.0          # 返回语法损坏代码的概率（不影响计划请求）
+    seed: int = 0
+    recordings: List[str] = []
+
+
+_RE_TARGET = re.compile(r"`([^`\s]+\.[A-Za-z0-9]+)`")
+_RE_PREFIX = re.compile(r"(\S*?)arxiv_cs_daily/")
+
+_PY_TEMPLATE = '''import os
+import json
+
+
+def main():
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+{body}
+    print(json.dumps({{"status": "ok", "script": os.path.basename(__file__)}}))
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+_TEMPLATES = {
+    ".html": (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n<title>arXiv CS Daily</title>\n"
+        "<link rel=\"stylesheet\" href=\"assets/style.css\">\n</head>\n<body>\n"
+        "<nav id=\"categories\"><a href=\"#\" data-cat=\"cs.AI\">cs.AI</a> <a href=\"#\" data-cat=\"cs.LG\">cs.LG</a></nav>\n"
+        "<div id=\"daily-container\"></div>\n<script>\n"
+        "document.querySelectorAll('#categories a').forEach(function (a) {\n"
+        "  a.addEventListener('click', function (e) { e.preventDefault(); });\n"
+        "});\n</script>\n</body>\n</html>\n"
+    ),
+    ".css": "body { font-family: sans-serif; margin: 0 auto; max-width: 960px; }\nnav a { margin-right: 8px; }\n",
+    ".js": "document.addEventListener('DOMContentLoaded', function () {});\n",
+    ".json": "{}\n",
+    ".md": "# arXiv CS Daily\n",
+}
+
+
+def synthesize_file(path: str) -> str:
+    ext = Path(path).suffix.lower()
+    if ext == ".py":
+        body = "    os.makedirs(os.path.join(base, \"papers\"), exist_ok=True)" if "build" in Path(path).name else "    pass"
+        return _PY_TEMPLATE.format(body=body)
+    return _TEMPLATES.get(ext, "placeholder\n")
+
+
+def synthesize_plan(prompt: str) -> str:
+    m = _RE_PREFIX.search(prompt)
+    base = f"{m.group(1) if m else 'project/'}arxiv_cs_daily"
+    tasks = [
+        {"id": "t-index", "desc": f"Create `{base}/index.html`.", "deps": [],
+         "target_files": [f"{base}/index.html"], "test_command": f"assert_contains:{base}/index.html:daily-container"},
+        {"id": "t-style", "desc": f"Create `{base}/assets/style.css`.", "deps": [],
+         "target_files": [f"{base}/assets/style.css"], "test_command": f"assert_exists:{base}/assets/style.css"},
+        {"id": "t-fetch", "desc": f"Create `{base}/src/fetch_arxiv.py`.", "deps": [],
+         "target_files": [f"{base}/src/fetch_arxiv.py"], "test_command": f"py_compile:{base}/src/fetch_arxiv.py"},
+        {"id": "t-build", "desc": f"Create `{base}/src/build_site.py`.", "deps": ["t-index", "t-fetch"],
+         "target_files": [f"{base}/src/build_site.py"], "test_command": f"py_compile:{base}/src/build_site.py"},
+    ]
+    return json.dumps({"tasks": tasks}, ensure_ascii=False)
+
+
+def break_code(path: str, content: str) -> str:
+    if path.endswith(".py"):
+        return content + "\ndef broken(:\n    pass\n"
+    return content[: len(content) // 3]
+
+
+class Stub:
+    """请求处理逻辑与计数，与 HTTP 层分离，便于在进程内直接调用。"""
+
+    def __init__(self, options: StubOptions):
+        self.options = options
+        self.recorded: Dict[str, str] = {}
+        self.rules: List[Tuple[str, str]] = []
+        for src in options.recordings:
+            self._load(Path(src))
+        self._lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        self.stats: Dict[str, int] = {"requests": 0, "replayed": 0, "synthesized": 0,
+                                      "throttled": 0, "timeouts": 0, "broken": 0}
+
+    def _load(self, src: Path) -> None:
+        if src.is_dir():
+            for p in src.rglob("*.json"):
+                try:
+                    response = json.loads(p.read_text(encoding="utf-8")).get("response") or {}
+                    self.recorded[p.stem] = response["choices"][0]["message"]["content"]
+                except (OSError, ValueError, KeyError, IndexError, TypeError):
+                    continue
+        elif src.is_file():
+            for line in src.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    rule = json.loads(line)
+                    self.rules.append((rule["contains"], rule["content"]))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def decide(self, payload: Dict[str, Any]) -> Tuple[str, str, random.Random]:
+        """返回 (请求键, 故障类型, 随机源)；同一请求的重试会得到不同的随机数。"""
+        key = cache_key({k: v for k, v in payload.items() if k not in ("stream", "stream_options")})
+        with self._lock:
+            self.stats["requests"] += 1
+            n = self._seen[key] = self._seen.get(key, 0) + 1
+        rng = random.Random(f"{self.options.seed}:{key}:{n}")
+        roll = rng.random()
+        if roll < self.options.rate_429:
+            self._count("throttled")
+            return key, "429", rng
+        if roll < self.options.rate_429 + self.options.timeout_rate:
+            self._count("timeouts")
+            return key, "timeout", rng
+        return key, "", rng
+
+    def complete(self, key: str, payload: Dict[str, Any], rng: random.Random) -> str:
+        messages = payload.get("messages") or []
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+
+        if key in self.recorded:
+            self._count("replayed")
+            return self.recorded[key]
+        for needle, content in self.rules:
+            if needle in prompt:
+                self._count("replayed")
+                return content
+
+        self._count("synthesized")
+        if "Planning Agent" in system:
+            return synthesize_plan(prompt)
+        if "SEARCH" in system and "REPLACE" in system:
+            # 不给编辑块：客户端回退到整文件生成
+            return ""
+        if "=== FILE:" in system:
+            paths = _RE_TARGET.findall(prompt.rsplit("Generate the full content for each of these files:", 1)[-1])
+            return "".join(f"=== FILE: {p} ===\n{self._file(p, rng).rstrip()}\n=== END FILE ===\n"
+                           for p in dict.fromkeys(paths))
+        targets = _RE_TARGET.findall(prompt)
+        return self._file(targets[-1], rng) if targets else "{\"result\": \"ok\"}"
+
+    def _file(self, path: str, rng: random.Random) -> str:
+        content = synthesize_file(path)
+        if rng.random() < self.options.broken_rate:
+            self._count("broken")
+            return break_code(path, content)
+        return content
+
+    def generation_delay(self, completion_tokens: int) -> float:
+        rate = self.options.tokens_per_s
+        return completion_tokens / rate if rate > 0 else 0.0
+
+
+def _usage(payload: Dict[str, Any], content: str) -> Dict[str, int]:
+    prompt_tokens = estimate_tokens("".join(m.get("content", "") for m in payload.get("messages") or []))
+    completion_tokens = estimate_tokens(content)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _chunks(text: str, size: int = 16) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: Stub
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/stats":
+            with self.stub._lock:
+                self._send_json(200, dict(self.stub.stats))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        opts = self.stub.options
+        key, fault, rng = self.stub.decide(payload)
+        time.sleep(opts.latency_ms / 1000)
+        if fault == "429":
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{opts.retry_after_s:g}"})
+            return
+        if fault == "timeout":
+            time.sleep(opts.hang_s)
+            self.close_connection = True
+            return
+
+        content = self.stub.complete(key, payload, rng)
+        usage = _usage(payload, content)
+        model = payload.get("model", "stub")
+        if not payload.get("stream"):
+            time.sleep(self.stub.generation_delay(usage["completion_tokens"]))
+            self._send_json(200, {
+                "id": f"stub-{key[:12]}", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        pieces = list(_chunks(content))
+        per_piece = self.stub.generation_delay(usage["completion_tokens"]) / max(1, len(pieces))
+        for piece in pieces:
+            time.sleep(per_piece)
+            chunk = {"choices": [{"index": 0, "delta": {"content": piece}}], "model": model}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def make_server(options: StubOptions, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("StubHandler", (_Handler,), {"stub": Stub(options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(options: StubOptions, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程中启动桩服务，返回 server（server.server_address 为实际监听地址）。"""
+    server = make_server(options, host, port)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的确定性 LLM 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after-s", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-s", type=float, default=2.0)
+    parser.add_argument("--broken-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recordings", action="append", default=[],
+                        help="LLM 缓存目录或 JSON-lines 规则文件，可多次指定")
+    args = parser.parse_args()
+    options = StubOptions(**{k: v for k, v in vars(args).items() if k not in ("host", "port")})
+    server = make_server(options, args.host, args.port)
+    print(f"LLM stub listening on http://{args.host}:{server.server_address[1]}  (LLM_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
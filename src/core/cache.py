@@ -0,0 +1,124 @@
+from __future__ import annotations
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+from .logger import warn
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """对请求体（model/temperature/system/messages 等）做稳定序列化后取 sha256。"""
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    以内容寻址的 LLM 完成结果磁盘缓存。
+    - 每条记录存为 <root>/<key[:2]>/<key>.json，写入采用临时文件 + 原子替换
+    - ttl_s: 超过该时长的记录视为过期（<=0 表示永不过期）
+    - max_bytes: 总大小超限时按最近使用时间（mtime）淘汰最旧记录
+    - bypass: 跳过读取但仍写入新结果，用于强制刷新
+    """
+
+    def __init__(self, root: Path, ttl_s: float = 0, max_bytes: int = 0,
+                 enabled: bool = True, bypass: bool = False):
+        self.root = Path(root)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled or self.bypass:
+            return None
+        p = self._path(key)
+        try:
+            record = json.loads(p.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            record = None
+        except Exception as e:
+            warn(f"缓存记录损坏，已忽略：{p} ({e})")
+            record = None
+        if record is not None and self.ttl_s > 0 and time.time() - record.get("created_at", 0) > self.ttl_s:
+            self._remove(p)
+            record = None
+        with self._lock:
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        return record.get("response")
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        p = self._path(key)
+        blob = json.dumps({"created_at": time.time(), "response": response}, ensure_ascii=False)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            old_size = p.stat().st_size if p.exists() else 0
+            fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(blob)
+            os.replace(tmp, p)
+        except OSError as e:
+            warn(f"写入 LLM 缓存失败：{e}")
+            return
+        with self._lock:
+            self.writes += 1
+            if self._size is not None:
+                self._size += p.stat().st_size - old_size
+        self._evict()
+
+    def _remove(self, p: Path) -> None:
+        try:
+            size = p.stat().st_size
+            p.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self) -> None:
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(f.stat().st_size for f in self.root.glob("*/*.json"))
+            over = self._size > self.max_bytes
+        if not over:
+            return
+        entries = sorted(((f.stat().st_mtime, f) for f in self.root.glob("*/*.json")), key=lambda e: e[0])
+        for _, f in entries:
+            with self._lock:
+                if self._size <= self.max_bytes:
+                    break
+            self._remove(f)
+
+    def clear(self) -> None:
+        for f in self.root.glob("*/*.json"):
+            self._remove(f)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "evictions": self.evictions}
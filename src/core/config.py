@@ -1,29 +1,119 @@
 import os
-from dotenv import load_dotenv
-from pydantic import BaseModel
+import threading
+from typing import Dict
+from pydantic import BaseModel, Field
+
+_env_loaded = False
+
+
+def load_env() -> None:
+    """加载 .env 等环境文件（进程内只执行一次）；字段默认值在配置对象构造时才读取环境变量。"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    # NO_DOTENV=1 时只使用进程环境变量（如离线基准为子进程指定的配置）
+    if os.getenv("NO_DOTENV", "").lower() in ("1", "true"):
+        return
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+    # 额外加载非隐藏环境文件，便于在部分环境禁止 .env 时使用
+    load_dotenv("local.env", override=True)
+    load_dotenv("config/.env", override=True)
 
-load_dotenv(override=True)
-# 额外加载非隐藏环境文件，便于在部分环境禁止 .env 时使用
-load_dotenv("local.env", override=True)
-load_dotenv("config/.env", override=True)
 
 class LLMConfig(BaseModel):
-    provider: str = os.getenv("LLM_PROVIDER", "deepseek")
-    base_url: str = os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
-    api_key: str | None = os.getenv("LLM_API_KEY")
-    model: str = os.getenv("LLM_MODEL", "deepseek-chat")
-    temperature: float = float(os.getenv("LLM_TEMPERATURE", "0.2"))
-    max_tokens: int = int(os.getenv("LLM_MAX_TOKENS", "4096"))
-    mock_mode: bool = os.getenv("MOCK_MODE", "false").lower() == "true"
+    provider: str = Field(default_factory=lambda: os.getenv("LLM_PROVIDER", "deepseek"))
+    base_url: str = Field(default_factory=lambda: os.getenv("LLM_BASE_URL", "https://api.deepseek.com"))
+    api_key: str | None = Field(default_factory=lambda: os.getenv("LLM_API_KEY"))
+    model: str = Field(default_factory=lambda: os.getenv("LLM_MODEL", "deepseek-chat"))
+    temperature: float = Field(default_factory=lambda: float(os.getenv("LLM_TEMPERATURE", "0.2")))
+    max_tokens: int = Field(default_factory=lambda: int(os.getenv("LLM_MAX_TOKENS", "4096")))
+    mock_mode: bool = Field(default_factory=lambda: os.getenv("MOCK_MODE", "false").lower() == "true")
+    # 同时在途的 LLM 请求上限（亦即连接池大小）
+    max_concurrency: int = Field(default_factory=lambda: int(os.getenv("LLM_MAX_CONCURRENCY", "4")))
+    # 客户端限流：每分钟请求数 / token 数（0 表示不限），以及单次调用的最大尝试次数
+    rpm: float = Field(default_factory=lambda: float(os.getenv("LLM_RPM", "0")))
+    tpm: float = Field(default_factory=lambda: float(os.getenv("LLM_TPM", "0")))
+    max_retries: int = Field(default_factory=lambda: int(os.getenv("LLM_MAX_RETRIES", "3")))
+    # 完成结果磁盘缓存：LLM_CACHE=false 完全关闭，LLM_CACHE_BYPASS=true 只写不读
+    cache_enabled: bool = Field(default_factory=lambda: os.getenv("LLM_CACHE", "true").lower() == "true")
+    cache_bypass: bool = Field(default_factory=lambda: os.getenv("LLM_CACHE_BYPASS", "false").lower() == "true")
+    cache_ttl_s: float = Field(default_factory=lambda: float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))))
+    cache_max_mb: int = Field(default_factory=lambda: int(os.getenv("LLM_CACHE_MAX_MB", "256")))
+    # 流式生成：coder 边接收边写入临时文件；超过 stall 秒无新数据即中止
+    stream: bool = Field(default_factory=lambda: os.getenv("LLM_STREAM", "false").lower() == "true")
+    stall_timeout_s: float = Field(default_factory=lambda: float(os.getenv("LLM_STALL_TIMEOUT", "60")))
+    # 单次 prompt 的 token 预算（0 不限制）与错误日志保留的最大行数
+    prompt_budget: int = Field(default_factory=lambda: int(os.getenv("PROMPT_TOKEN_BUDGET", "12000")))
+    error_log_max_lines: int = Field(default_factory=lambda: int(os.getenv("ERROR_LOG_MAX_LINES", "80")))
 
 class RuntimeConfig(BaseModel):
-    workspace_root: str = os.getenv("WORKSPACE_ROOT", os.getcwd())
-    step_limit: int = int(os.getenv("STEP_LIMIT", "12"))
-    allow_shell: bool = os.getenv("ALLOW_SHELL", "true").lower() == "true"
-    allow_write: bool = os.getenv("ALLOW_WRITE", "true").lower() == "true"
+    workspace_root: str = Field(default_factory=lambda: os.getenv("WORKSPACE_ROOT", os.getcwd()))
+    step_limit: int = Field(default_factory=lambda: int(os.getenv("STEP_LIMIT", "12")))
+    allow_shell: bool = Field(default_factory=lambda: os.getenv("ALLOW_SHELL", "true").lower() == "true")
+    allow_write: bool = Field(default_factory=lambda: os.getenv("ALLOW_WRITE", "true").lower() == "true")
+    # 写回模式：写入先进入内存覆盖层，执行命令/任务结束/提交快照时再原子落盘；false 为直接写盘
+    fs_write_back: bool = Field(default_factory=lambda: os.getenv("FS_WRITE_BACK", "true").lower() == "true")
     # 所有生成产物的根目录名（相对 workspace_root），默认 'project'
-    output_dir: str = os.getenv("OUTPUT_DIR", "project")
+    output_dir: str = Field(default_factory=lambda: os.getenv("OUTPUT_DIR", "project"))
+    # DAG 调度的并发任务数；1 表示按拓扑序串行执行
+    max_workers: int = Field(default_factory=lambda: int(os.getenv("MAX_WORKERS", "4")))
+    # 代理自身的状态/缓存目录（相对 workspace_root）
+    state_dir: str = Field(default_factory=lambda: os.getenv("STATE_DIR", ".agent"))
+    # 已有文件的修改方式：full=整文件重写；patch=search/replace 编辑块（失败时回退整文件）
+    edit_mode: str = Field(default_factory=lambda: os.getenv("EDIT_MODE", "full").lower())
+    # 增量模式：跳过上游与自身均未变化且上次测试通过的任务
+    incremental: bool = Field(default_factory=lambda: os.getenv("INCREMENTAL", "false").lower() == "true")
+    # 多目标文件任务的生成方式：off=逐文件；single=单次请求多文件输出；concurrent=共享前缀并发请求
+    batch_mode: str = Field(default_factory=lambda: os.getenv("BATCH_MODE", "off").lower())
+    # 计划缓存：按规范化目标与 output_dir 复用通过校验的计划；revalidate 时在后台重新规划并更新缓存
+    plan_cache: bool = Field(default_factory=lambda: os.getenv("PLAN_CACHE", "true").lower() == "true")
+    plan_revalidate: bool = Field(default_factory=lambda: os.getenv("PLAN_REVALIDATE", "false").lower() == "true")
+    # 进程退出前等待后台重新规划完成的最长秒数（0 表示不等待）
+    plan_revalidate_wait: float = Field(default_factory=lambda: float(os.getenv("PLAN_REVALIDATE_WAIT", "30")))
+    # 规划失败时是否复用同一 output_dir 下其它目标的最近计划（默认只复用同一目标的计划）
+    plan_reuse_latest: bool = Field(default_factory=lambda: os.getenv("PLAN_REUSE_LATEST", "false").lower() == "true")
+    # 规划输出无法解析或未通过校验时的重试次数
+    plan_retries: int = Field(default_factory=lambda: int(os.getenv("PLAN_RETRIES", "2")))
+    # 推测式修复：测试失败时并发生成的修复候选数量（<=1 表示关闭，按轮次顺序修复）
+    speculative_fixes: int = Field(default_factory=lambda: int(os.getenv("SPECULATIVE_FIXES", "0")))
+    # 批量校验的并行进程数
+    test_workers: int = Field(default_factory=lambda: int(os.getenv("TEST_WORKERS", str(os.cpu_count() or 4))))
+    # 预热 Python 工作进程数（0 关闭），以及启动时预先导入的模块
+    py_workers: int = Field(default_factory=lambda: int(os.getenv("PY_WORKERS", "0")))
+    py_worker_preload: str = Field(default_factory=lambda: os.getenv("PY_WORKER_PRELOAD", "requests,feedparser,json,xml.etree.ElementTree"))
+    # LLM 调用跟踪（JSON-lines）输出路径，为空则不写
+    trace_file: str = Field(default_factory=lambda: os.getenv("TRACE_FILE", ""))
+
+_instances: Dict[str, BaseModel] = {}
+_lock = threading.Lock()
+
+
+def get_llm_config() -> LLMConfig:
+    return _get("llm_config", LLMConfig)
+
+
+def get_runtime() -> RuntimeConfig:
+    return _get("runtime", RuntimeConfig)
+
+
+def _get(name: str, cls: type) -> BaseModel:
+    inst = _instances.get(name)
+    if inst is None:
+        with _lock:
+            inst = _instances.get(name)
+            if inst is None:
+                load_env()
+                inst = _instances[name] = cls()
+    return inst
+
 
-llm_config = LLMConfig()
-runtime = RuntimeConfig()
+def __getattr__(name: str):
+    # llm_config / runtime 在首次访问时才读取环境变量并构造
+    if name == "llm_config":
+        return get_llm_config()
+    if name == "runtime":
+        return get_runtime()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from . import config
+from .logger import warn
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: str) -> Optional[str]:
+    """工作区相对路径的内容哈希；文件不存在时返回 None。"""
+    p = Path(path)
+    if not p.is_absolute():
+        p = Path(config.get_runtime().workspace_root) / p
+    try:
+        return hashlib.sha256(p.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def hash_files(paths: Iterable[str]) -> Dict[str, Optional[str]]:
+    return {p: hash_file(p) for p in sorted(set(paths))}
+
+
+class IncrementalStore:
+    """
+    记录每个任务最近一次通过测试时的指纹与目标文件哈希，保存在 <state_dir>/incremental.json。
+    指纹涵盖目标、任务描述、目标文件、测试命令以及上游任务的指纹；
+    指纹与文件哈希都未变化且上次测试通过时，任务可整体跳过。
+    文件哈希在运行结束时统一刷新（refresh），共享目标文件的任务因此不会互相使对方失效。
+    """
+
+    def __init__(self, path: Path | None = None):
+        if path is None:
+            runtime = config.get_runtime()
+            path = Path(runtime.workspace_root) / runtime.state_dir / "incremental.json"
+        self.path = path
+        self._lock = threading.Lock()
+        self.records: Dict[str, Dict] = {}
+        try:
+            self.records = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            warn(f"增量记录读取失败，将全部重新执行：{e}")
+
+    @staticmethod
+    def fingerprint(goal: str, desc: str, target_files: Iterable[str], test_command: str,
+                    upstream: Dict[str, str]) -> str:
+        blob = json.dumps(
+            {"goal": goal, "desc": desc, "files": sorted(target_files), "test": test_command, "upstream": upstream},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hash_text(blob)
+
+    def is_fresh(self, task_id: str, fingerprint: str, files: Iterable[str]) -> bool:
+        with self._lock:
+            rec = self.records.get(task_id)
+        if not rec or not rec.get("passed") or rec.get("fingerprint") != fingerprint:
+            return False
+        current = hash_files(files)
+        return all(h is not None for h in current.values()) and current == rec.get("files")
+
+    def record(self, task_id: str, fingerprint: str, files: Iterable[str], passed: bool) -> None:
+        with self._lock:
+            self.records[task_id] = {"fingerprint": fingerprint, "files": hash_files(files), "passed": passed}
+            self._save()
+
+    def refresh(self, files_by_task: Dict[str, Iterable[str]], failed: Iterable[str] = ()) -> None:
+        """
+        把已通过任务记录的文件哈希更新为当前磁盘内容（运行结束、所有写入落盘后调用）。
+        failed 中的任务（如最终复检未通过）改记为未通过，不会被下次运行跳过。
+        """
+        failed = set(failed)
+        with self._lock:
+            changed = False
+            for task_id, files in files_by_task.items():
+                rec = self.records.get(task_id)
+                if not rec or not rec.get("passed"):
+                    continue
+                if task_id in failed:
+                    rec["passed"] = False
+                else:
+                    rec["files"] = hash_files(files)
+                changed = True
+            if changed:
+                self._save()
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.records, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            warn(f"增量记录写入失败：{e}")
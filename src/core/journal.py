@@ -0,0 +1,77 @@
+from __future__ import annotations
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+from . import config
+from .logger import warn
+
+
+class RunJournal:
+    """
+    运行检查点日志：<state_dir>/run_journal.jsonl，每行一个事件，追加写入并 fsync。
+    - start: 目标、模式与完整计划（新运行会截断旧日志）
+    - task:  任务完成时的目标文件哈希与测试结果
+    - finish: 整个编排结束
+    崩溃或 Ctrl-C 后可用 load() 取回计划与已完成任务，从第一个未完成任务继续。
+    """
+
+    def __init__(self, path: Path | None = None):
+        if path is None:
+            runtime = config.get_runtime()
+            path = Path(runtime.workspace_root) / runtime.state_dir / "run_journal.jsonl"
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _append(self, event: Dict[str, Any], truncate: bool = False) -> None:
+        event["ts"] = time.time()
+        line = json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "w" if truncate else "a", encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                warn(f"写入运行日志失败：{e}")
+
+    def start(self, goal: str, plan: Dict[str, Any], phased: bool) -> None:
+        self._append({"event": "start", "goal": goal, "phased": phased, "plan": plan}, truncate=True)
+
+    def task_done(self, task_id: str, files: Dict[str, Optional[str]], passed: bool) -> None:
+        self._append({"event": "task", "id": task_id, "files": files, "passed": passed})
+
+    def finish(self) -> None:
+        self._append({"event": "finish"})
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        读取最近一次运行：返回 {goal, phased, plan, tasks: {id: {files, passed}}, finished}，tasks 按完成顺序排列；
+        无日志或日志缺少 start 事件时返回 None。末尾未写完的行会被忽略。
+        """
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return None
+        run: Optional[Dict[str, Any]] = None
+        for line in lines:
+            try:
+                ev = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            kind = ev.get("event")
+            if kind == "start":
+                run = {"goal": ev["goal"], "phased": ev.get("phased", False), "plan": ev["plan"],
+                       "tasks": {}, "finished": False}
+            elif run is None:
+                continue
+            elif kind == "task":
+                # 保持按最近一次完成的顺序排列
+                run["tasks"].pop(ev["id"], None)
+                run["tasks"][ev["id"]] = {"files": ev.get("files", {}), "passed": ev.get("passed", False)}
+            elif kind == "finish":
+                run["finished"] = True
+        return run
@@ -2,16 +2,33 @@ from __future__ import annotations
 import os
 import json
 import time
-from typing import List, Dict, Any
-import requests
-from requests import ReadTimeout
-from .config import llm_config
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Sequence
+from pathlib import Path
+from .cache import CompletionCache, cache_key
+from .metrics import recorder, estimate_tokens
+from .ratelimit import RateLimiter, Slot, parse_retry_after
+from . import config
 from .logger import info, warn, error
 
+if TYPE_CHECKING:
+    import requests
+
 OpenAICompatURL = "/v1/chat/completions"
+# 限流与服务端临时错误：可以重试
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
 class LLMClient:
     def __init__(self):
+        # requests 只在创建客户端时导入，导入本模块本身不加载它
+        import requests
+        from requests.adapters import HTTPAdapter
+        llm_config = config.get_llm_config()
+        runtime = config.get_runtime()
         self.base_url = llm_config.base_url.rstrip("/")
         self.api_key = llm_config.api_key
         self.model = llm_config.model
@@ -19,21 +36,142 @@ class LLMClient:
         self.max_tokens = llm_config.max_tokens
         self.mock = llm_config.mock_mode or not self.api_key
         self.force_json = os.getenv("FORCE_JSON", "false").lower() == "true"
+        self.max_concurrency = max(1, llm_config.max_concurrency)
+        # 复用 keep-alive 连接，避免每次调用重新握手 TCP/TLS
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # 连接/读取超时视为服务端过载信号：与 429/503 一样收缩并发上限
+        self.limiter = RateLimiter(rpm=llm_config.rpm, tpm=llm_config.tpm, max_concurrency=self.max_concurrency,
+                                   timeout_errors=(requests.Timeout, TimeoutError))
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self.cache = CompletionCache(
+            Path(runtime.workspace_root) / runtime.state_dir / "llm_cache",
+            ttl_s=llm_config.cache_ttl_s,
+            max_bytes=llm_config.cache_max_mb * 1024 * 1024,
+            enabled=llm_config.cache_enabled,
+            bypass=llm_config.cache_bypass,
+        )
 
     def chat(self, messages: List[Dict[str, str]], tools: List[Dict[str, Any]] | None = None,
-             tool_choice: str | None = None, system: str | None = None) -> Dict[str, Any]:
+             tool_choice: str | None = None, system: str | None = None,
+             temperature: float | None = None, use_cache: bool = True) -> Dict[str, Any]:
+        started = time.perf_counter()
         if self.mock:
             warn("LLM 处于 mock 模式，将返回演示用的简化结果。配置 LLM_API_KEY 以启用真实调用。")
-            return self._mock_response(messages)
-        headers = {
+            data = self._mock_response(messages)
+            self._record(messages, system, data, started, retries=0, cache="mock")
+            return data
+        headers = self._headers()
+        payload = self._build_payload(messages, tools, tool_choice, system, temperature)
+        url = f"{self.base_url}{OpenAICompatURL}"
+
+        key = cache_key(payload)
+        # use_cache=False 跳过读取（结果仍写入缓存），用于需要新结果的请求
+        cached = self.cache.get(key) if use_cache else None
+        if cached is not None:
+            self._record(messages, system, cached, started, retries=0, cache="hit")
+            return cached
+
+        # 稳健重试：网络错误、超时与 429/5xx 重试；429/503 由限流器统一暂停并收缩并发
+        from requests import ReadTimeout, RequestException
+        est_tokens = self._estimate_prompt_tokens(payload)
+        attempts = max(1, config.get_llm_config().max_retries)
+        last_err: Exception | None = None
+        for attempt in range(attempts):
+            wait_s = 0.0
+            try:
+                with self.limiter.slot(est_tokens) as slot:
+                    resp = self.session.post(url, headers=headers, data=json.dumps(payload), timeout=(30, 240))
+                    if resp.status_code in RETRYABLE_STATUS:
+                        last_err = RuntimeError(f"LLM API error: {resp.status_code}")
+                        wait_s = self._retry_wait(resp, slot, attempt)
+                        warn(f"LLM API 返回 {resp.status_code}，{wait_s:.1f}s 后重试（第 {attempt+1}/{attempts} 次）")
+                    elif resp.status_code >= 400:
+                        txt = resp.text[:500]
+                        error(f"LLM API 错误 {resp.status_code}: {txt}")
+                        # 对于其它 400 类错误不重试
+                        raise RuntimeError(f"LLM API error: {resp.status_code}")
+                    else:
+                        data = resp.json()
+                        slot.used((data.get("usage") or {}).get("total_tokens", est_tokens))
+                        if data.get("choices"):
+                            self.cache.put(key, data)
+                        self._record(messages, system, data, started, retries=attempt, cache=self._cache_status())
+                        return data
+            except ReadTimeout as e:
+                last_err = e
+                wait_s = 2 ** attempt
+                warn(f"LLM 读取超时，{wait_s}s 后重试（第 {attempt+1}/{attempts} 次）")
+            except RequestException as e:
+                last_err = e
+                # 网络类错误重试
+                wait_s = 2 ** attempt
+                warn(f"LLM 请求异常，{wait_s}s 后重试（第 {attempt+1}/{attempts} 次）：{e}")
+            if attempt + 1 < attempts:
+                time.sleep(wait_s)
+        # 最终失败
+        error(f"LLM 请求失败：{last_err}")
+        self._record(messages, system, None, started, retries=attempts, cache=self._cache_status(), ok=False)
+        raise last_err if last_err else RuntimeError("LLM request failed")
+
+    @staticmethod
+    def _retry_wait(resp: requests.Response, slot: Slot, attempt: int) -> float:
+        """
+        计算可重试状态码的等待时间。429/503 交给限流器：暂停所有请求直到 Retry-After 结束，
+        下一次 slot() 会自动等待，因此这里无需再睡眠。
+        """
+        retry_after = parse_retry_after(resp.headers)
+        if resp.status_code in (429, 503):
+            slot.throttle(retry_after)
+            return 0.0
+        return retry_after if retry_after is not None else float(2 ** attempt)
+
+    @staticmethod
+    def _estimate_prompt_tokens(payload: Dict[str, Any]) -> int:
+        return estimate_tokens("".join(m.get("content") or "" for m in payload["messages"]))
+
+    def _cache_status(self) -> str:
+        if not self.cache.enabled:
+            return "off"
+        return "bypass" if self.cache.bypass else "miss"
+
+    def _record(self, messages: List[Dict[str, str]], system: str | None, data: Dict[str, Any] | None,
+                started: float, retries: int, cache: str, ok: bool = True, stream: bool = False) -> None:
+        """记录一次调用：优先使用返回的 usage，缺失时按字符数估算；缓存命中不计 token，记为 cached_tokens。"""
+        usage = (data or {}).get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens((system or "") + "".join(m.get("content", "") for m in messages))
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(self._extract_text(data)) if data else 0
+        cached_tokens = 0
+        if cache == "hit":
+            cached_tokens, prompt_tokens, completion_tokens = prompt_tokens + completion_tokens, 0, 0
+        recorder.record_call(
+            model=self.model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            wall_s=time.perf_counter() - started, retries=retries, cache=cache, stream=stream, ok=ok,
+            estimated=estimated, cached_tokens=cached_tokens,
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "User-Agent": "Cascade-Agent/1.0 (+https://github.com/)"
         }
+
+    def _build_payload(self, messages: List[Dict[str, str]], tools: List[Dict[str, Any]] | None = None,
+                       tool_choice: str | None = None, system: str | None = None,
+                       temperature: float | None = None) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
             "model": self.model,
             "messages": ([] if system is None else [{"role": "system", "content": system}]) + messages,
-            "temperature": self.temperature,
+            "temperature": self.temperature if temperature is None else temperature,
             "max_tokens": self.max_tokens,
         }
         if tools:
@@ -43,42 +181,145 @@ class LLMClient:
         # 可选强制 JSON（仅在兼容端支持时开启）
         if self.force_json:
             payload["response_format"] = {"type": "json_object"}
-        url = f"{self.base_url}{OpenAICompatURL}"
+        return payload
+
+    def stream_text(self, prompt: str, system: str | None = None) -> Iterator[str]:
+        """
+        以 SSE 流式返回完成内容的增量片段。
+        - 读超时即停滞超时（LLM_STALL_TIMEOUT）：两次数据到达间隔过长即中止，而不是等满 240s
+        - 仅在尚未产出任何片段时重试；完整结果写入缓存（与 chat 共用同一缓存键）
+        """
+        messages = [{"role": "user", "content": prompt}]
+        started = time.perf_counter()
+        if self.mock:
+            warn("LLM 处于 mock 模式，将返回演示用的简化结果。配置 LLM_API_KEY 以启用真实调用。")
+            data = self._mock_response(messages)
+            self._record(messages, system, data, started, retries=0, cache="mock", stream=True)
+            yield self._extract_text(data)
+            return
+        payload = self._build_payload(messages, system=system)
+        key = cache_key(payload)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record(messages, system, cached, started, retries=0, cache="hit", stream=True)
+            yield self._extract_text(cached)
+            return
 
-        # 稳健重试：3 次，指数退避
+        from requests import ReadTimeout, RequestException
+        url = f"{self.base_url}{OpenAICompatURL}"
+        body = json.dumps(dict(payload, stream=True, stream_options={"include_usage": True}))
+        est_tokens = self._estimate_prompt_tokens(payload)
+        attempts = max(1, config.get_llm_config().max_retries)
         last_err: Exception | None = None
-        for attempt in range(3):
+        for attempt in range(attempts):
+            parts: List[str] = []
+            usage: Dict[str, Any] = {}
+            wait_s = 0.0
             try:
-                resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=(30, 240))
-                if resp.status_code >= 400:
-                    txt = resp.text[:500]
-                    error(f"LLM API 错误 {resp.status_code}: {txt}")
-                    # 对于 400 类错误不重试
-                    raise RuntimeError(f"LLM API error: {resp.status_code}")
-                return resp.json()
-            except ReadTimeout as e:
+                with self.limiter.slot(est_tokens) as slot:
+                    first_at = time.perf_counter()
+                    with self.session.post(url, headers=self._headers(), data=body, stream=True,
+                                           timeout=(30, config.get_llm_config().stall_timeout_s)) as resp:
+                        if resp.status_code in RETRYABLE_STATUS:
+                            last_err = RuntimeError(f"LLM API error: {resp.status_code}")
+                            wait_s = self._retry_wait(resp, slot, attempt)
+                            warn(f"LLM API 返回 {resp.status_code}，{wait_s:.1f}s 后重试（第 {attempt+1}/{attempts} 次）")
+                            continue
+                        if resp.status_code >= 400:
+                            error(f"LLM API 错误 {resp.status_code}: {resp.text[:500]}")
+                            raise RuntimeError(f"LLM API error: {resp.status_code}")
+                        for delta in self._iter_sse(resp, usage):
+                            if not parts:
+                                info(f"LLM 首个片段到达，耗时 {time.perf_counter() - first_at:.2f}s")
+                            parts.append(delta)
+                            yield delta
+                    slot.used(usage.get("total_tokens", est_tokens))
+                text = "".join(parts)
+                data = {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+                self.cache.put(key, data)
+                self._record(messages, system, dict(data, usage=usage or None), started,
+                             retries=attempt, cache=self._cache_status(), stream=True)
+                return
+            except (ReadTimeout, RequestException) as e:
                 last_err = e
+                if parts:
+                    error(f"LLM 流式输出中断（已接收 {sum(map(len, parts))} 字符）：{e}")
+                    self._record(messages, system, None, started, retries=attempt,
+                                 cache=self._cache_status(), ok=False, stream=True)
+                    raise
                 wait_s = 2 ** attempt
-                warn(f"LLM 读取超时，{wait_s}s 后重试（第 {attempt+1}/3 次）")
-                time.sleep(wait_s)
-            except requests.RequestException as e:
-                last_err = e
-                # 网络类错误重试
-                wait_s = 2 ** attempt
-                warn(f"LLM 请求异常，{wait_s}s 后重试（第 {attempt+1}/3 次）：{e}")
-                time.sleep(wait_s)
-        # 最终失败
+                warn(f"LLM 流式请求失败，{wait_s}s 后重试（第 {attempt+1}/{attempts} 次）：{e}")
+            finally:
+                if wait_s and attempt + 1 < attempts:
+                    time.sleep(wait_s)
         error(f"LLM 请求失败：{last_err}")
+        self._record(messages, system, None, started, retries=attempts, cache=self._cache_status(), ok=False, stream=True)
         raise last_err if last_err else RuntimeError("LLM request failed")
 
-    def simple_text(self, prompt: str, system: str | None = None) -> str:
-        data = self.chat(messages=[{"role": "user", "content": prompt}], system=system)
+    @staticmethod
+    def _iter_sse(resp: requests.Response, usage: Dict[str, Any]) -> Iterator[str]:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if chunk.get("usage"):
+                usage.update(chunk["usage"])
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+    def simple_text(self, prompt: str, system: str | None = None, temperature: float | None = None,
+                    use_cache: bool = True) -> str:
+        data = self.chat(messages=[{"role": "user", "content": prompt}], system=system, temperature=temperature,
+                         use_cache=use_cache)
+        return self._extract_text(data)
+
+    @staticmethod
+    def _extract_text(data: Dict[str, Any]) -> str:
         # OpenAI兼容返回
         try:
             return data["choices"][0]["message"]["content"]
         except Exception:
             return json.dumps(data)
 
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm")
+            return self._executor
+
+    async def achat(self, messages: List[Dict[str, str]], tools: List[Dict[str, Any]] | None = None,
+                    tool_choice: str | None = None, system: str | None = None) -> Dict[str, Any]:
+        """chat 的 asyncio 版本：在专用线程池中执行，共享同一连接池与并发上限。"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.chat, messages, tools=tools, tool_choice=tool_choice, system=system)
+        # 复制上下文，使调用标签（agent/task_id/mode）随请求进入线程池
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_executor(), ctx.run, call)
+
+    async def asimple_text(self, prompt: str, system: str | None = None) -> str:
+        data = await self.achat(messages=[{"role": "user", "content": prompt}], system=system)
+        return self._extract_text(data)
+
+    def simple_text_many(self, prompts: Sequence[str], system: str | None = None) -> List[str]:
+        """同步包装：并发发送多个 prompt，按输入顺序返回结果。"""
+        async def _gather() -> List[str]:
+            return list(await asyncio.gather(*(self.asimple_text(p, system=system) for p in prompts)))
+        return asyncio.run(_gather())
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
     def _mock_response(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         # 极简 mock：如果用户提到 plan，则返回一个固定 JSON 计划
         content = messages[-1]["content"].lower()
@@ -101,5 +342,21 @@ class LLMClient:
             ]
         }
 
-client = LLMClient()
+_client: LLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
+
 
+def __getattr__(name: str):
+    # 共享客户端在首次使用时才创建（连接池、缓存目录、限流器）
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,25 +1,179 @@
-from rich.console import Console
-from rich.progress import Progress
-from rich.traceback import install
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from typing import Any, Dict, Optional, TextIO
 
-console = Console()
-install(show_locals=False)
+# 日志级别；LOG_LEVEL 可取 DEBUG/INFO/SUCCESS/WARN/ERROR
+LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 25, "OK": 25, "WARN": 30, "WARNING": 30, "ERROR": 40}
+_STYLES = {"INFO": "bold cyan", "OK": "bold green", "WARN": "bold yellow", "ERROR": "bold red", "DEBUG": "dim"}
+_STOP = object()
+
+
+class _Writer:
+    """
+    日志后台写线程：调用方只做级别过滤并把记录放入队列，格式化与输出都在写线程中完成，
+    并行执行的任务之间不会因为写日志互相阻塞。
+    - 终端（TTY）用 rich 渲染，否则输出纯文本行
+    - LOG_JSON=<路径> 额外写入 JSON-lines（'-' 表示写到标准错误）
+    """
+
+    def __init__(self):
+        self.level = LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), 20)
+        self.queue: "queue.Queue[Any]" = queue.Queue()
+        self.console = None
+        self.out: TextIO = sys.stdout
+        self.json_sink: Optional[TextIO] = None
+        self.pid = os.getpid()
+        rich_mode = os.getenv("LOG_RICH", "auto").lower()
+        if rich_mode == "true" or (rich_mode == "auto" and self.out.isatty()):
+            self.console = _make_console()
+        json_path = os.getenv("LOG_JSON", "")
+        if json_path == "-":
+            self.json_sink = sys.stderr
+        elif json_path:
+            self.json_sink = open(json_path, "a", encoding="utf-8", buffering=1)
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            rec = self.queue.get()
+            try:
+                if rec is _STOP:
+                    return
+                self._write(rec)
+            except Exception:
+                pass
+            finally:
+                self.queue.task_done()
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        clock = time.strftime("%H:%M:%S", time.localtime(rec["ts"]))
+        if self.console is not None:
+            from rich.markup import escape
+            style = _STYLES.get(rec["level"], "bold")
+            self.console.print(f"[dim]{clock}[/] [{style}]{rec['level']}[/]: {escape(rec['msg'])}",
+                               highlight=False, soft_wrap=True)
+        else:
+            self.out.write(f"{clock} {rec['level']}: {rec['msg']}\n")
+            self.out.flush()
+        sink = self.json_sink
+        if sink is not None:
+            try:
+                sink.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            except ValueError:
+                # stop() 与同步写入竞争时文件可能刚被关闭
+                pass
+
+    def stop(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout=2)
+        if self.json_sink is not None and self.json_sink is not sys.stderr:
+            self.json_sink.close()
+            # 退出阶段之后仍可能有日志（其它 atexit 钩子、守护线程），不再写入已关闭的文件
+            self.json_sink = None
+
+
+def _make_console():
+    try:
+        from rich.console import Console
+        from rich.traceback import install
+    except ImportError:
+        return None
+    install(show_locals=False)
+    return Console()
+
+
+_writer: Optional[_Writer] = None
+_writer_lock = threading.Lock()
+_console = None
+
+
+def _get_writer() -> _Writer:
+    global _writer
+    w = _writer
+    # fork 出的子进程没有写线程，需要重新创建
+    if w is None or w.pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                _writer = _Writer()
+                atexit.register(_writer.stop)
+            w = _writer
+    return w
+
+
+def get_console():
+    """终端渲染用的 rich Console：优先复用日志写线程的实例；日志未使用 rich 时另建一个，不改变日志的输出方式。"""
+    global _console
+    w = _get_writer()
+    if w.console is not None:
+        return w.console
+    with _writer_lock:
+        if _console is None:
+            _console = _make_console()
+    return _console
+
+
+def __getattr__(name: str):
+    if name == "console":
+        return get_console()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _emit(level: str, msg: str) -> None:
+    w = _get_writer()
+    if LEVELS[level] < w.level:
+        return
+    rec: Dict[str, Any] = {"ts": time.time(), "level": level, "msg": str(msg),
+                           "thread": threading.current_thread().name}
+    if w.json_sink is not None:
+        from .metrics import current_tags
+        rec.update(current_tags())
+    if w.thread.is_alive():
+        w.queue.put(rec)
+    else:
+        # 写线程已在退出阶段停止：直接同步输出
+        w._write(rec)
+
+
+def flush(timeout: float = 5.0) -> None:
+    """等待已排队的日志全部输出（如在打印最终结果或退出前）。"""
+    w = _writer
+    if w is None or not w.thread.is_alive():
+        return
+    deadline = time.monotonic() + timeout
+    while w.queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def set_level(level: str) -> None:
+    _get_writer().level = LEVELS.get(level.upper(), 20)
+
+
+def debug(msg: str):
+    _emit("DEBUG", msg)
 
 
 def info(msg: str):
-    console.log(f"[bold cyan]INFO[/]: {msg}")
+    _emit("INFO", msg)
 
 
 def warn(msg: str):
-    console.log(f"[bold yellow]WARN[/]: {msg}")
+    _emit("WARN", msg)
 
 
 def error(msg: str):
-    console.log(f"[bold red]ERROR[/]: {msg}")
+    _emit("ERROR", msg)
 
 
 def success(msg: str):
-    console.log(f"[bold green]OK[/]: {msg}")
+    _emit("OK", msg)
 
 
 class Step:
@@ -29,4 +183,3 @@ class Step:
 
     def done(self, extra: str = ""):
         success(f"✔ {self.title} {extra}")
-
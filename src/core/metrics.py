@@ -0,0 +1,131 @@
+from __future__ import annotations
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from .logger import warn
+
+# 当前调用上下文的标签（agent / task_id / mode），随线程与协程上下文传递
+_tags: ContextVar[Dict[str, str]] = ContextVar("llm_tags", default={})
+
+
+@contextmanager
+def tagged(**tags: str) -> Iterator[None]:
+    """在此上下文内发起的 LLM 调用都会带上给定标签，嵌套时合并。"""
+    token = _tags.set({**_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> Dict[str, str]:
+    return dict(_tags.get())
+
+
+class Recorder:
+    """
+    记录每次 LLM 调用的 token 用量、耗时、重试次数与缓存状态，并可同步写入 JSON-lines 跟踪文件。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+        self.trace_path: Optional[Path] = None
+
+    def set_trace_file(self, path: str | Path | None) -> None:
+        self.trace_path = Path(path) if path else None
+        if self.trace_path is not None:
+            self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+            self.trace_path.write_text("", encoding="utf-8")
+
+    def record(self, kind: str, **fields: Any) -> Dict[str, Any]:
+        rec = {"kind": kind, "ts": time.time(), **current_tags(), **fields}
+        with self._lock:
+            self.records.append(rec)
+            if self.trace_path is not None:
+                try:
+                    with open(self.trace_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+                except OSError as e:
+                    warn(f"写入跟踪文件失败：{e}")
+        return rec
+
+    def record_call(self, *, model: str, prompt_tokens: int, completion_tokens: int, wall_s: float,
+                    retries: int, cache: str, stream: bool = False, ok: bool = True,
+                    estimated: bool = False, cached_tokens: int = 0) -> Dict[str, Any]:
+        return self.record(
+            "llm", model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            wall_s=round(wall_s, 4), retries=retries, cache=cache, stream=stream, ok=ok, estimated=estimated,
+            cached_tokens=cached_tokens,
+        )
+
+    def calls(self) -> List[Dict[str, Any]]:
+        return self.events("llm")
+
+    def events(self, kind: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [r for r in self.records if r["kind"] == kind]
+
+    def summary(self) -> Dict[str, Any]:
+        # 缓存命中没有真正发出请求：不计入调用次数与 token，单独统计节省的 token
+        records = self.calls()
+        hits = [r for r in records if r["cache"] == "hit"]
+        calls = [r for r in records if r["cache"] != "hit"]
+        tests = self.events("test")
+        return {
+            "calls": len(calls),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in calls),
+            "completion_tokens": sum(r["completion_tokens"] for r in calls),
+            "wall_s": sum(r["wall_s"] for r in calls),
+            "retries": sum(r["retries"] for r in calls),
+            "cache_hits": len(hits),
+            "cached_tokens": sum(r.get("cached_tokens", 0) for r in hits),
+            "by_agent_mode": _aggregate(calls, lambda r: f"{r.get('agent', '-')}/{r.get('mode', '-')}"),
+            "by_task": _aggregate(calls, lambda r: str(r.get("task_id", "-"))),
+            "tests": len(tests),
+            "test_s": sum(r.get("duration_s", 0.0) for r in tests),
+            "fix_rounds": len(self.events("fix_round")),
+        }
+
+    def report(self, top: int = 5) -> List[str]:
+        s = self.summary()
+        lines = [
+            f"LLM 调用 {s['calls']} 次，prompt {s['prompt_tokens']} / completion {s['completion_tokens']} tokens，"
+            f"累计耗时 {s['wall_s']:.1f}s，重试 {s['retries']} 次，缓存命中 {s['cache_hits']} 次"
+            f"（节省 {s['cached_tokens']} tokens）"
+        ]
+        if s["tests"] or s["fix_rounds"]:
+            lines.append(f"  校验 {s['tests']} 次，耗时 {s['test_s']:.1f}s，修复 {s['fix_rounds']} 轮")
+        for name, g in sorted(s["by_agent_mode"].items(), key=lambda kv: -kv[1]["wall_s"]):
+            lines.append(f"  {name}: {int(g['calls'])} 次，{int(g['prompt_tokens'])}+{int(g['completion_tokens'])} tokens，"
+                         f"{g['wall_s']:.1f}s")
+        tasks = sorted(s["by_task"].items(), key=lambda kv: -kv[1]["wall_s"])[:top]
+        if tasks:
+            lines.append("  耗时最多的任务：")
+            for name, g in tasks:
+                lines.append(f"    {name}: {int(g['calls'])} 次，{int(g['prompt_tokens'] + g['completion_tokens'])} tokens，"
+                             f"{g['wall_s']:.1f}s")
+        return lines
+
+
+def _aggregate(calls: List[Dict[str, Any]], key: Callable[[Dict[str, Any]], str]) -> Dict[str, Dict[str, float]]:
+    out: Dict[str, Dict[str, float]] = {}
+    for r in calls:
+        g = out.setdefault(key(r), {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "wall_s": 0.0})
+        g["calls"] += 1
+        g["prompt_tokens"] += r["prompt_tokens"]
+        g["completion_tokens"] += r["completion_tokens"]
+        g["wall_s"] += r["wall_s"]
+    return out
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：约 4 个字符一个 token
+    return max(1, len(text) // 4) if text else 0
+
+
+recorder = Recorder()
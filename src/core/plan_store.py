@@ -0,0 +1,69 @@
+from __future__ import annotations
+import os
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from . import config
+from .incremental import hash_text
+from .logger import warn
+
+
+def normalize_goal(goal: str) -> str:
+    # 忽略空白与大小写差异：仅格式不同的目标视为同一目标
+    return " ".join(goal.split()).casefold()
+
+
+class PlanStore:
+    """
+    以（规范化目标, output_dir）为键保存通过校验的计划，位于 <state_dir>/plans.json。
+    计划以 TaskItem 字典列表保存；同时记录每个 output_dir 最近一次的计划，供规划失败时复用其结构。
+    """
+
+    def __init__(self, path: Path | None = None):
+        if path is None:
+            runtime = config.get_runtime()
+            path = Path(runtime.workspace_root) / runtime.state_dir / "plans.json"
+        self.path = path
+        self._lock = threading.Lock()
+        self.records: Dict[str, Dict[str, Any]] = {}
+        try:
+            self.records = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            warn(f"计划缓存读取失败，将重新规划：{e}")
+
+    @staticmethod
+    def key(goal: str, output_dir: str) -> str:
+        return hash_text(json.dumps([normalize_goal(goal), output_dir.strip("/\\")], ensure_ascii=False))
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            rec = self.records.get(key)
+        return rec["tasks"] if rec else None
+
+    def latest(self, output_dir: str) -> Optional[List[Dict[str, Any]]]:
+        """同一 output_dir 下最近保存的计划（不论目标）。"""
+        out = output_dir.strip("/\\")
+        with self._lock:
+            recs = [r for r in self.records.values() if r.get("output_dir") == out]
+        return max(recs, key=lambda r: r.get("created_at", 0))["tasks"] if recs else None
+
+    def put(self, key: str, goal: str, output_dir: str, tasks: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.records[key] = {"goal": goal, "output_dir": output_dir.strip("/\\"),
+                                 "created_at": time.time(), "tasks": tasks}
+            self._save()
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.records, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            warn(f"计划缓存写入失败：{e}")
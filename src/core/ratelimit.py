@@ -0,0 +1,159 @@
+from __future__ import annotations
+import time
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+
+class TokenBucket:
+    """每分钟 rate 个令牌的令牌桶；rate<=0 表示不限速。允许透支，透支部分以等待时间偿还。"""
+
+    def __init__(self, rate_per_min: float, capacity: float | None = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n: float, now: float) -> float:
+        """扣除 n 个令牌，返回需要等待的秒数。"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        self.tokens -= n
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        # 实际用量与预估的差额：多退少补
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析时返回 None。"""
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Slot:
+    def __init__(self, limiter: "RateLimiter", est_tokens: int, waited: float):
+        self.limiter = limiter
+        self.est_tokens = est_tokens
+        self.waited = waited
+        self.throttled = False
+        self.succeeded = False
+        self.timed_out = False
+
+    def used(self, tokens: int) -> None:
+        """请求成功后报告实际 token 用量；只有调用过 used() 的请求才计为成功。"""
+        self.succeeded = True
+        self.limiter._settle(tokens - self.est_tokens)
+
+    def throttle(self, retry_after: Optional[float]) -> float:
+        """收到 429/503：暂停所有请求并收缩并发上限，返回建议等待秒数。"""
+        self.throttled = True
+        return self.limiter._throttle(retry_after)
+
+
+class RateLimiter:
+    """
+    客户端限流：请求数/分钟与 token 数/分钟两个令牌桶，加上自适应并发上限（AIMD）。
+    - 成功请求（调用了 slot.used()）使并发上限缓慢增加（每个成功 +1/limit），直到 max_concurrency
+    - 429/503 使上限减半，并在 Retry-After（或指数退避）期间暂停所有新请求
+    - 超时（timeout_errors 中的异常）同样使上限减半，但不暂停；其它失败不改变上限
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrency: int = 4, min_concurrency: int = 1,
+                 timeout_errors: Tuple[type, ...] = (TimeoutError,)):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._blocked_until = 0.0
+        self._penalty = 1.0
+        self.timeout_errors = timeout_errors
+        self.stats: Dict[str, float] = {"requests": 0, "throttled": 0, "timeouts": 0, "wait_s": 0.0,
+                                        "max_queue_depth": 0}
+
+    @contextmanager
+    def slot(self, est_tokens: int = 0) -> Iterator[Slot]:
+        started = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._waiting)
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    self._cond.wait(self._blocked_until - now)
+                elif self._in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self._waiting -= 1
+            self._in_flight += 1
+            now = time.monotonic()
+            delay = max(self.requests.reserve(1, now), self.tokens.reserve(est_tokens, now))
+        slot = Slot(self, est_tokens, 0.0)
+        # 已占用并发名额：等待期间被中断也要在 finally 中归还
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            slot.waited = time.monotonic() - started
+            yield slot
+        except self.timeout_errors:
+            slot.timed_out = True
+            raise
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self.stats["requests"] += 1
+                self.stats["wait_s"] += slot.waited
+                if slot.throttled:
+                    pass
+                elif slot.timed_out:
+                    self.stats["timeouts"] += 1
+                    self._decrease()
+                elif slot.succeeded:
+                    self.limit = min(float(self.max_concurrency), self.limit + 1.0 / max(self.limit, 1.0))
+                    self._penalty = 1.0
+                self._cond.notify_all()
+
+    def _settle(self, delta: int) -> None:
+        with self._cond:
+            self.tokens.adjust(delta)
+
+    def _throttle(self, retry_after: Optional[float]) -> float:
+        with self._cond:
+            self.stats["throttled"] += 1
+            self._decrease()
+            wait_s = retry_after if retry_after is not None else self._penalty
+            self._penalty = min(self._penalty * 2, 60.0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait_s)
+            self._cond.notify_all()
+            return wait_s
+
+    def _decrease(self) -> None:
+        # 调用方持有 self._cond
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._cond:
+            return {**self.stats, "queue_depth": self._waiting, "in_flight": self._in_flight,
+                    "concurrency_limit": round(self.limit, 2)}
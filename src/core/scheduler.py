@@ -0,0 +1,97 @@
+from __future__ import annotations
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+from .logger import warn
+
+
+class FileLocks:
+    """
+    按路径分配的写锁：同一文件同一时刻只允许一个任务修改。
+    多个路径按排序后的顺序加锁，避免死锁。
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        key = path.replace("\\", "/").lstrip("/")
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def hold(self, paths: Iterable[str]) -> Iterator[None]:
+        keys = sorted({p.replace("\\", "/").lstrip("/") for p in paths if p})
+        locks = [self._lock_for(k) for k in keys]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+def run_dag(
+    order: Sequence[str],
+    deps: Dict[str, List[str]],
+    worker: Callable[[str], None],
+    max_workers: int = 4,
+) -> List[str]:
+    """
+    DAG 调度：每个任务在其 deps 全部完成后立即开始。
+    - order: 拓扑序（决定同时就绪任务的启动优先级）
+    - deps: 任务 id -> 依赖 id 列表（未知依赖会被忽略）
+    - 若出现环/无法满足的依赖，在没有任务运行时按 order 依次强制放行
+    - 任一任务抛出异常后停止调度新任务，等待运行中的任务结束后重新抛出
+    返回按完成顺序排列的任务 id。
+    """
+    known = set(order)
+    pending: Dict[str, set] = {
+        tid: {d for d in deps.get(tid, []) if d in known and d != tid} for tid in order
+    }
+    rank = {tid: i for i, tid in enumerate(order)}
+    done: List[str] = []
+    running: Dict[Future, str] = {}
+    failure: Tuple[str, BaseException] | None = None
+
+    def ready() -> List[str]:
+        return sorted((tid for tid, rest in pending.items() if not rest), key=rank.__getitem__)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="task") as pool:
+        while pending or running:
+            if failure is None:
+                batch = ready()
+                if not batch and not running and pending:
+                    forced = min(pending, key=rank.__getitem__)
+                    warn(f"Cycle/unresolved deps detected. Forcing task '{forced}' to run.")
+                    pending[forced] = set()
+                    batch = [forced]
+                for tid in batch:
+                    if len(running) >= max(1, max_workers):
+                        break
+                    del pending[tid]
+                    running[pool.submit(worker, tid)] = tid
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                tid = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    if failure is None:
+                        failure = (tid, exc)
+                    continue
+                done.append(tid)
+                for rest in pending.values():
+                    rest.discard(tid)
+
+    if failure is not None:
+        raise failure[1]
+    return done
@@ -1,8 +1,7 @@
 from __future__ import annotations
 import argparse
 from pathlib import Path
-from .orchestrator import Orchestrator
-from .core.logger import info, success, warn
+from .core.logger import flush, info, success, warn
 
 DEFAULT_GOAL_FILE = "prompts/arxiv_cs_daily_testcase_en.txt"
 PRESET_FILES = {
@@ -73,12 +72,47 @@ def main():
                         help="使用内置预设指令（skeleton/fetcher/builder），便于分步由 LLM 生成（可选）")
     parser.add_argument("--phased", action="store_true", help="启用编排分步模式（skeleton → fetcher → builder）")
     parser.add_argument("--auto-fix", action="store_true", help="启用自我纠错（阶段后运行校验与 Fixer 自动重写，最多2轮）")
+    parser.add_argument("--workers", "-j", type=int, default=None,
+                        help="并发执行的任务数（依赖满足即启动；默认取 MAX_WORKERS，1 为串行）")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="增量模式：跳过未变化且上次测试通过的任务，已通过测试的文件不再生成骨架")
+    parser.add_argument("--resume", action="store_true",
+                        help="从上次运行的检查点继续（复用已保存的计划与已完成任务，不再调用 Planner）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略 LLM 结果缓存（仍会写入新结果）")
+    parser.add_argument("--trace", default=None, help="将每次 LLM 调用的用量与耗时写入 JSON-lines 文件（默认取 TRACE_FILE）")
     args = parser.parse_args()
 
+    # 重量级依赖（pydantic/requests/rich 与配置加载）推迟到参数解析之后，--help 等无需付出导入开销
+    from .orchestrator import Orchestrator
+    from .core.llm import client
+    from .core.config import runtime
+    from .core.metrics import recorder
+    from .tools import fs
+
+    if args.no_cache:
+        client.cache.bypass = True
+    trace_file = args.trace or runtime.trace_file
+    if trace_file:
+        recorder.set_trace_file(trace_file)
     goal = resolve_goal(args.goal, args.goal_file, args.preset)
-    orch = Orchestrator(phased=args.phased, auto_fix=args.auto_fix)
-    state = orch.run(goal)
+    orch = Orchestrator(phased=args.phased, auto_fix=args.auto_fix, max_workers=args.workers,
+                        incremental=args.incremental)
+    state = orch.run(goal, resume=args.resume)
+    # 先输出排队中的任务日志，避免与下面的汇总交错
+    flush()
     success(f"完成。已执行任务: {len(state.completed_tasks)}，迭代次数: {state.iteration}")
+    stats = client.cache.stats()
+    info(f"LLM 缓存：命中 {stats['hits']}，未命中 {stats['misses']}，写入 {stats['writes']}，淘汰 {stats['evictions']}")
+    for line in recorder.report():
+        info(line)
+    lim = client.limiter.metrics()
+    info(f"LLM 限流：请求 {int(lim['requests'])} 次，被限流 {int(lim['throttled'])} 次，超时 {int(lim['timeouts'])} 次，排队累计 {lim['wait_s']:.1f}s，"
+         f"最大排队 {int(lim['max_queue_depth'])}，当前并发上限 {lim['concurrency_limit']}")
+    fs_stats = fs.stats()
+    info(f"文件覆盖层：读取 {fs_stats['reads']} 次（磁盘 {fs_stats['disk_reads']} 次），写入 {fs_stats['writes']} 次，落盘 {fs_stats['flushed']} 次")
+    if trace_file:
+        info(f"调用跟踪已写入：{trace_file}")
+    flush()
 
 
 if __name__ == "__main__":
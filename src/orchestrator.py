@@ -1,11 +1,19 @@
 from __future__ import annotations
-from typing import Dict, List
-from .agents.protocols import OrchestratorState, TaskItem, Plan
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from .agents.protocols import OrchestratorState, TaskItem, Plan, CodeChange, CoderOutput
 from .agents import planner, coder
 from .agents import fixer as fixer_agent
 from .agents import tester
 from .core.logger import info, warn
-from .core.config import runtime
+from .core import config
+from .core.scheduler import FileLocks, run_dag
+from .core.incremental import IncrementalStore, hash_file, hash_files
+from .core.journal import RunJournal
+from .core.metrics import tagged, recorder
+from .tools import fs
 def topo_order(tasks: List[TaskItem]) -> List[str]:
     """
     Kahn topo sort (stable):
@@ -49,7 +57,7 @@ def topo_order(tasks: List[TaskItem]) -> List[str]:
     return ordered
 
 def make_phased_plan() -> Plan:
-    prefix = f"{runtime.output_dir}/arxiv_cs_daily"
+    prefix = f"{config.get_runtime().output_dir}/arxiv_cs_daily"
     tasks = [
         TaskItem(
             id="phase-index-html",
@@ -95,23 +103,23 @@ def make_phased_plan() -> Plan:
     return Plan(tasks=tasks)
 
 class Orchestrator:
-    def __init__(self, phased: bool = False, auto_fix: bool = False):
+    def __init__(self, phased: bool = False, auto_fix: bool = False, max_workers: int | None = None,
+                 incremental: bool | None = None):
         self.state = OrchestratorState(goal="", iteration=0, max_iterations=3)
         self.phased = phased
         self.auto_fix = auto_fix
+        self.max_workers = max(1, max_workers if max_workers is not None else config.get_runtime().max_workers)
+        self.file_locks = FileLocks()
+        self._state_lock = threading.Lock()
+        use_incremental = config.get_runtime().incremental if incremental is None else incremental
+        self.store: IncrementalStore | None = IncrementalStore() if use_incremental else None
+        self.journal = RunJournal()
+        self._fingerprints: Dict[str, str] = {}
 
     def _pick_file_to_fix(self, t: "TaskItem") -> str | None:
-        tc = (t.test_command or "").strip()
-
-        if tc.startswith("py_compile:"):
-            return tc.replace("py_compile:", "", 1).strip()
-
-        if tc.startswith("assert_contains:"):
-            rest = tc.replace("assert_contains:", "", 1)
-            return rest.split(":", 1)[0].strip()
-
-        if tc.startswith("assert_exists:"):
-            return tc.replace("assert_exists:", "", 1).strip()
+        target = tester.parse_test_command((t.test_command or "").strip()).target
+        if target:
+            return target
 
         if t.target_files:
             return t.target_files[0]
@@ -119,6 +127,17 @@ class Orchestrator:
         return None
 
     def _test_and_fix(self, goal: str, file_to_test: str, test_command: str, max_rounds: int = 2) -> bool:
+        if config.get_runtime().speculative_fixes > 1:
+            success, output = tester.run_test(test_command)
+            if success:
+                info(f"Test passed for {file_to_test}.")
+                return True
+            warn(f"Test failed for {file_to_test}. Trying {config.get_runtime().speculative_fixes} fix candidates in parallel. Error:\n{output}")
+            recorder.record("fix_round", file=file_to_test, round=0, speculative=True)
+            if self._speculative_fix(goal, file_to_test, test_command, output):
+                return True
+            warn(f"No fix candidate passed for {file_to_test}, continuing with sequential fix rounds.")
+
         for i in range(max_rounds):
             success, output = tester.run_test(test_command)
             if success:
@@ -126,6 +145,7 @@ class Orchestrator:
                 return True
             
             warn(f"Test failed for {file_to_test} (Round {i+1}/{max_rounds}). Error:\n{output}")
+            recorder.record("fix_round", file=file_to_test, round=i + 1)
             fixer_agent.fix_file(goal, file_to_test, output, minimal_fix=(i == max_rounds - 1))
         
         success, final_output = tester.run_test(test_command)
@@ -133,41 +153,148 @@ class Orchestrator:
             warn(f"Auto-fix failed for {file_to_test} after {max_rounds} rounds. Final error:\n{final_output}")
         return success
 
-    def run(self, goal: str) -> OrchestratorState:
-        self.state.goal = goal
-        plan = make_phased_plan() if self.phased else planner.create_plan(goal)
-        self.state.plan = plan
-        order = topo_order(plan.tasks)
-        info(f"Executing plan: {len(order)} tasks in order: {order}")
+    @staticmethod
+    def _fix_variants(k: int) -> List[Tuple[Optional[float], bool]]:
+        """
+        推测式修复的候选配置 (temperature, minimal_fix)，按优先级排列：
+        默认温度的完整修复、逐步升温的完整修复，最后是最小化骨架修复。
+        """
+        variants: List[Tuple[Optional[float], bool]] = [(None, False)]
+        for step in range(1, k - 1):
+            variants.append((min(1.0, config.get_llm_config().temperature + 0.3 * step), False))
+        variants.append((None, True))
+        return variants[:k]
 
-        for tid in order:
-            t = next((task for task in plan.tasks if task.id == tid), None)
-            if not t: continue
+    def _speculative_fix(self, goal: str, file_to_test: str, test_command: str, error_output: str) -> bool:
+        """
+        并发生成多个修复候选并全部检验，采用优先级最高的通过者。
+        只依赖文件内容的检查在草稿副本中并行执行；需要运行脚本的检查按优先级就地逐个检验。
+        没有候选通过时保留第一个候选，交给后续的顺序修复轮次。
+        """
+        variants = self._fix_variants(config.get_runtime().speculative_fixes)
 
-            info(f"--- Running Task: {tid} ---")
-            
-            info("Stage 1: Generating skeleton...")
-            target_files = list(t.target_files) if t.target_files else [None]
+        def propose(variant: Tuple[Optional[float], bool]) -> Optional[str]:
+            temperature, minimal = variant
+            with tagged(agent="fixer", mode="speculative"):
+                return fixer_agent.propose_fix(goal, file_to_test, error_output, minimal_fix=minimal,
+                                               temperature=temperature)
+
+        with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, propose, v) for v in variants]
+            proposed = [f.result() for f in futures]
+        # 去掉空结果与重复内容，保持优先级顺序
+        candidates = list(dict.fromkeys(c for c in proposed if c))
+        if not candidates:
+            return False
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+            scratch = list(pool.map(lambda c: tester.run_candidate(test_command, file_to_test, c), candidates))
+
+        winner: Optional[int] = None
+        if all(r is not None for r in scratch):
+            winner = next((i for i, r in enumerate(scratch) if r[0]), None)
+            if winner is not None:
+                self._write_fix(file_to_test, candidates[winner])
+        else:
+            check = tester.parse_test_command(test_command)
+            for i, content in enumerate(candidates):
+                # 就地试写：未通过的候选回滚到原内容
+                trial = fs.snapshot([file_to_test])
+                self._write_fix(file_to_test, content)
+                if check.run()[0]:
+                    fs.commit(trial)
+                    winner = i
+                    break
+                fs.rollback(trial)
+
+        recorder.record("speculative_fix", file=file_to_test, candidates=len(candidates),
+                        winner=-1 if winner is None else winner)
+        if winner is None:
+            self._write_fix(file_to_test, candidates[0])
+            return False
+        info(f"Fix candidate {winner + 1}/{len(candidates)} passed for {file_to_test}.")
+        return True
+
+    @staticmethod
+    def _write_fix(path: str, content: str) -> None:
+        fixer_agent.apply_fixer_output(CoderOutput(changes=[CodeChange(path=path, content=content, overwrite=True)]))
+
+    def _locked_files(self, t: TaskItem) -> List[str]:
+        # 与 coder 的路径归一化保持一致，保证同一文件映射到同一把锁
+        files = list(t.target_files) or [coder._extract_path_from_desc(t.desc)]
+        files.append(self._pick_file_to_fix(t))
+        prefix = f"{config.get_runtime().output_dir}/"
+        locked: List[str] = []
+        for fp in files:
+            if not fp:
+                continue
+            fp = fp.replace("\\", "/").lstrip("/")
+            locked.append(fp if fp.startswith(prefix) else prefix + fp)
+        return locked
+
+    def _fingerprint(self, goal: str, t: TaskItem, by_id: Dict[str, TaskItem]) -> str:
+        # 上游以任务指纹而非产物的当前哈希参与计算：共享目标文件的任务会互相改写对方的产物
+        fp = self._fingerprints.get(t.id)
+        if fp is None:
+            self._fingerprints[t.id] = ""  # 环依赖时避免无限递归
+            upstream = {dep: self._fingerprint(goal, by_id[dep], by_id) for dep in t.deps if dep in by_id}
+            fp = IncrementalStore.fingerprint(goal, t.desc, t.target_files, t.test_command, upstream)
+            self._fingerprints[t.id] = fp
+        return fp
 
+    def _passes(self, t: TaskItem) -> bool:
+        files = self._locked_files(t)
+        if not files or any(hash_file(fp) is None for fp in files):
+            return False
+        return not t.test_command or tester.run_test(t.test_command)[0]
+
+    def _batched(self, t: TaskItem) -> bool:
+        # 多目标文件任务按 BATCH_MODE 批量生成
+        return len(t.target_files or []) > 1 and config.get_runtime().batch_mode in ("single", "concurrent")
+
+    def _run_task(self, goal: str, t: TaskItem, by_id: Dict[str, TaskItem] | None = None) -> bool:
+        tid = t.id
+        fingerprint = ""
+        if self.store is not None:
+            fingerprint = self._fingerprint(goal, t, by_id or {})
+            if self.store.is_fresh(tid, fingerprint, self._locked_files(t)):
+                info(f"--- Skipping Task: {tid} (unchanged since last passing run) ---")
+                recorder.record("task", skipped=True)
+                return True
+        recorder.record("task", skipped=False)
+
+        info(f"--- Running Task: {tid} ---")
+        target_files = list(t.target_files) if t.target_files else [None]
+        file_to_fix = self._pick_file_to_fix(t)
+
+        # 增量模式下，目标文件已存在且通过测试时无需再生成骨架
+        if self.store is not None and self._passes(t):
+            info("Stage 1: Skipped (existing files already pass their test).")
+        else:
             info("Stage 1: Generating skeleton...")
-            for fp in target_files:
-                if fp is None:
-                    coder.implement(goal, t.desc, mode="skeleton")
-                    continue
-                desc_for_file = f"Update `{fp}`.\n\n{t.desc}"
-                coder.implement(goal, desc_for_file, mode="skeleton")
+            if self._batched(t):
+                coder.implement_many(goal, t.desc, t.target_files, mode="skeleton")
+            else:
+                for fp in target_files:
+                    if fp is None:
+                        coder.implement(goal, t.desc, mode="skeleton")
+                        continue
+                    desc_for_file = f"Update `{fp}`.\n\n{t.desc}"
+                    coder.implement(goal, desc_for_file, mode="skeleton")
 
-            file_to_fix = self._pick_file_to_fix(t)
             if self.auto_fix and t.test_command and file_to_fix:
                 self._test_and_fix(goal, file_to_fix, t.test_command)
 
-            info("Stage 2: Generating full implementation...")
-            fill_desc = (
-                f"Task: {t.desc}\n"
-                f"Target files: {t.target_files}\n"
-                "Read the current file content and fill in the complete implementation."
-            )
+        info("Stage 2: Generating full implementation...")
+        fill_desc = (
+            f"Task: {t.desc}\n"
+            f"Target files: {t.target_files}\n"
+            "Read the current file content and fill in the complete implementation."
+        )
 
+        if self._batched(t):
+            coder.implement_many(goal, fill_desc, t.target_files, mode="full")
+        else:
             for fp in target_files:
                 if fp is None:
                     coder.implement(goal, fill_desc, mode="full")
@@ -175,20 +302,141 @@ class Orchestrator:
                 fill_desc_for_file = f"Update `{fp}`.\n\n{fill_desc}"
                 coder.implement(goal, fill_desc_for_file, mode="full")
 
-            if self.auto_fix and t.test_command and file_to_fix:
-                if not self._test_and_fix(goal, file_to_fix, t.test_command):
+        passed = True
+        if t.test_command:
+            if self.auto_fix and file_to_fix:
+                passed = self._test_and_fix(goal, file_to_fix, t.test_command)
+                if not passed:
                     warn(f"Final implementation for {file_to_fix} is still invalid.")
+            elif self.store is not None:
+                passed = tester.run_test(t.test_command)[0]
+
+        if self.store is not None:
+            fs.flush()
+            self.store.record(tid, fingerprint, self._locked_files(t), passed)
+        return passed
+
+    def _verify_all(self, goal: str, tasks: List[TaskItem]) -> Set[str]:
+        """
+        最终构建前并行复检所有任务的 test_command，捕获后续任务引入的回归。
+        返回修复后仍未通过的任务 id（同一命令的所有任务一并计入）。
+        """
+        checks: Dict[str, List[TaskItem]] = {}
+        for t in tasks:
+            if t.test_command:
+                checks.setdefault(t.test_command, []).append(t)
+        if not checks:
+            return set()
+        info(f"--- Re-verifying {len(checks)} task checks ---")
+        results = tester.run_tests(list(checks))
+        failed = [r for r in results if not r.success]
+        if not failed:
+            info("All task checks still pass.")
+            return set()
+        still_failing: Set[str] = set()
+        for r in failed:
+            t = checks[r.command][0]
+            warn(f"Regression in task '{t.id}': {r.command}\n{r.output}")
+            file_to_fix = self._pick_file_to_fix(t)
+            fixed = False
+            if self.auto_fix and file_to_fix:
+                with self.file_locks.hold([file_to_fix]), tagged(task_id=t.id):
+                    fixed = self._test_and_fix(goal, file_to_fix, r.command)
+            if not fixed:
+                still_failing.update(task.id for task in checks[r.command])
+        return still_failing
+
+    def _resume_point(self, plan: Plan, done: Dict[str, Dict]) -> List[str]:
+        """
+        按拓扑序确定哪些任务可以跳过（done 按日志中的完成顺序排列）：
+        - 每个文件以日志中最后一次记录的哈希为准（共享文件会被后完成的任务改写）
+        - 未完成、或其文件与该哈希不一致的任务需要重跑
+        - 重跑任务的下游依赖，以及拓扑序在其后、与其共享目标文件的任务也要重跑，
+          否则重跑会覆盖它们已写入的内容
+        """
+        expected: Dict[str, Optional[str]] = {}
+        for rec in done.values():
+            expected.update(rec["files"])
+        current = hash_files(expected)
+
+        rerun: set = set()
+        rerun_files: set = set()
+        completed: List[str] = []
+        by_id: Dict[str, TaskItem] = {}
+        for t in plan.tasks:
+            by_id.setdefault(t.id, t)
+        for tid in topo_order(plan.tasks):
+            rec = done.get(tid)
+            files = set(rec["files"]) if rec else set(self._locked_files(by_id[tid]))
+            if rec is None:
+                reason = None
+            elif any(current.get(fp) != expected.get(fp) for fp in rec["files"]):
+                reason = "outputs changed since checkpoint"
+            elif any(dep in rerun for dep in by_id[tid].deps):
+                reason = "an upstream task is re-run"
+            elif files & rerun_files:
+                reason = "it shares files with a re-run task"
+            else:
+                if tid not in completed:
+                    completed.append(tid)
+                continue
+            if reason:
+                warn(f"Task '{tid}' will be re-run: {reason}.")
+            rerun.add(tid)
+            rerun_files |= files
+        return completed
+
+    def run(self, goal: str, resume: bool = False) -> OrchestratorState:
+        plan: Plan | None = None
+        already_done: List[str] = []
+        if resume:
+            last = self.journal.load()
+            if last is None:
+                warn("No run journal found, starting a fresh run.")
+            else:
+                goal = last["goal"]
+                plan = Plan.model_validate(last["plan"])
+                already_done = self._resume_point(plan, last["tasks"])
+                info(f"Resuming previous run: {len(already_done)}/{len(plan.tasks)} tasks already completed.")
+
+        self.state.goal = goal
+        self._fingerprints = {}
+        if plan is None:
+            plan = make_phased_plan() if self.phased else planner.create_plan(goal)
+            self.journal.start(goal, plan.model_dump(), self.phased)
+        self.state.plan = plan
+        self.state.completed_tasks.extend(already_done)
+        order = [tid for tid in topo_order(plan.tasks) if tid not in already_done]
+        info(f"Executing plan: {len(order)} tasks in order: {order} (workers={self.max_workers})")
 
+        # 同 id 的重复任务只执行第一个（与串行版本一致）
+        by_id: Dict[str, TaskItem] = {}
+        for task in plan.tasks:
+            by_id.setdefault(task.id, task)
+        deps = {tid: list(t.deps) for tid, t in by_id.items()}
+        if self.store is not None:
+            # 指纹只依赖计划本身，调度前一次算好，工作线程只读
+            for t in by_id.values():
+                self._fingerprint(goal, t, by_id)
 
-            if self.auto_fix and t.test_command:
-                if not self._test_and_fix(goal, t.target_files[0], t.test_command):
-                    warn(f"Final implementation for {t.target_files[0]} is still invalid.")
+        def worker(tid: str) -> None:
+            t = by_id.get(tid)
+            if not t:
+                return
+            with self.file_locks.hold(self._locked_files(t)), tagged(task_id=tid):
+                passed = self._run_task(goal, t, by_id)
+                # 指纹按磁盘内容计算：先落盘本任务的写入
+                fs.flush()
+                self.journal.task_done(tid, hash_files(self._locked_files(t)), passed)
+            with self._state_lock:
+                self.state.completed_tasks.append(tid)
 
-            self.state.completed_tasks.append(tid)
+        run_dag(order, deps, worker, max_workers=self.max_workers)
+        regressed = self._verify_all(goal, list(by_id.values()))
 
         info("--- Final Build and Test ---")
-        build_script_path = f"{runtime.output_dir}/arxiv_cs_daily/src/build_site.py"
-        papers_dir_path = f"{runtime.output_dir}/arxiv_cs_daily/papers"
+        build_script_path = f"{config.get_runtime().output_dir}/arxiv_cs_daily/src/build_site.py"
+        papers_dir_path = f"{config.get_runtime().output_dir}/arxiv_cs_daily/papers"
         # build_command = f"run_and_assert_file:py -3.12 {build_script_path}:{papers_dir_path}"
         build_command = f"run_and_assert_file:py {build_script_path}:{papers_dir_path}"
         
@@ -197,7 +445,14 @@ class Orchestrator:
             warn(f"Final build script failed to run or did not produce expected artifacts. Error:\n{output}")
             if self.auto_fix:
                 info("Attempting to fix the build script based on functional test failure...")
-                self._test_and_fix(goal, build_script_path, build_command)
+                with tagged(task_id="final-build"):
+                    self._test_and_fix(goal, build_script_path, build_command)
 
+        fs.flush()
+        if self.store is not None:
+            # 以本次运行结束时的文件内容为准：后续任务改写的共享文件不应使前面的任务在下次运行时失效
+            # 复检仍失败的任务标记为未通过，下次增量运行时重新执行
+            self.store.refresh({tid: self._locked_files(t) for tid, t in by_id.items()}, failed=regressed)
+        self.journal.finish()
         info("Orchestration finished. Please check the output in the 'project' directory.")
         return self.state
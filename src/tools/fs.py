@@ -1,40 +1,311 @@
 from __future__ import annotations
+import io
 import os
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
-from ..core.config import runtime
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from ..core import config
 from ..core.logger import info, warn, error
 
-ROOT = Path(runtime.workspace_root)
-
 
 def resolve_path(path: str) -> Path:
     p = Path(path)
     if not p.is_absolute():
-        p = ROOT / p
+        p = Path(config.get_runtime().workspace_root) / p
     return p
 
 
+def _stat(p: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _replace_on_disk(p: Path, content: Optional[str]) -> None:
+    # content 为 None 表示删除
+    if content is None:
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        return
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, p)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Snapshot:
+    """覆盖层快照：只记录快照之后首次被写入的路径及其原内容（copy-on-write）。"""
+
+    def __init__(self, paths: Optional[Iterable[Path]] = None):
+        self.paths = None if paths is None else set(paths)
+        self.undo: Dict[Path, Optional[str]] = {}
+
+    def covers(self, p: Path) -> bool:
+        return self.paths is None or p in self.paths
+
+
+class Overlay:
+    """
+    工作区的内存覆盖层：
+    - 读：按路径缓存文件内容，以 (mtime_ns, size) 判断磁盘文件是否被外部修改
+    - 写：write_back 时只记入内存（脏文件），flush 时以临时文件 + os.replace 原子落盘；否则直接原子写盘
+    - 快照：snapshot 之后的写入可以 rollback 到快照时的内容，commit 则落盘
+    """
+
+    def __init__(self, write_back: bool = True):
+        self.write_back = write_back
+        self._lock = threading.RLock()
+        self._clean: Dict[Path, Tuple[Tuple[int, int], str]] = {}
+        self._dirty: Dict[Path, Optional[str]] = {}
+        self._snapshots: List[Snapshot] = []
+        self.stats = {"reads": 0, "disk_reads": 0, "writes": 0, "flushed": 0}
+
+    def read(self, p: Path) -> Optional[str]:
+        # 锁只保护缓存表；stat 与读盘在锁外进行，各线程的磁盘读取互不阻塞
+        with self._lock:
+            self.stats["reads"] += 1
+            if p in self._dirty:
+                return self._dirty[p]
+            hit = self._clean.get(p)
+        sig = _stat(p)
+        if sig is not None and hit is not None and hit[0] == sig:
+            return hit[1]
+        content = None
+        if sig is not None:
+            try:
+                content = p.read_text(encoding="utf-8", errors="ignore")
+            except OSError:
+                sig = None
+        with self._lock:
+            # 读盘期间可能有并发写入，以内存中的新内容为准
+            if p in self._dirty:
+                return self._dirty[p]
+            if sig is None:
+                self._clean.pop(p, None)
+                return None
+            self.stats["disk_reads"] += 1
+            # 先 stat 后读：读取期间文件若被改动，下次读取时签名不符会重新读盘
+            self._clean[p] = (sig, content)
+            return content
+
+    def exists(self, p: Path) -> bool:
+        with self._lock:
+            if p in self._dirty:
+                return self._dirty[p] is not None
+        return p.exists()
+
+    def signature(self, p: Path) -> Tuple:
+        """文件状态签名：未落盘的内容按内容哈希，否则按磁盘 mtime/大小。"""
+        with self._lock:
+            if p in self._dirty:
+                content = self._dirty[p]
+                return (str(p), "mem", None if content is None else hash(content))
+        return (str(p),) + (_stat(p) or (None,))
+
+    def write(self, p: Path, content: Optional[str]) -> None:
+        with self._lock:
+            self._remember(p)
+            self.stats["writes"] += 1
+            self._set(p, content)
+
+    def _set(self, p: Path, content: Optional[str]) -> None:
+        if self.write_back:
+            self._dirty[p] = content
+            return
+        _replace_on_disk(p, content)
+        self._dirty.pop(p, None)
+        sig = _stat(p)
+        if content is None or sig is None:
+            self._clean.pop(p, None)
+        else:
+            self._clean[p] = (sig, content)
+
+    def _remember(self, p: Path) -> None:
+        for snap in self._snapshots:
+            if snap.covers(p) and p not in snap.undo:
+                snap.undo[p] = self.read(p)
+
+    def external_write(self, p: Path) -> None:
+        """调用方即将绕过覆盖层直接写盘（如流式写入）：记录快照原内容并丢弃该路径的缓存。"""
+        with self._lock:
+            self._remember(p)
+            self.stats["writes"] += 1
+            self._dirty.pop(p, None)
+            self._clean.pop(p, None)
+
+    def evict(self, root: Path) -> None:
+        """丢弃 root（文件或目录）下已落盘内容的读缓存，用于删除临时文件之后。"""
+        with self._lock:
+            for p in [p for p in self._clean if p == root or root in p.parents]:
+                del self._clean[p]
+
+    def snapshot(self, paths: Optional[Iterable[Path]] = None) -> Snapshot:
+        with self._lock:
+            snap = Snapshot(paths)
+            self._snapshots.append(snap)
+            return snap
+
+    def rollback(self, snap: Snapshot) -> None:
+        with self._lock:
+            self._release(snap)
+            for p, content in snap.undo.items():
+                self._remember(p)
+                self._set(p, content)
+
+    def commit(self, snap: Snapshot) -> None:
+        with self._lock:
+            self._release(snap)
+            self.flush(snap.undo)
+
+    def _release(self, snap: Snapshot) -> None:
+        if snap in self._snapshots:
+            self._snapshots.remove(snap)
+
+    def flush(self, paths: Optional[Iterable[Path]] = None) -> int:
+        with self._lock:
+            targets = list(self._dirty) if paths is None else [p for p in paths if p in self._dirty]
+            for p in targets:
+                content = self._dirty.pop(p)
+                try:
+                    _replace_on_disk(p, content)
+                except OSError as e:
+                    self._dirty[p] = content
+                    error(f"落盘失败：{p}（{e}）")
+                    raise
+                sig = _stat(p)
+                if content is not None and sig is not None:
+                    self._clean[p] = (sig, content)
+                else:
+                    self._clean.pop(p, None)
+            self.stats["flushed"] += len(targets)
+            return len(targets)
+
+
+_overlay: Optional[Overlay] = None
+_overlay_lock = threading.Lock()
+
+
+def _get_overlay() -> Overlay:
+    """进程级共享的覆盖层，首次读写文件时才按配置创建。"""
+    global _overlay
+    if _overlay is None:
+        with _overlay_lock:
+            if _overlay is None:
+                overlay = Overlay(write_back=config.get_runtime().fs_write_back)
+                atexit.register(overlay.flush)
+                _overlay = overlay
+    return _overlay
+
+
 def write_file(path: str, content: str, overwrite: bool = True) -> str:
-    if not runtime.allow_write:
+    if not config.get_runtime().allow_write:
         warn(f"写入被禁用：{path}")
         return "write_disabled"
     p = resolve_path(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    if p.exists() and not overwrite:
+    if not overwrite and _get_overlay().exists(p):
         warn(f"文件已存在且不覆盖：{p}")
         return "skipped"
-    p.write_text(content, encoding="utf-8")
+    _get_overlay().write(p, content)
     info(f"写入文件: {p}")
     return str(p)
 
 
+@contextmanager
+def atomic_writer(path: str) -> Iterator[IO[str]]:
+    """
+    先写入同目录的临时文件，正常退出时原子替换到目标路径；异常时删除临时文件，目标保持原样。
+    写入被禁用时返回一个丢弃内容的内存缓冲。
+    """
+    if not config.get_runtime().allow_write:
+        warn(f"写入被禁用：{path}")
+        yield io.StringIO()
+        return
+    p = resolve_path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yield f
+        _get_overlay().external_write(p)
+        os.replace(tmp, p)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    info(f"写入文件: {p}")
+
+
 def read_file(path: str) -> Optional[str]:
     p = resolve_path(path)
-    if not p.exists():
+    content = _get_overlay().read(p)
+    if content is None:
         warn(f"文件不存在：{p}")
-        return None
-    return p.read_text(encoding="utf-8", errors="ignore")
+    return content
+
+
+def exists(path: str) -> bool:
+    return _get_overlay().exists(resolve_path(path))
+
+
+def signature(path: str) -> Tuple:
+    return _get_overlay().signature(resolve_path(path))
+
+
+def flush() -> int:
+    """把覆盖层中尚未落盘的写入原子写入磁盘；执行外部命令前必须调用。"""
+    return _get_overlay().flush()
+
+
+def evict(path: str) -> None:
+    """丢弃 path（文件或目录）下的读缓存。"""
+    _get_overlay().evict(resolve_path(path))
+
+
+def snapshot(paths: Optional[Iterable[str]] = None) -> Snapshot:
+    """开始一次试写：之后对 paths（默认全部路径）的写入可以 rollback。"""
+    return _get_overlay().snapshot(None if paths is None else [resolve_path(p) for p in paths])
+
+
+def rollback(snap: Snapshot) -> None:
+    _get_overlay().rollback(snap)
+
+
+def commit(snap: Snapshot) -> None:
+    """保留快照之后的写入并立即落盘。"""
+    _get_overlay().commit(snap)
+
+
+@contextmanager
+def branch(paths: Optional[Iterable[str]] = None) -> Iterator[Snapshot]:
+    """快照上下文：正常退出时提交，异常时回滚。"""
+    snap = snapshot(paths)
+    try:
+        yield snap
+    except BaseException:
+        rollback(snap)
+        raise
+    commit(snap)
+
+
+def stats() -> Dict[str, int]:
+    return dict(_get_overlay().stats)
 
 
 def make_dirs(path: str):
@@ -42,4 +313,3 @@ def make_dirs(path: str):
     p.mkdir(parents=True, exist_ok=True)
     info(f"创建目录: {p}")
     return str(p)
-
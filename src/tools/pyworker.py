@@ -0,0 +1,185 @@
+from __future__ import annotations
+import io
+import os
+import sys
+import queue
+import runpy
+import shlex
+import atexit
+import threading
+import traceback
+import multiprocessing as mp
+from contextlib import redirect_stdout, redirect_stderr
+from typing import List, Optional, Sequence, Tuple
+from ..core import config
+from ..core.logger import info, warn
+
+_PYTHON_LAUNCHERS = ("python", "python3", "py")
+
+
+def parse_python_command(command: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    识别 `python script.py args...` / `py -3.12 script.py ...` 形式的命令，返回 (script, args)。
+    带其它解释器参数（-m/-c/-u 等）或不是 .py 脚本的命令返回 None，交由子进程执行。
+    """
+    try:
+        argv = shlex.split(command, posix=os.name != "nt")
+    except ValueError:
+        return None
+    if not argv or argv[0].lower() not in _PYTHON_LAUNCHERS:
+        return None
+    rest = argv[1:]
+    # Windows 的 py 启动器允许 -3 / -3.12 选择版本
+    if argv[0].lower() == "py" and rest and rest[0].startswith("-3"):
+        rest = rest[1:]
+    if not rest or not rest[0].endswith(".py"):
+        return None
+    return rest[0], rest[1:]
+
+
+def _run_job(script: str, args: List[str], cwd: Optional[str],
+             base_modules: set, base_path: List[str], base_cwd: str,
+             base_argv: List[str]) -> Tuple[int, str, str]:
+    out, err = io.StringIO(), io.StringIO()
+    code = 0
+    try:
+        if cwd:
+            os.chdir(cwd)
+        script_path = os.path.abspath(script)
+        sys.argv = [script_path] + list(args)
+        sys.path.insert(0, os.path.dirname(script_path))
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                runpy.run_path(script_path, run_name="__main__")
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    code = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    code = 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+    finally:
+        # 还原解释器状态，保证下一个脚本在干净的模块命名空间中运行
+        for name in [m for m in sys.modules if m not in base_modules]:
+            del sys.modules[name]
+        sys.path[:] = base_path
+        sys.argv = list(base_argv)
+        os.chdir(base_cwd)
+    return code, out.getvalue(), err.getvalue()
+
+
+def _worker_main(conn, preload: Sequence[str]) -> None:
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+    base_modules = set(sys.modules)
+    base_path = list(sys.path)
+    base_cwd = os.getcwd()
+    base_argv = list(sys.argv)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        script, args, cwd = job
+        conn.send(_run_job(script, args, cwd, base_modules, base_path, base_cwd, base_argv))
+
+
+class _Worker:
+    def __init__(self, ctx, preload: Sequence[str]):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, list(preload)), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.proc.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, EOFError):
+                pass
+        self.proc.join(timeout=1)
+        self.conn.close()
+
+
+class PyWorkerPool:
+    """
+    预先启动并导入常用依赖的 Python 工作进程池，用于执行生成脚本：
+    - 每个脚本在干净的模块命名空间中以 __main__ 运行，stdout/stderr 被捕获
+    - 超时的工作进程会被杀掉并替换
+    - 非 Python 脚本命令由调用方回退到子进程执行
+    """
+
+    def __init__(self, size: int, preload: Sequence[str]):
+        self.size = max(1, size)
+        self.preload = list(preload)
+        self._ctx = mp.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(_Worker(self._ctx, self.preload))
+            self._started = True
+            info(f"已启动 {self.size} 个预热 Python 工作进程（预加载：{', '.join(self.preload) or '无'}）")
+
+    def run(self, command: str, cwd: Optional[str] = None, timeout: int = 180) -> Optional[Tuple[int, str, str]]:
+        parsed = parse_python_command(command)
+        if parsed is None:
+            return None
+        self._ensure_started()
+        script, args = parsed
+        worker = self._idle.get()
+        try:
+            worker.conn.send((script, args, cwd))
+            if not worker.conn.poll(timeout):
+                warn(f"预热工作进程执行超时，已重启：{command}")
+                worker.stop(kill=True)
+                worker = _Worker(self._ctx, self.preload)
+                return 124, "", "timeout"
+            return worker.conn.recv()
+        except (OSError, EOFError) as e:
+            warn(f"预热工作进程异常退出，已重启：{e}")
+            worker.stop(kill=True)
+            worker = _Worker(self._ctx, self.preload)
+            return 1, "", f"worker crashed: {e}"
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            while not self._idle.empty():
+                self._idle.get_nowait().stop()
+            self._started = False
+
+
+_pool: Optional[PyWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[PyWorkerPool]:
+    """PY_WORKERS>0 时返回进程级共享的工作进程池，否则返回 None。"""
+    global _pool
+    runtime = config.get_runtime()
+    if runtime.py_workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            preload = [m.strip() for m in runtime.py_worker_preload.split(",") if m.strip()]
+            _pool = PyWorkerPool(runtime.py_workers, preload)
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -1,8 +1,9 @@
 from __future__ import annotations
 import subprocess
 from typing import Optional, Tuple
-from ..core.config import runtime
+from ..core import config
 from ..core.logger import info, warn, error
+from . import fs, pyworker
 
 # 仅允许安全前缀命令，拒绝 npm/npx/yarn/pnpm/git/curl/wget 等
 _ALLOWED_PREFIXES = (
@@ -21,13 +22,22 @@ def _allowed(command: str) -> bool:
 
 
 def run(command: str, cwd: Optional[str] = None, timeout: int = 180) -> tuple[int, str, str]:
-    if not runtime.allow_shell:
+    if not config.get_runtime().allow_shell:
         warn(f"Shell 执行被禁用：{command}")
         return 0, "", ""
     if not _allowed(command):
         warn(f"Shell 命令不在白名单内，已拒绝：{command}")
         return 0, "", "blocked"
     info(f"执行命令: {command}")
+    # 外部进程只能看到磁盘，先把覆盖层中的写入落盘
+    fs.flush()
+    pool = pyworker.get_pool()
+    if pool is not None:
+        result = pool.run(command, cwd=cwd, timeout=timeout)
+        if result is not None:
+            if result[0] != 0:
+                warn(f"命令退出码 {result[0]}\nSTDERR: {result[2][:500]}")
+            return result
     try:
         proc = subprocess.run(command, shell=True, cwd=cwd, capture_output=True, text=True, timeout=timeout)
         if proc.returncode != 0:
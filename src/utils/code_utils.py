@@ -0,0 +1,162 @@
+from __future__ import annotations
+import ast
+import json
+import re
+from typing import Dict, List, Tuple
+
+
+class FenceStripper:
+    """
+    增量去除 markdown 代码围栏（```lang ... ```）。
+    逐片段 feed() 流式输出，只在整行到达后才判断是否为围栏行；
+    仅当首个非空行是开围栏时才视为围栏模式，遇到闭合围栏后丢弃其后的所有内容（多为解释文字）。
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+        self._fenced = False
+        self._closed = False
+
+    def _line(self, line: str) -> str:
+        if self._closed:
+            return ""
+        stripped = line.strip()
+        if not self._started:
+            if not stripped:
+                return ""
+            self._started = True
+            if stripped.startswith("```"):
+                self._fenced = True
+                return ""
+        elif self._fenced and stripped == "```":
+            self._closed = True
+            return ""
+        return line
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        out: List[str] = []
+        while True:
+            nl = self._pending.find("\n")
+            if nl < 0:
+                break
+            line, self._pending = self._pending[:nl + 1], self._pending[nl + 1:]
+            out.append(self._line(line))
+        return "".join(out)
+
+    def finish(self) -> str:
+        rest, self._pending = self._pending, ""
+        return self._line(rest) if rest else ""
+
+
+def strip_fences(text: str) -> str:
+    stripper = FenceStripper()
+    return stripper.feed(text) + stripper.finish()
+
+
+_SEARCH = "<<<<<<< SEARCH"
+_DIVIDER = "======="
+_REPLACE = ">>>>>>> REPLACE"
+
+
+def parse_edit_blocks(text: str) -> List[Tuple[str, str]]:
+    """
+    解析 search/replace 编辑块：
+        <<<<<<< SEARCH
+        原文（需与文件内容逐字一致）
+        =======
+        替换内容
+        >>>>>>> REPLACE
+    返回 [(search, replace), ...]；格式不完整的块会引发 ValueError。
+    """
+    blocks: List[Tuple[str, str]] = []
+    lines = text.splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != _SEARCH:
+            i += 1
+            continue
+        i += 1
+        search: List[str] = []
+        while i < len(lines) and lines[i].strip() != _DIVIDER:
+            search.append(lines[i])
+            i += 1
+        i += 1
+        replace: List[str] = []
+        while i < len(lines) and lines[i].strip() != _REPLACE:
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise ValueError("Unterminated search/replace block.")
+        i += 1
+        blocks.append(("".join(search), "".join(replace)))
+    return blocks
+
+
+def _locate_loose(content: str, search: str) -> Tuple[int, int] | None:
+    # 精确匹配失败时，按行忽略行尾空白再匹配一次
+    want = [ln.rstrip() for ln in search.splitlines()]
+    have = content.splitlines(keepends=True)
+    hits = [
+        i for i in range(len(have) - len(want) + 1)
+        if [ln.rstrip() for ln in have[i:i + len(want)]] == want
+    ]
+    if len(hits) != 1:
+        return None
+    start = sum(len(ln) for ln in have[:hits[0]])
+    end = start + sum(len(ln) for ln in have[hits[0]:hits[0] + len(want)])
+    return start, end
+
+
+def apply_edit_blocks(content: str, blocks: List[Tuple[str, str]]) -> str:
+    """
+    依次应用编辑块。每个 SEARCH 必须在当前内容中唯一出现；空 SEARCH 仅允许用于空文件（整体写入）。
+    任一块无法应用时抛出 ValueError，调用方据此回退到整文件重写。
+    """
+    for n, (search, replace) in enumerate(blocks, 1):
+        if not search.strip():
+            if content.strip():
+                raise ValueError(f"Edit block {n}: empty SEARCH on a non-empty file.")
+            content = replace
+            continue
+        count = content.count(search)
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise ValueError(f"Edit block {n}: SEARCH text matches {count} times.")
+        span = _locate_loose(content, search)
+        if span is None:
+            raise ValueError(f"Edit block {n}: SEARCH text not found.")
+        content = content[:span[0]] + replace + content[span[1]:]
+    return content
+
+
+def validate_source(path: str, content: str) -> str | None:
+    """对可本地校验的文件类型做语法检查，返回错误描述；无问题时返回 None。"""
+    if path.endswith(".py"):
+        try:
+            ast.parse(content, filename=path)
+        except SyntaxError as e:
+            return f"SyntaxError: {e.msg} on line {e.lineno}"
+    elif path.endswith(".json"):
+        try:
+            json.loads(content)
+        except json.JSONDecodeError as e:
+            return f"JSONDecodeError: {e}"
+    return None
+
+
+_RE_FILE_BLOCK = re.compile(r"^=== FILE: `?(.+?)`? ===[ \t]*\n(.*?)^=== END FILE ===[ \t]*$", re.MULTILINE | re.DOTALL)
+
+
+def parse_multi_file(text: str) -> Dict[str, str]:
+    """
+    解析多文件输出：
+        === FILE: path ===
+        ...代码...
+        === END FILE ===
+    返回 {path: content}，各文件内容会去除 markdown 围栏。
+    """
+    return {m.group(1).strip(): strip_fences(m.group(2)) for m in _RE_FILE_BLOCK.finditer(text)}
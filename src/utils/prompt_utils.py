@@ -0,0 +1,127 @@
+from __future__ import annotations
+import ast
+import os
+import re
+from typing import Iterable, List, Set, Tuple
+from ..core.metrics import estimate_tokens
+
+
+def fit_budget(text: str, max_tokens: int, marker: str = "\n... [truncated {n} chars] ...\n") -> str:
+    """超出 token 预算时保留头尾、截去中间部分。max_tokens<=0 表示不限制。"""
+    limit = max_tokens * 4
+    if max_tokens <= 0 or len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    tail = limit - head
+    cut = len(text) - head - tail
+    return text[:head] + marker.format(n=cut) + text[-tail:]
+
+
+_RE_INTERESTING = re.compile(r"Traceback|Error|Exception|Assertion|line \d+|^\s*File \"|^> ", re.IGNORECASE)
+
+
+def compact_error_log(log: str, max_lines: int = 80, context: int = 2) -> str:
+    """
+    压缩错误日志：
+    - 连续重复行折叠为一行并注明次数
+    - 只保留报错相关行（Traceback/Error/File "..." line N 等）及其前后 context 行，外加开头几行与结尾几行
+    - 最终不超过 max_lines 行，优先保留靠后的（最终异常所在的）部分
+    """
+    runs: List[List] = []
+    for line in log.splitlines():
+        if runs and runs[-1][0] == line:
+            runs[-1][1] += 1
+        else:
+            runs.append([line, 1])
+    lines = [line if n == 1 else f"{line}  (repeated {n} times)" for line, n in runs]
+    if len(lines) <= max_lines:
+        return "\n".join(lines)
+
+    keep: Set[int] = set(range(min(3, len(lines)))) | set(range(max(0, len(lines) - 5), len(lines)))
+    for i, line in enumerate(lines):
+        if _RE_INTERESTING.search(line):
+            keep.update(range(max(0, i - context), min(len(lines), i + context + 1)))
+    kept = sorted(keep)
+    if len(kept) > max_lines:
+        kept = kept[:3] + kept[-(max_lines - 3):]
+
+    out: List[str] = []
+    prev = -1
+    for i in kept:
+        if i != prev + 1:
+            out.append(f"... [{i - prev - 1} lines omitted] ...")
+        out.append(lines[i])
+        prev = i
+    if prev != len(lines) - 1:
+        out.append(f"... [{len(lines) - 1 - prev} lines omitted] ...")
+    return "\n".join(out)
+
+
+def error_lines_for(log: str, path: str) -> List[int]:
+    """从错误日志中提取指向 path 的行号（Traceback 的 File "...", line N 以及 'on line N'）。"""
+    name = re.escape(os.path.basename(path))
+    nums = [int(n) for n in re.findall(rf'File "[^"]*{name}", line (\d+)', log)]
+    nums += [int(n) for n in re.findall(r"\bon line (\d+)", log)]
+    return sorted(set(nums))
+
+
+def python_context(source: str, lines: Iterable[int], context: int = 3) -> str | None:
+    """
+    提取 Python 源码中与报错相关的片段：import 语句、所有顶层函数/类的签名，
+    以及包含报错行的整个函数（或报错行附近 context 行）。保留原文（可用于编辑块的 SEARCH），
+    省略部分以注释标注。源码无法解析时返回 None。
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    src_lines = source.splitlines()
+    wanted = set(lines)
+    keep: Set[int] = set()
+
+    for node in tree.body:
+        start = getattr(node, "lineno", 1)
+        end = getattr(node, "end_lineno", start) or start
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            keep.update(range(start, end + 1))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first = min([start] + [d.lineno for d in node.decorator_list])
+            body_start = node.body[0].lineno if node.body else end
+            keep.update(range(first, body_start))
+            if any(start <= n <= end for n in wanted):
+                keep.update(range(first, end + 1))
+        elif isinstance(node, ast.If) and "__main__" in (ast.get_source_segment(source, node.test) or ""):
+            keep.update(range(start, end + 1))
+    for n in wanted:
+        keep.update(range(max(1, n - context), min(len(src_lines), n + context) + 1))
+
+    out: List[str] = []
+    prev = 0
+    for n in sorted(k for k in keep if 1 <= k <= len(src_lines)):
+        if n != prev + 1:
+            out.append(f"# ... [lines {prev + 1}-{n - 1} omitted] ...")
+        out.append(src_lines[n - 1])
+        prev = n
+    if prev < len(src_lines):
+        out.append(f"# ... [lines {prev + 1}-{len(src_lines)} omitted] ...")
+    return "\n".join(out)
+
+
+def compact_fix_inputs(goal: str, path: str, content: str, error: str, budget: int,
+                       max_log_lines: int = 80, allow_excerpt: bool = False) -> Tuple[str, str, str]:
+    """
+    为 Fixer 组装受 token 预算约束的 (goal, content, error)：
+    - 错误日志去重并截取报错附近内容
+    - 目标文本最多占预算的 1/4
+    - allow_excerpt（编辑块模式）且 Python 文件超过预算一半时，只发送相关 AST 片段
+    - 剩余预算留给错误日志（至少 500 tokens）
+    """
+    error = compact_error_log(error, max_lines=max_log_lines)
+    if budget <= 0:
+        return goal, content, error
+    goal = fit_budget(goal, budget // 4)
+    if allow_excerpt and path.endswith(".py") and estimate_tokens(content) > budget // 2:
+        content = python_context(content, error_lines_for(error, path)) or content
+    remaining = budget - estimate_tokens(goal) - estimate_tokens(content)
+    error = fit_budget(error, max(500, remaining))
+    return goal, content, error